@@ -0,0 +1,339 @@
+"""Synthetic event-storm benchmark for the filesystem handlers.
+
+Builds a file tree, then replays create, modify, move and folder-move
+storms straight into the engine's ``ProtectionHandler``, configured as
+``file_restrictor``, ``restricti`` and ``delete_after`` configure it, with
+the clipboard faked.
+For each handler and storm it reports events/s, p50/p99 decision latency,
+peak memory and how many enforcements were missed or wrong.
+
+Run from the repository root, for example:
+
+    python -m benchmarks.bench_handlers --files 10000,100000 --burst 100,1000
+"""
+from __future__ import annotations
+
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import argparse
+import tempfile
+import tracemalloc
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from watchdog.events import (
+    DirMovedEvent, FileCreatedEvent, FileModifiedEvent, FileMovedEvent,
+    generate_sub_moved_events,
+)
+
+from protection.clipboard import ClipboardService, FakeClipboardBackend
+from protection.copy_tracker import CopyTracker
+from protection.enforcement import EnforcementQueue
+from protection.engine import ProtectionHandler
+from protection.policy import PathPolicy
+from protection.provenance import ProvenanceIndex
+
+TARGETS: Tuple[str, ...] = ("file_restrictor", "restricti", "delete_after")
+SCENARIOS: Tuple[str, ...] = ("paste", "unrelated", "modify", "move", "tree")
+FILES_PER_DIR: int = 100
+
+# Expected outcome per (target, scenario): "removed", "kept", "restored" or None
+# when the handler does not enforce that case
+EXPECTED: Dict[Tuple[str, str], Optional[str]] = {
+    ("file_restrictor", "paste"): "removed",
+    ("file_restrictor", "unrelated"): "kept",
+    ("file_restrictor", "modify"): "kept",
+    ("file_restrictor", "move"): "restored",
+    ("file_restrictor", "tree"): "restored",
+    ("restricti", "paste"): "removed",
+    ("restricti", "unrelated"): "kept",
+    ("restricti", "modify"): "kept",
+    ("restricti", "move"): "restored",
+    ("restricti", "tree"): "restored",
+    ("delete_after", "paste"): "removed",
+    ("delete_after", "unrelated"): "kept",
+    ("delete_after", "modify"): "kept",
+    ("delete_after", "move"): None,
+    ("delete_after", "tree"): None,
+}
+
+
+class Result(NamedTuple):
+    target: str
+    scenario: str
+    files: int
+    burst: int
+    events: int
+    events_per_sec: float
+    p50_ms: float
+    p99_ms: float
+    peak_mib: float
+    missed: int
+    incorrect: int
+
+
+class Target(NamedTuple):
+    handler: object
+    enforcement: EnforcementQueue
+    clipboard: Optional[FakeClipboardBackend]
+    copies: Optional[CopyTracker] = None
+
+
+def build_tree(base: str, count: int) -> Tuple[str, List[str]]:
+    """Create a protected root holding count small files."""
+    root = os.path.join(base, "root")
+    files = []
+    for i in range(count):
+        directory = os.path.join(root, f"d{i // (FILES_PER_DIR * FILES_PER_DIR)}", f"d{i // FILES_PER_DIR}")
+        if i % FILES_PER_DIR == 0:
+            os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"file_{i}.txt")
+        with open(path, "w") as handle:
+            handle.write(f"protected file {i}\n" * 8)
+        files.append(path)
+    return root, files
+
+
+def make_target(name: str, root: str, provenance: ProvenanceIndex, workers: int) -> Target:
+    """Build the handler a script would run, pointed at the benchmark root."""
+    module = __import__(name)
+    config = module.engine_config()._replace(
+        roots=(root,), allowed_dirs=(), exclude_patterns=(), warn_on_block=False,
+        # Blocked files are quarantined next to the tree, not in the user's profile
+        quarantine_dir=os.path.join(os.path.dirname(root), "quarantine"),
+    )
+    policy = PathPolicy(config.roots)
+    enforcement = EnforcementQueue(workers)
+    backend = clipboard = None
+    if config.clipboard_guard:
+        backend = FakeClipboardBackend()
+        clipboard = ClipboardService(backend, policy)
+    if not config.check_pastes:
+        handler = ProtectionHandler(config, policy, None, clipboard, enforcement)
+        return Target(handler, enforcement, backend)
+    # Benchmark files are written before the storm, so they settle at once
+    copies = CopyTracker(provenance, lambda path: handler.block_paste(path),
+                         settle_time=0.0, check_interval=0.01)
+    handler = ProtectionHandler(config, policy, provenance, clipboard, enforcement, copies)
+    return Target(handler, enforcement, backend, copies)
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def prepare(scenario: str, root_files: List[str], root: str, outside: str,
+            count: int, provenance: ProvenanceIndex) -> List[Tuple[object, str, str]]:
+    """Create the files for a storm; return (event, checked path, original path)."""
+    os.makedirs(outside, exist_ok=True)
+    events = []
+    if scenario == "paste":
+        for i in range(count):
+            source = root_files[i % len(root_files)]
+            # Keep the basename so name matching applies as for a real paste
+            dest = os.path.join(outside, str(i), os.path.basename(source))
+            os.makedirs(os.path.dirname(dest), exist_ok=True)
+            shutil.copyfile(source, dest)
+            events.append((FileCreatedEvent(dest), dest, source))
+    elif scenario in ("unrelated", "modify"):
+        for i in range(count):
+            dest = os.path.join(outside, f"new_{i}.txt")
+            with open(dest, "w") as handle:
+                handle.write(f"unrelated file {i}\n")
+            event_type = FileCreatedEvent if scenario == "unrelated" else FileModifiedEvent
+            events.append((event_type(dest), dest, ""))
+    elif scenario == "move":
+        staging = os.path.join(root, "_moves")
+        os.makedirs(staging, exist_ok=True)
+        for i in range(count):
+            source = os.path.join(staging, f"moved_{i}.txt")
+            with open(source, "w") as handle:
+                handle.write(f"moved file {i}\n")
+            provenance.add(source)
+            dest = os.path.join(outside, f"moved_{i}.txt")
+            os.rename(source, dest)
+            events.append((FileMovedEvent(source, dest), dest, source))
+    elif scenario == "tree":
+        # One folder moved out whole: the folder event, then one per child
+        source = os.path.join(root, "_tree", os.path.basename(outside))
+        for i in range(count):
+            path = os.path.join(source, str(i // FILES_PER_DIR), f"tree_{i}.txt")
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "w") as handle:
+                handle.write(f"tree file {i}\n")
+            provenance.add(path)
+        dest = os.path.join(outside, "tree")
+        os.rename(source, dest)
+        events.append((DirMovedEvent(source, dest), dest, source))
+        for event in generate_sub_moved_events(source, dest):
+            events.append((event, event.dest_path, event.src_path))
+    return events
+
+
+def check(expected: Optional[str], events: List[Tuple[object, str, str]]) -> Tuple[int, int]:
+    """Count missed and incorrect enforcements once a storm has drained."""
+    missed = incorrect = 0
+    if expected is None:
+        return missed, incorrect
+    for _event, path, original in events:
+        exists = os.path.exists(path)
+        if expected == "removed" and exists:
+            missed += 1
+        elif expected == "kept" and not exists:
+            incorrect += 1
+        elif expected == "restored" and (exists or not os.path.exists(original)):
+            missed += 1
+    return missed, incorrect
+
+
+def replay(target: Target, events: List[Tuple[object, str, str]], burst: int,
+           rate: float, on_burst: Callable[[List[Tuple[object, str, str]]], None]) -> Tuple[float, List[float]]:
+    """Dispatch events in bursts at the given rate; return (elapsed, latencies)."""
+    latencies: List[float] = []
+    dispatch = target.handler.dispatch
+    start = time.perf_counter()
+    for offset in range(0, len(events), burst):
+        chunk = events[offset:offset + burst]
+        if rate > 0:
+            delay = start + offset / rate - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        on_burst(chunk)
+        for event, _path, _original in chunk:
+            began = time.perf_counter()
+            dispatch(event)
+            latencies.append(time.perf_counter() - began)
+    target.enforcement.stop()
+    if target.copies is not None:
+        target.copies.drain()
+        target.copies.stop()
+    return time.perf_counter() - start, latencies
+
+
+def peak_rss_mib() -> float:
+    try:
+        import resource
+    except ImportError:
+        return 0.0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in KiB on Linux and bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def run(files: int, bursts: List[int], events: int, rate: float, workers: int,
+        targets: List[str], scenarios: List[str], trace_memory: bool,
+        workdir: Optional[str]) -> List[Result]:
+    base = tempfile.mkdtemp(prefix="bench_handlers_", dir=workdir)
+    results = []
+    try:
+        began = time.perf_counter()
+        root, root_files = build_tree(base, files)
+        print(f"Built {files} files in {time.perf_counter() - began:.1f}s", file=sys.stderr)
+
+        began = time.perf_counter()
+        provenance = ProvenanceIndex(root)
+        provenance.build()
+        print(f"Indexed root in {time.perf_counter() - began:.1f}s", file=sys.stderr)
+
+        count = min(events, files)
+        devnull = open(os.devnull, "w")
+        for burst in bursts:
+            for name in targets:
+                for scenario in scenarios:
+                    outside = os.path.join(base, "outside", f"{name}_{scenario}_{burst}")
+                    storm = prepare(scenario, root_files, root, outside, count, provenance)
+                    target = make_target(name, root, provenance, workers)
+
+                    def on_burst(chunk, target=target, scenario=scenario):
+                        # A paste puts the copied files on the clipboard first
+                        if target.clipboard is not None and scenario == "paste":
+                            target.clipboard.set_files([original for _e, _p, original in chunk])
+
+                    if trace_memory:
+                        tracemalloc.start()
+                    stdout, sys.stdout = sys.stdout, devnull
+                    try:
+                        elapsed, latencies = replay(target, storm, burst, rate, on_burst)
+                    finally:
+                        sys.stdout = stdout
+                    if trace_memory:
+                        peak = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+                        tracemalloc.stop()
+                    else:
+                        peak = peak_rss_mib()
+
+                    missed, incorrect = check(EXPECTED[(name, scenario)], storm)
+                    result = Result(
+                        name, scenario, files, burst, len(storm),
+                        len(storm) / elapsed if elapsed else 0.0,
+                        percentile(latencies, 0.50) * 1000,
+                        percentile(latencies, 0.99) * 1000,
+                        peak, missed, incorrect,
+                    )
+                    results.append(result)
+                    print_result(result)
+                    shutil.rmtree(outside, ignore_errors=True)
+        devnull.close()
+    finally:
+        shutil.rmtree(base, ignore_errors=True)
+    return results
+
+
+HEADER = (f"{'target':<16} {'scenario':<10} {'files':>8} {'burst':>6} {'events':>7} "
+          f"{'events/s':>10} {'p50 ms':>8} {'p99 ms':>8} {'peak MiB':>9} {'missed':>7} {'wrong':>6}")
+
+
+def print_result(result: Result) -> None:
+    print(f"{result.target:<16} {result.scenario:<10} {result.files:>8} {result.burst:>6} "
+          f"{result.events:>7} {result.events_per_sec:>10.0f} {result.p50_ms:>8.3f} "
+          f"{result.p99_ms:>8.3f} {result.peak_mib:>9.1f} {result.missed:>7} {result.incorrect:>6}",
+          flush=True)
+
+
+def int_list(text: str) -> List[int]:
+    return [int(part) for part in text.split(",") if part]
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--files", type=int_list, default=[10_000],
+                        help="comma-separated tree sizes (default 10000)")
+    parser.add_argument("--burst", type=int_list, default=[1000],
+                        help="comma-separated events per burst (default 1000)")
+    parser.add_argument("--events", type=int, default=2000,
+                        help="events per storm, capped at the tree size (default 2000)")
+    parser.add_argument("--rate", type=float, default=0.0,
+                        help="target events per second, 0 for unthrottled (default 0)")
+    parser.add_argument("--workers", type=int, default=0,
+                        help="enforcement workers; 0 runs enforcement inline so latency "
+                             "covers the whole decision (default 0)")
+    parser.add_argument("--targets", default=",".join(TARGETS))
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="report tracemalloc peak instead of process peak RSS (slower)")
+    parser.add_argument("--workdir", help="directory for the generated trees")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args(argv)
+
+    logging.disable(logging.INFO)  # the handlers log every enforcement
+    print(HEADER)
+    results: List[Result] = []
+    for files in args.files:
+        results.extend(run(
+            files, args.burst, args.events, args.rate, args.workers,
+            args.targets.split(","), args.scenarios.split(","),
+            args.trace_memory, args.workdir,
+        ))
+    if args.json:
+        with open(args.json, "w") as handle:
+            json.dump([result._asdict() for result in results], handle, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""Startup benchmark for the engine.
+
+Measures, each in a fresh interpreter, how long ``import protection.engine``
+takes and which heavy modules it pulls in, then how long the engine takes
+from launch until the roots are protected and until the provenance index
+is complete, on a generated tree.
+
+Run from the repository root, for example:
+
+    python -m benchmarks.bench_startup --files 10000 --backend fake --runs 5
+"""
+from __future__ import annotations
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+from typing import Dict, List, Optional, Tuple
+
+# Modules a fast import must leave for the code paths that need them
+HEAVY_MODULES: Tuple[str, ...] = (
+    "watchdog", "pyperclip", "win32clipboard", "win32gui", "keyboard",
+    "http.server", "logging.handlers", "concurrent.futures",
+)
+FILES_PER_DIR: int = 100
+
+IMPORT_PROBE = """
+import sys, time
+began = time.perf_counter()
+import protection.engine
+elapsed = time.perf_counter() - began
+heavy = [name for name in {heavy!r} if name in sys.modules]
+print(elapsed, ",".join(heavy) or "-")
+"""
+
+STARTUP_PROBE = """
+import sys, time
+launched = float(sys.argv[1])
+from protection.engine import Engine, EngineConfig
+from protection.backends import load_backend
+config = EngineConfig(
+    roots=(sys.argv[2],), paste_destinations=(sys.argv[3],), backend=sys.argv[4],
+    require_privileges=False, clipboard_guard=False, snapshot_path=sys.argv[5],
+    quarantine_dir=sys.argv[3] + "_quarantine",
+)
+engine = Engine(config, load_backend(config.backend))
+engine.start()
+protected = time.time() - launched
+engine.wait_indexed()
+indexed = time.time() - launched
+engine.stop()
+print(protected, engine.startup_seconds, indexed)
+"""
+
+
+def build_tree(base: str, count: int) -> str:
+    """Create a protected root holding count small files."""
+    root = os.path.join(base, "root")
+    for i in range(count):
+        directory = os.path.join(root, f"d{i // FILES_PER_DIR}")
+        if i % FILES_PER_DIR == 0:
+            os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, f"file_{i}.txt"), "w") as handle:
+            handle.write(f"protected file {i}\n" * 8)
+    return root
+
+
+def python(code: str, *args: str) -> str:
+    result = subprocess.run([sys.executable, "-c", code, *args], capture_output=True,
+                            text=True, check=True, cwd=os.getcwd())
+    return result.stdout.strip().splitlines()[-1]
+
+
+def measure_import(runs: int) -> Tuple[List[float], List[str]]:
+    times, heavy = [], set()
+    for _ in range(runs):
+        elapsed, loaded = python(IMPORT_PROBE.format(heavy=HEAVY_MODULES)).split(" ")
+        times.append(float(elapsed))
+        heavy.update(name for name in loaded.split(",") if name != "-")
+    return times, sorted(heavy)
+
+
+def measure_startup(root: str, outside: str, backend: str, snapshot: str) -> Tuple[float, float, float]:
+    protected, startup, indexed = python(STARTUP_PROBE, repr(time.time()), root, outside,
+                                         backend, snapshot).split(" ")
+    return float(protected), float(startup), float(indexed)
+
+
+def median(values: List[float]) -> float:
+    ordered = sorted(values)
+    return ordered[len(ordered) // 2] if ordered else 0.0
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--files", type=int, default=10_000, help="files in the root (default 10000)")
+    parser.add_argument("--runs", type=int, default=5, help="runs per measurement (default 5)")
+    parser.add_argument("--backend", default="fake", help="backend to start (default fake)")
+    parser.add_argument("--workdir", help="directory for the generated tree")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args(argv)
+
+    results: Dict[str, object] = {}
+    times, heavy = measure_import(args.runs)
+    results["import_ms"] = median(times) * 1000
+    results["heavy_modules"] = heavy
+    print(f"import protection.engine: {results['import_ms']:.1f} ms median of {args.runs}; "
+          f"heavy modules loaded: {', '.join(heavy) or 'none'}")
+
+    base = tempfile.mkdtemp(prefix="bench_startup_", dir=args.workdir)
+    try:
+        began = time.perf_counter()
+        root = build_tree(base, args.files)
+        outside = os.path.join(base, "outside")
+        os.makedirs(outside)
+        print(f"Built {args.files} files in {time.perf_counter() - began:.1f}s", file=sys.stderr)
+        snapshot = os.path.join(base, "index.snap")
+        # Cold runs scan the whole tree; warm runs load the snapshot the last run saved
+        for label, path in (("cold", ""), ("warm", snapshot)):
+            runs = [measure_startup(root, outside, args.backend, path) for _ in range(args.runs)]
+            if label == "warm":
+                runs = runs[1:] or runs  # the first run only writes the snapshot
+            protected = median([run[0] for run in runs]) * 1000
+            startup = median([run[1] for run in runs]) * 1000
+            indexed = median([run[2] for run in runs]) * 1000
+            results[label] = {"launch_to_protected_ms": protected, "engine_start_ms": startup,
+                              "launch_to_indexed_ms": indexed}
+            print(f"{label}: launch to protected {protected:.1f} ms (Engine.start {startup:.1f} ms), "
+                  f"launch to fully indexed {indexed:.1f} ms")
+    finally:
+        shutil.rmtree(base, ignore_errors=True)
+    if args.json:
+        with open(args.json, "w") as handle:
+            json.dump(results, handle, indent=2)
+
+
+if __name__ == "__main__":
+    main()
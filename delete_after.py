@@ -1,102 +1,73 @@
-import os  #required for OS operations
-import pyperclip  #required for clipboard operations monitoring
-import time #inside python already may not require installation
-from watchdog.observers import Observer    # required for monitoring folders and show the output
-from watchdog.events import FileSystemEventHandler
+import logging  # shows what the engine does, blocked pastes included
+from protection.engine import EngineConfig, LOG_FORMAT, run  # the watcher shared by every script
+from protection.snapshot import default_snapshot_path  # index saved between runs
+from protection.quarantine import ACTION_QUARANTINE  # keeps blocked files recoverable
+from protection.watch_plan import default_destinations
+
+logger = logging.getLogger(__name__)
 
 # Define the root directory to monitor
 ROOT_DIR = r"D:\Projects" #change according to your root directory
-MONITORED_DRIVE = r"D:\\"  # Entire your drive to monitor , in this case its D:
-
-class FileHandler(FileSystemEventHandler):
-    def on_modified(self, event):
-        if not event.is_directory:
-            self.handle_file_operation(event.src_path)
-
-    def on_created(self, event):
-        if not event.is_directory:
-            self.handle_file_operation(event.src_path)
-
-    def handle_file_operation(self, src_path):
-        """Monitor file operations."""
-        print(f"File operation detected: {src_path}")
-        
-        # Check if the file operation is within ROOT_DIR
-        if os.path.commonpath([src_path, ROOT_DIR]) == ROOT_DIR:
-            print(f"File operation within root directory: {src_path}")
-        else:
-            print(f"File operation outside root directory: {src_path}")
-            self.check_pasted_file(src_path)
-
-    def check_pasted_file(self, src_path):
-        """Check if the pasted file is from ROOT_DIR and delete it if necessary."""
-        # Check if the file is pasted outside ROOT_DIR
-        if os.path.commonpath([src_path, ROOT_DIR]) != ROOT_DIR:
-            # Check if the file exists within ROOT_DIR (i.e., it was copied from ROOT_DIR)
-            if self.is_file_from_root(src_path):
-                print(f"File pasted outside ROOT_DIR: {src_path}")
-                print(f"Deleting the pasted file: {src_path}")
-                try:
-                    os.remove(src_path)  # Delete the file
-                    print(f"File deleted successfully: {src_path}")
-                except Exception as e:
-                    print(f"Error deleting file {src_path}: {e}")
-            else:
-                print(f"File is not from ROOT_DIR, skipping delete: {src_path}")
-
-    def is_file_from_root(self, file_path):
-        """Check if the file is from ROOT_DIR."""
-        try:
-            # Check if the file exists in ROOT_DIR by matching the filename
-            for root, dirs, files in os.walk(ROOT_DIR):
-                if os.path.basename(file_path) in files:
-                    return True
-            return False
-        except Exception as e:
-            print(f"Error checking if file is from ROOT_DIR: {e}")
-            return False
-
-def monitor_clipboard():
-    """Monitor clipboard content for copy-paste operations."""
-    previous_clipboard = ""
-    while True:
-        try:
-            current_clipboard = pyperclip.paste()
-            if current_clipboard != previous_clipboard:
-                previous_clipboard = current_clipboard
-                # Check if the clipboard content is a valid file path
-                if os.path.exists(current_clipboard):
-                    # Check if the path is from ROOT_DIR
-                    if os.path.commonpath([current_clipboard, ROOT_DIR]) == ROOT_DIR:
-                        print("Clipboard contains a path from the root directory!")
-                    else:
-                        # If pasting outside ROOT_DIR, warn and clear clipboard
-                        print("Warning: You are attempting to paste a file path from ROOT_DIR to an external location.")
-                        print("Clearing clipboard to prevent pasting outside ROOT_DIR.")
-                        pyperclip.copy("")  # Clear clipboard content
-                else:
-                    print("Clipboard does not contain a valid file path.")
-        except Exception as e:
-            print(f"Error accessing clipboard: {e}")
-        time.sleep(1)
-
-def monitor_directory():
-    """Monitor directory for file modifications or creations."""
-    event_handler = FileHandler()
-    observer = Observer()
-    observer.schedule(event_handler, path=MONITORED_DRIVE, recursive=True)  # Monitor entire D drive
-    observer.start()
+PASTE_DESTINATIONS = default_destinations()  # folders where pasted files are checked, add r"D:\\" to watch the whole drive
+PROTECTED_ROOTS = [ROOT_DIR]  # add more roots here if needed
+EVENT_DEDUP_TTL = 5.0  # seconds a repeated event for an unchanged file is ignored
+ENFORCEMENT_WORKERS = 4  # threads that check and delete pasted files
+ENFORCEMENT_QUEUE_SIZE = 10000  # pending checks before new work runs inline
+COPY_SETTLE_TIME = 1.0  # seconds a pasted file must stop changing before it is deleted
+MOVE_BATCH_TTL = 10.0  # seconds a moved folder keeps swallowing events for its contents
+BLOCKED_FILE_ACTION = ACTION_QUARANTINE  # or "delete" to remove pasted files for good
+QUARANTINE_DIR = ""  # default location outside the roots; list and restore with: python -m protection.quarantine
+METRICS_PORT = None  # set e.g. 9464 to serve Prometheus metrics on http://127.0.0.1:9464/metrics
+METRICS_JSON_PATH = ""  # or a file path to write metrics to every 10 seconds
+AUDIT_LOG_PATH = ""  # JSONL audit file, query it with: python -m protection.audit <file>
+VERBOSE = False  # print every file event, slows things down when many files change at once
+SNAPSHOT_PATH = default_snapshot_path("delete_after")  # set to "" to rebuild the index at every start
+SNAPSHOT_INTERVAL = 300  # seconds between snapshots while files under ROOT_DIR change
+SCAN_THREADS = 8  # folders listed at once by the startup scan of ROOT_DIR
+SCAN_MAX_MB_PER_SECOND = 0  # limit disk reads of that scan, e.g. 20 on a busy machine; 0 = no limit
+SIMILARITY_THRESHOLD = 0.5  # also delete renamed copies and copies sharing this much content; 0 = match names only
+CLIPBOARD_GUARD = False  # also clear ROOT_DIR files from the clipboard outside Explorer
+BACKEND = ""  # "win32", "linux" or "fake"; empty picks the one for this platform
+CONFIG_PATH = ""  # JSON file with roots and other settings to use instead, reloaded when it changes
+SHARDS = 0  # worker processes, one per watched drive (0 = watch everything in this process)
+TRACE_PATH = ""  # record what the engine sees to this file, to replay it later
+TRUSTED_WRITERS = []  # programs whose copies are never deleted, e.g. ["rsync"]; Linux only, as root
 
-    try:
-        # Run clipboard monitoring alongside directory monitoring
-        monitor_clipboard()
-    except KeyboardInterrupt:
-        observer.stop()
-    observer.join()
+def engine_config():
+    """Settings for the shared engine (protection.engine); moves out of ROOT_DIR are not undone."""
+    return EngineConfig(
+        roots=tuple(PROTECTED_ROOTS),
+        paste_destinations=tuple(PASTE_DESTINATIONS),
+        backend=BACKEND,
+        require_privileges=False,
+        check_pastes=True,
+        clipboard_guard=CLIPBOARD_GUARD,
+        restore_moves=False,
+        dedup_ttl=EVENT_DEDUP_TTL,
+        workers=ENFORCEMENT_WORKERS,
+        queue_size=ENFORCEMENT_QUEUE_SIZE,
+        copy_settle_time=COPY_SETTLE_TIME,
+        move_batch_ttl=MOVE_BATCH_TTL,
+        blocked_action=BLOCKED_FILE_ACTION,
+        quarantine_dir=QUARANTINE_DIR,
+        snapshot_path=SNAPSHOT_PATH,
+        snapshot_interval=SNAPSHOT_INTERVAL,
+        scan_walkers=SCAN_THREADS,
+        scan_mb_per_second=SCAN_MAX_MB_PER_SECOND,
+        similarity_threshold=SIMILARITY_THRESHOLD,
+        metrics_port=METRICS_PORT,
+        metrics_json_path=METRICS_JSON_PATH,
+        audit_log_path=AUDIT_LOG_PATH,
+        config_path=CONFIG_PATH,
+        shards=SHARDS,
+        trace_path=TRACE_PATH,
+        trusted_writers=tuple(TRUSTED_WRITERS),
+    )
 
 def main():
-    print("Monitoring file operations and clipboard...")
-    monitor_directory()
+    logging.basicConfig(level=logging.DEBUG if VERBOSE else logging.INFO, format=LOG_FORMAT)
+    logger.info("Monitoring file operations and clipboard...")
+    run(engine_config())
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1 @@
+"""Shared protection components used by the monitoring scripts."""
@@ -0,0 +1,4 @@
+from protection.engine import main
+
+if __name__ == "__main__":
+    main()
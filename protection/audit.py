@@ -0,0 +1,387 @@
+"""Structured audit trail of enforcement decisions.
+
+Every decision is one compact JSON line. Records are buffered in memory and
+written in batches by a background thread, so a burst of events never waits
+on disk or console I/O. The log rotates by size and age, and
+``python -m protection.audit LOG`` filters it by path, action and time range
+while reading one line at a time.
+"""
+from __future__ import annotations
+
+import os
+import re
+import sys
+import glob
+import json
+import time
+import queue
+import fnmatch
+import logging
+import argparse
+import threading
+from collections import deque
+from typing import TYPE_CHECKING, Any, Callable, Deque, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from protection.metrics import METRICS
+
+if TYPE_CHECKING:
+    from logging.handlers import QueueListener
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_BYTES: int = 64 * 1024 * 1024
+DEFAULT_MAX_AGE: float = 24 * 3600.0
+DEFAULT_BACKUPS: int = 20
+DEFAULT_BUFFER_SIZE: int = 10_000
+DEFAULT_FLUSH_INTERVAL: float = 1.0
+
+# Rotated files are named <stem>.<time the file was started><ext>
+ROTATED_TIME_FORMAT: str = "%Y%m%d-%H%M%S"
+
+
+class AuditLog:
+    """Buffered JSONL writer for enforcement decisions.
+
+    ``record`` only appends to a bounded in-memory buffer; when the buffer
+    is full, new records are dropped and counted instead of blocking the
+    caller. A writer thread wakes when a batch is ready or every flush
+    interval, writes everything buffered with one call, and rotates the file
+    once it exceeds max_bytes or is older than max_age. Only the newest
+    ``backups`` rotated files are kept.
+
+    Recording is a no-op until ``start`` is called.
+    """
+
+    def __init__(self) -> None:
+        self.enabled: bool = False
+        self.path: str = ""
+        self.max_bytes: int = DEFAULT_MAX_BYTES
+        self.max_age: float = DEFAULT_MAX_AGE
+        self.backups: int = DEFAULT_BACKUPS
+        self.buffer_size: int = DEFAULT_BUFFER_SIZE
+        self.flush_interval: float = DEFAULT_FLUSH_INTERVAL
+        self.written: int = 0
+        self.dropped: int = 0
+        self._buffer: Deque[Dict[str, Any]] = deque()
+        self._ready = threading.Condition()
+        self._stopping = False
+        self._thread: Optional[threading.Thread] = None
+        self._file = None
+        self._size = 0
+        self._opened_at = 0.0
+        self._send: Optional[Callable[[List[Dict[str, Any]]], Any]] = None
+
+    def record(self, action: str, path: str, **fields: Any) -> None:
+        """Queue one decision; never blocks on I/O."""
+        if not self.enabled:
+            return
+        entry: Dict[str, Any] = {"ts": round(time.time(), 6), "action": action, "path": path}
+        entry.update(fields)
+        with self._ready:
+            if len(self._buffer) >= self.buffer_size:
+                self.dropped += 1
+                METRICS.incr("audit_records_dropped_total")
+                return
+            self._buffer.append(entry)
+            if len(self._buffer) >= self.buffer_size // 2:
+                self._ready.notify()
+
+    def add_entries(self, entries: Iterable[Dict[str, Any]]) -> None:
+        """Queue records made elsewhere, e.g. by a shard process, as they are."""
+        if not self.enabled:
+            return
+        with self._ready:
+            for entry in entries:
+                if len(self._buffer) >= self.buffer_size:
+                    self.dropped += 1
+                    METRICS.incr("audit_records_dropped_total")
+                    continue
+                self._buffer.append(entry)
+            self._ready.notify()
+
+    def start(
+        self,
+        path: str,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        max_age: float = DEFAULT_MAX_AGE,
+        backups: int = DEFAULT_BACKUPS,
+        buffer_size: int = DEFAULT_BUFFER_SIZE,
+        flush_interval: float = DEFAULT_FLUSH_INTERVAL,
+    ) -> None:
+        self.path = os.path.abspath(path)
+        self.max_bytes, self.max_age, self.backups = max_bytes, max_age, backups
+        self.buffer_size, self.flush_interval = buffer_size, flush_interval
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._open()
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name="audit-writer", daemon=True)
+        self._thread.start()
+        self.enabled = True
+
+    def forward(self, send: Callable[[List[Dict[str, Any]]], Any],
+                flush_interval: float = DEFAULT_FLUSH_INTERVAL) -> None:
+        """Buffer records as usual, but pass each batch to send instead of a file.
+
+        Shard processes use this to hand their records to the supervisor,
+        which writes the one log.
+        """
+        self.path = ""
+        self.flush_interval = flush_interval
+        self._send = send
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name="audit-forwarder", daemon=True)
+        self._thread.start()
+        self.enabled = True
+
+    def stop(self) -> None:
+        """Write everything still buffered and close the log."""
+        if self._thread is None:
+            return
+        self.enabled = False
+        with self._ready:
+            self._stopping = True
+            self._ready.notify()
+        self._thread.join()
+        self._thread = None
+        self._send = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _run(self) -> None:
+        while True:
+            with self._ready:
+                if not self._buffer and not self._stopping:
+                    self._ready.wait(self.flush_interval)
+                batch, self._buffer = self._buffer, deque()
+                stopping = self._stopping
+            if batch:
+                self._write(batch)
+            if stopping:
+                return
+
+    def _write(self, batch: Deque[Dict[str, Any]]) -> None:
+        if self._send is not None:
+            try:
+                self._send(list(batch))
+            except Exception as e:
+                logger.error("Error forwarding audit records: %s", str(e))
+            return
+        data = "".join(
+            json.dumps(entry, separators=(",", ":"), default=str) + "\n" for entry in batch
+        ).encode("utf-8")
+        try:
+            if self._size and (
+                self._size + len(data) > self.max_bytes
+                or time.time() - self._opened_at > self.max_age
+            ):
+                self._rotate()
+            self._file.write(data)
+            self._file.flush()
+            self._size += len(data)
+            self.written += len(batch)
+            METRICS.incr("audit_records_written_total", value=len(batch))
+        except (OSError, ValueError) as e:
+            logger.error("Error writing audit log %s: %s", self.path, str(e))
+
+    def _open(self) -> None:
+        self._opened_at = time.time()
+        try:
+            # An existing log is as old as its first record
+            with open(self.path, encoding="utf-8") as existing:
+                self._opened_at = float(json.loads(existing.readline())["ts"])
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+        self._file = open(self.path, "ab")
+        self._size = self._file.tell()
+
+    def _rotate(self) -> None:
+        self._file.close()
+        stem, ext = os.path.splitext(self.path)
+        started = time.strftime(ROTATED_TIME_FORMAT, time.localtime(self._opened_at))
+        # Several rotations within one second are numbered in order
+        counters = [counter for when, counter, _name in _rotated(self.path) if when == started]
+        target = f"{stem}.{started}{ext}"
+        if counters:
+            target = f"{stem}.{started}-{max(counters) + 1}{ext}"
+        os.replace(self.path, target)
+        for old in rotated_logs(self.path)[:-self.backups or None]:
+            try:
+                os.remove(old)
+            except OSError:
+                pass
+        self._file = open(self.path, "ab")
+        self._size = 0
+        self._opened_at = time.time()
+
+
+AUDIT = AuditLog()
+
+
+def start_audit(path: Optional[str], **options: Any) -> List[AuditLog]:
+    """Start AUDIT if a path is configured; return it in a list for stopping."""
+    if not path:
+        return []
+    AUDIT.start(path, **options)
+    logger.info("Writing audit log to %s", AUDIT.path)
+    return [AUDIT]
+
+
+def start_queue_logging() -> QueueListener:
+    """Move the root logger's handlers onto a background thread.
+
+    Callers then only pay for putting a record on a queue; formatting and
+    console or file output happen on the listener thread. Stop the returned
+    listener to flush what is left.
+    """
+    from logging.handlers import QueueHandler, QueueListener
+    root = logging.getLogger()
+    records: "queue.Queue[logging.LogRecord]" = queue.Queue()
+    listener = QueueListener(records, *root.handlers, respect_handler_level=True)
+    root.handlers = [QueueHandler(records)]
+    listener.start()
+    return listener
+
+
+def _rotated(path: str) -> List[Tuple[str, int, str]]:
+    """Return (start time, counter, file name) of each rotated file, oldest first."""
+    stem, ext = os.path.splitext(os.path.abspath(path))
+    pattern = re.compile(re.escape(stem) + r"\.(\d{8}-\d{6})(?:-(\d+))?" + re.escape(ext) + "$")
+    found = []
+    for name in glob.glob(glob.escape(stem) + ".*" + ext):
+        match = pattern.match(name)
+        if match:
+            found.append((match.group(1), int(match.group(2) or 0), name))
+    return sorted(found)
+
+
+def rotated_logs(path: str) -> List[str]:
+    """Return the rotated files of a log, oldest first."""
+    return [name for _started, _counter, name in _rotated(path)]
+
+
+def _started(path: str) -> Optional[float]:
+    match = re.search(r"\.(\d{8}-\d{6})(?:-\d+)?\.[^.]*$", path)
+    if match is None:
+        return None
+    return time.mktime(time.strptime(match.group(1), ROTATED_TIME_FORMAT))
+
+
+def log_files(path: str, since: Optional[float] = None,
+              until: Optional[float] = None) -> List[str]:
+    """Return the files of a log, oldest first, skipping those outside a time range."""
+    files = rotated_logs(path)
+    if os.path.exists(path):
+        files.append(os.path.abspath(path))
+    starts = [_started(f) for f in files]
+    selected = []
+    for i, name in enumerate(files):
+        started = starts[i]
+        # A file ends where the next one starts
+        ended = starts[i + 1] if i + 1 < len(files) else None
+        if until is not None and started is not None and started > until:
+            continue
+        if since is not None and ended is not None and ended < since:
+            continue
+        selected.append(name)
+    return selected
+
+
+def query(
+    path: str,
+    path_pattern: Optional[str] = None,
+    actions: Optional[List[str]] = None,
+    since: Optional[float] = None,
+    until: Optional[float] = None,
+) -> Iterator[Dict[str, Any]]:
+    """Yield matching records from a log and its rotated files, oldest first.
+
+    Files are read line by line, and lines are screened with a substring
+    test before any are parsed, so queries over large logs use constant
+    memory.
+    """
+    action_keys = [f'"action":{json.dumps(a)}' for a in actions or ()]
+    fold = os.path.normcase("A") == "a"
+    path_re = None
+    literal = None
+    if path_pattern:
+        path_re = re.compile(fnmatch.translate(path_pattern), re.IGNORECASE if fold else 0)
+        # The longest run without wildcards must appear in any matching line
+        literal = max(re.split(r"[*?\[\]]", path_pattern), key=len)
+        literal = json.dumps(literal)[1:-1] or None
+        if literal is not None and fold:
+            literal = literal.lower()
+    for name in log_files(path, since, until):
+        try:
+            handle = open(name, encoding="utf-8", errors="replace")
+        except OSError:
+            continue
+        with handle:
+            for line in handle:
+                if action_keys and not any(key in line for key in action_keys):
+                    continue
+                if literal is not None and literal not in (line.lower() if fold else line):
+                    continue
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                ts = entry.get("ts", 0)
+                if since is not None and ts < since:
+                    continue
+                if until is not None and ts > until:
+                    continue
+                if path_re is not None and not path_re.match(str(entry.get("path", ""))):
+                    continue
+                yield entry
+
+
+def parse_time(text: str, now: Optional[float] = None) -> float:
+    """Parse "30m", "2h", "1d" (ago), an ISO date/time or a Unix timestamp."""
+    now = time.time() if now is None else now
+    match = re.fullmatch(r"(\d+(?:\.\d+)?)([smhd])", text.strip())
+    if match:
+        scale = {"s": 1, "m": 60, "h": 3600, "d": 86400}[match.group(2)]
+        return now - float(match.group(1)) * scale
+    try:
+        return float(text)
+    except ValueError:
+        pass
+    from datetime import datetime
+    return datetime.fromisoformat(text).timestamp()
+
+
+def format_entry(entry: Dict[str, Any]) -> str:
+    when = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(entry.get("ts", 0)))
+    extra = " ".join(f"{k}={v}" for k, v in entry.items() if k not in ("ts", "action", "path"))
+    return f"{when}  {entry.get('action', ''):<12} {entry.get('path', '')}  {extra}".rstrip()
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Query an audit log and its rotated files.")
+    parser.add_argument("log", help="path of the active audit log")
+    parser.add_argument("--path", help="glob the recorded path must match, e.g. '*\\\\secret\\\\*'")
+    parser.add_argument("--action", action="append", help="only this action; may be repeated")
+    parser.add_argument("--since", help="start of the range: 30m, 2h, 1d, ISO time or timestamp")
+    parser.add_argument("--until", help="end of the range, in the same forms")
+    parser.add_argument("--limit", type=int, default=0, help="stop after this many records")
+    parser.add_argument("--json", action="store_true", help="print records as JSON lines")
+    args = parser.parse_args(argv)
+
+    since = parse_time(args.since) if args.since else None
+    until = parse_time(args.until) if args.until else None
+    shown = 0
+    try:
+        for entry in query(args.log, args.path, args.action, since, until):
+            print(json.dumps(entry, separators=(",", ":")) if args.json else format_entry(entry))
+            shown += 1
+            if args.limit and shown >= args.limit:
+                break
+    except BrokenPipeError:
+        sys.stderr.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""Platform access for the engine, one module per platform.
+
+A backend supplies the clipboard, foreground window, process details,
+hotkeys, clipboard notifications, privilege check, warning dialogs and
+filesystem watcher.
+Importing this package imports no platform library: ``load_backend``
+imports only the module it is asked for, and each backend imports its own
+libraries the first time they are used.
+"""
+from __future__ import annotations
+
+import os
+import importlib
+from typing import TYPE_CHECKING, Any, Callable, Dict, Optional
+
+if TYPE_CHECKING:
+    from protection.clipboard import ClipboardBackend
+    from protection.foreground import ForegroundBackend
+    from protection.processes import ProcessProvider
+    from protection.triggers import TriggerDispatcher
+
+BACKENDS: Dict[str, str] = {
+    "win32": "protection.backends.win32",
+    "linux": "protection.backends.linux",
+    "fake": "protection.backends.fake",
+}
+
+
+class Backend:
+    """Everything the engine needs from the platform."""
+
+    name: str = ""
+
+    def clipboard(self) -> ClipboardBackend:
+        raise NotImplementedError
+
+    def foreground(self) -> ForegroundBackend:
+        raise NotImplementedError
+
+    def processes(self) -> Optional[ProcessProvider]:
+        """Return process details, or None to judge the foreground by window titles only."""
+        return None
+
+    def hotkeys(self, dispatcher: TriggerDispatcher) -> Optional[Any]:
+        """Return a started-on-demand hotkey trigger, or None if there are no hotkeys."""
+        return None
+
+    def clipboard_listener(self, callback: Callable[[], Any]) -> Optional[Any]:
+        """Return a clipboard change listener, or None to poll the clipboard instead."""
+        return None
+
+    def check_privileges(self) -> Optional[str]:
+        """Return why the engine cannot run with the current privileges, or None."""
+        return None
+
+    def warn(self, title: str, message: str) -> None:
+        """Tell the user an operation was blocked."""
+
+    def observer(self) -> Any:
+        """Return a new watchdog-style observer (schedule, start, stop, join)."""
+        raise NotImplementedError
+
+
+def default_backend_name() -> str:
+    return "win32" if os.name == "nt" else "linux"
+
+
+def load_backend(name: Optional[str] = None) -> Backend:
+    """Import and create a backend by name, the platform's own by default."""
+    name = name or default_backend_name()
+    try:
+        module = importlib.import_module(BACKENDS[name])
+    except KeyError:
+        raise ValueError(f"Unknown backend {name!r}; choose from {', '.join(BACKENDS)}") from None
+    return module.create_backend()
@@ -0,0 +1,159 @@
+from __future__ import annotations
+
+import os
+import threading
+from typing import Any, Callable, List, Optional, Tuple
+
+from protection.backends import Backend
+from protection.clipboard import FakeClipboardBackend
+from protection.foreground import FakeForegroundBackend
+from protection.processes import FakeProcessProvider
+from protection.triggers import TriggerDispatcher
+
+
+class FakeHotkeys:
+    """Hotkeys that are only pressed by calling press()."""
+
+    def __init__(self, dispatcher: TriggerDispatcher) -> None:
+        self.dispatcher = dispatcher
+        self.started = False
+
+    def start(self) -> None:
+        self.started = True
+
+    def stop(self) -> None:
+        self.started = False
+
+    def press(self, trigger: str) -> None:
+        if self.started:
+            self.dispatcher.dispatch(trigger)
+
+
+class FakeClipboardListener:
+    """Clipboard notifications that are only sent by calling notify()."""
+
+    def __init__(self, callback: Callable[[], Any]) -> None:
+        self.callback = callback
+        self.started = False
+
+    def start(self) -> None:
+        self.started = True
+
+    def stop(self) -> None:
+        self.started = False
+
+    def notify(self) -> None:
+        if self.started:
+            self.callback()
+
+
+def _watches(watched: str, recursive: bool, path: str) -> bool:
+    if path == watched or os.path.dirname(path) == watched:
+        return True
+    return recursive and path.startswith(watched.rstrip(os.sep) + os.sep)
+
+
+class FakeObserver:
+    """Observer that delivers only the events passed to emit(), on the caller's thread."""
+
+    def __init__(self) -> None:
+        self._watches: List[Tuple[Any, str, bool]] = []
+        self._lock = threading.Lock()
+        self.started = False
+
+    def schedule(self, handler: Any, path: str, recursive: bool = False) -> Tuple[Any, str, bool]:
+        watch = (handler, os.path.abspath(path), recursive)
+        with self._lock:
+            self._watches.append(watch)
+        return watch
+
+    def unschedule(self, watch: Tuple[Any, str, bool]) -> None:
+        with self._lock:
+            self._watches = [scheduled for scheduled in self._watches if scheduled is not watch]
+
+    @property
+    def watched(self) -> List[Tuple[str, bool]]:
+        """(path, recursive) of each scheduled watch."""
+        with self._lock:
+            return [(path, recursive) for _handler, path, recursive in self._watches]
+
+    def unschedule_all(self) -> None:
+        with self._lock:
+            self._watches.clear()
+
+    def start(self) -> None:
+        self.started = True
+
+    def stop(self) -> None:
+        self.started = False
+
+    def join(self, timeout: Optional[float] = None) -> None:
+        pass
+
+    def emit(self, event: Any) -> None:
+        """Deliver an event once to each handler watching either of its paths."""
+        paths = [os.path.abspath(p) for p in (event.src_path, getattr(event, "dest_path", "")) if p]
+        with self._lock:
+            watches = list(self._watches)
+        delivered = []
+        for handler, watched, recursive in watches:
+            if any(handler is done for done in delivered):
+                continue
+            if any(_watches(watched, recursive, path) for path in paths):
+                delivered.append(handler)
+                handler.dispatch(event)
+
+
+class FakeBackend(Backend):
+    """In-memory platform for tests and benchmarks; nothing is imported or hooked."""
+
+    name = "fake"
+
+    def __init__(self) -> None:
+        self.clipboard_backend = FakeClipboardBackend()
+        self.foreground_backend = FakeForegroundBackend()
+        self.process_provider = FakeProcessProvider()
+        self.privilege_error: Optional[str] = None
+        self.warnings: List[Tuple[str, str]] = []
+        self.observers: List[FakeObserver] = []
+        self.hotkey_triggers: List[FakeHotkeys] = []
+        self.listeners: List[FakeClipboardListener] = []
+
+    def clipboard(self) -> FakeClipboardBackend:
+        return self.clipboard_backend
+
+    def foreground(self) -> FakeForegroundBackend:
+        return self.foreground_backend
+
+    def processes(self) -> FakeProcessProvider:
+        return self.process_provider
+
+    def hotkeys(self, dispatcher: TriggerDispatcher) -> Optional[Any]:
+        hotkeys = FakeHotkeys(dispatcher)
+        self.hotkey_triggers.append(hotkeys)
+        return hotkeys
+
+    def clipboard_listener(self, callback: Callable[[], Any]) -> Optional[Any]:
+        listener = FakeClipboardListener(callback)
+        self.listeners.append(listener)
+        return listener
+
+    def check_privileges(self) -> Optional[str]:
+        return self.privilege_error
+
+    def warn(self, title: str, message: str) -> None:
+        self.warnings.append((title, message))
+
+    def observer(self) -> FakeObserver:
+        observer = FakeObserver()
+        self.observers.append(observer)
+        return observer
+
+    def emit(self, event: Any) -> None:
+        """Deliver an event through every observer created so far."""
+        for observer in self.observers:
+            observer.emit(event)
+
+
+def create_backend() -> Backend:
+    return FakeBackend()
@@ -0,0 +1,412 @@
+from __future__ import annotations
+
+import os
+import time
+import errno
+import select
+import shutil
+import struct
+import logging
+import threading
+import subprocess
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+from urllib.parse import unquote, urlparse
+
+from protection.backends import Backend
+from protection.clipboard import ClipboardBackend
+from protection.foreground import ForegroundBackend
+from protection.processes import ProcessInfo, ProcessProvider
+from protection.triggers import HotkeyTrigger, TriggerDispatcher
+
+logger = logging.getLogger(__name__)
+
+# Shortest time between two reads of the X or Wayland clipboard
+CLIPBOARD_REFRESH_INTERVAL: float = 0.25
+# Seconds between checks for stopping in the process-exit and fanotify threads
+STOP_CHECK_INTERVAL: float = 0.5
+
+# fanotify(7): notification class, mark flags and the events used
+FAN_CLOEXEC: int = 0x1
+FAN_MARK_ADD: int = 0x1
+FAN_MARK_REMOVE: int = 0x2
+FAN_MARK_MOUNT: int = 0x10
+FAN_MARK_IGNORED_MASK: int = 0x20
+FAN_MARK_IGNORED_SURV_MODIFY: int = 0x40
+FAN_MARK_FLUSH: int = 0x80
+FAN_MODIFY: int = 0x2
+FAN_CLOSE_WRITE: int = 0x8
+FAN_Q_OVERFLOW: int = 0x4000
+FANOTIFY_METADATA_VERSION: int = 3
+AT_FDCWD: int = -100
+# event_len, vers, reserved, metadata_len, mask, fd, pid
+_FAN_EVENT = struct.Struct("=IBBHQii")
+
+
+def parse_file_list(text: str) -> Optional[List[str]]:
+    """Return the paths in clipboard text that lists files, or None.
+
+    File managers put copied files on the text clipboard as file:// URIs or
+    plain absolute paths, one per line.
+    """
+    paths = []
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line in ("copy", "cut"):
+            continue
+        if line.startswith("file://"):
+            paths.append(unquote(urlparse(line).path))
+        elif os.path.isabs(line):
+            paths.append(line)
+        else:
+            return None
+    return paths or None
+
+
+class TextClipboardBackend(ClipboardBackend):
+    """Clipboard access through pyperclip (xclip, xsel or wl-clipboard).
+
+    There is no change counter on these clipboards, so the sequence number
+    is derived from the content, read at most once per refresh interval.
+    """
+
+    def __init__(self, refresh_interval: float = CLIPBOARD_REFRESH_INTERVAL) -> None:
+        import pyperclip
+        self._pyperclip = pyperclip
+        self.refresh_interval = refresh_interval
+        self._lock = threading.Lock()
+        self._sequence = 0
+        self._text = ""
+        self._checked = 0.0
+        self._failed = False
+
+    def sequence_number(self) -> int:
+        now = time.monotonic()
+        if now - self._checked < self.refresh_interval:
+            return self._sequence
+        with self._lock:
+            self._checked = now
+            try:
+                text = self._pyperclip.paste() or ""
+            except Exception as e:
+                if not self._failed:
+                    logger.warning("Clipboard unavailable: %s", str(e))
+                    self._failed = True
+                return self._sequence
+            self._failed = False
+            if text != self._text:
+                self._text = text
+                self._sequence += 1
+            return self._sequence
+
+    def read(self) -> Tuple[Optional[List[str]], Optional[str]]:
+        text = self._text
+        files = parse_file_list(text)
+        return (files, None) if files else (None, text or None)
+
+    def clear(self) -> None:
+        self._pyperclip.copy("")
+        with self._lock:
+            self._text = ""
+            self._sequence += 1
+
+
+class XForegroundBackend(ForegroundBackend):
+    """Foreground window title from xdotool, or "" where it is not installed."""
+
+    def __init__(self) -> None:
+        self._xdotool = shutil.which("xdotool")
+
+    def window_title(self) -> str:
+        if self._xdotool is None:
+            return ""
+        try:
+            result = subprocess.run(
+                [self._xdotool, "getactivewindow", "getwindowname"],
+                capture_output=True, text=True, timeout=1.0,
+            )
+        except (OSError, subprocess.TimeoutExpired):
+            return ""
+        return result.stdout.strip()
+
+    def process_id(self) -> Optional[int]:
+        if self._xdotool is None:
+            return None
+        try:
+            result = subprocess.run(
+                [self._xdotool, "getactivewindow", "getwindowpid"],
+                capture_output=True, text=True, timeout=1.0,
+            )
+            return int(result.stdout.strip()) or None
+        except (OSError, ValueError, subprocess.TimeoutExpired):
+            return None
+
+
+def read_proc_info(pid: int) -> Optional[ProcessInfo]:
+    """Return a process's details from /proc, or None if it has exited."""
+    try:
+        with open(f"/proc/{pid}/stat", "rb") as handle:
+            stat = handle.read().decode("utf-8", "replace")
+    except OSError:
+        return None
+    # The name is in parentheses and may itself contain spaces and parentheses
+    comm = stat[stat.index("(") + 1:stat.rindex(")")]
+    fields = stat[stat.rindex(")") + 2:].split()
+    try:
+        exe = os.readlink(f"/proc/{pid}/exe")
+    except OSError:
+        exe = ""  # another user's process, or a kernel thread
+    if exe.endswith(" (deleted)"):
+        exe = exe[:-len(" (deleted)")]
+    name = os.path.basename(exe) if exe else comm
+    return ProcessInfo(pid, int(fields[1]), name, exe, float(fields[19]))
+
+
+class _ExitWatcher:
+    """Calls back when watched processes exit, from one thread polling pidfds."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._pidfds: Dict[int, int] = {}
+        self._watched: Dict[int, Tuple[int, Callable[[int], Any]]] = {}
+        self._poll = select.poll()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def watch(self, pid: int, callback: Callable[[int], Any]) -> bool:
+        if not hasattr(os, "pidfd_open"):
+            return False
+        with self._lock:
+            if pid in self._pidfds:
+                self._watched[self._pidfds[pid]] = (pid, callback)
+                return True
+            try:
+                pidfd = os.pidfd_open(pid)
+            except OSError:
+                return False  # already gone, or a kernel before 5.3
+            self._pidfds[pid] = pidfd
+            self._watched[pidfd] = (pid, callback)
+            self._poll.register(pidfd, select.POLLIN)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="process-exits", daemon=True)
+                self._thread.start()
+        return True
+
+    def unwatch(self, pid: int) -> None:
+        with self._lock:
+            pidfd = self._pidfds.pop(pid, None)
+            if pidfd is not None:
+                self._forget(pidfd)
+
+    def stop(self) -> None:
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+        with self._lock:
+            for pidfd in list(self._watched):
+                self._forget(pidfd)
+            self._pidfds.clear()
+
+    def _forget(self, pidfd: int) -> None:
+        self._watched.pop(pidfd, None)
+        self._poll.unregister(pidfd)
+        os.close(pidfd)
+
+    def _run(self) -> None:
+        while not self._stopped.is_set():
+            for pidfd, flags in self._poll.poll(STOP_CHECK_INTERVAL * 1000):
+                if flags & select.POLLNVAL:
+                    continue  # closed by unwatch while this poll was running
+                with self._lock:
+                    watched = self._watched.get(pidfd)
+                    if watched is None:
+                        continue
+                    pid, callback = watched
+                    del self._pidfds[pid]
+                    self._forget(pidfd)
+                try:
+                    callback(pid)
+                except Exception as e:
+                    logger.error("Error handling exit of process %d: %s", pid, str(e))
+
+
+class FanotifyWriters:
+    """Reports which process writes each file under the watched paths.
+
+    fanotify reports the PID behind a write, but needs CAP_SYS_ADMIN;
+    without it start() returns False and no writers are known. Marks cannot
+    cover a directory tree, so whole mounts are marked, but each file costs
+    two events however much is written to it: its first write, after which
+    its writes are ignored, and its close, which ends that. The event's
+    descriptor is resolved to a path, and callback(path, pid) is called on
+    the fanotify thread for paths under the watched ones.
+    """
+
+    def __init__(self, callback: Callable[[str, int], Any]) -> None:
+        self.callback = callback
+        self._libc: Any = None
+        self._fd: Optional[int] = None
+        self._marked: set = set()
+        # Replaced whole, never changed, so the fanotify thread needs no lock
+        self._prefixes: Tuple[str, ...] = ()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="fanotify", daemon=True)
+
+    def start(self, paths: Iterable[str]) -> bool:
+        import ctypes
+        libc = ctypes.CDLL(None, use_errno=True)
+        if not hasattr(libc, "fanotify_init"):
+            return False
+        libc.fanotify_init.argtypes = [ctypes.c_uint, ctypes.c_uint]
+        libc.fanotify_mark.argtypes = [ctypes.c_int, ctypes.c_uint, ctypes.c_uint64, ctypes.c_int, ctypes.c_char_p]
+        fd = libc.fanotify_init(FAN_CLOEXEC, os.O_RDONLY | getattr(os, "O_LARGEFILE", 0))
+        if fd < 0:
+            logger.info("Writers of files are not known: fanotify needs root (%s)",
+                        errno.errorcode.get(ctypes.get_errno(), "error"))
+            return False
+        self._libc, self._fd = libc, fd
+        if not self.mark(paths):
+            os.close(fd)
+            self._fd = None
+            return False
+        self._thread.start()
+        return True
+
+    def mark(self, paths: Iterable[str]) -> bool:
+        """Watch writes under paths instead; False if none could be watched."""
+        watched = False
+        prefixes = []
+        for path in paths:
+            try:
+                device = os.stat(path).st_dev
+            except OSError:
+                continue
+            if device not in self._marked:
+                if self._libc.fanotify_mark(self._fd, FAN_MARK_ADD | FAN_MARK_MOUNT,
+                                            FAN_MODIFY | FAN_CLOSE_WRITE, AT_FDCWD, os.fsencode(path)):
+                    logger.warning("Cannot watch writes on the mount of %s", path)
+                    continue
+                self._marked.add(device)
+            prefixes.append(os.path.normcase(os.path.abspath(path)).rstrip(os.sep) + os.sep)
+            watched = True
+        self._prefixes = tuple(prefixes)
+        return watched
+
+    def stop(self) -> None:
+        self._stopped.set()
+        if self._thread.is_alive():
+            self._thread.join()
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def _run(self) -> None:
+        own = os.getpid()
+        while not self._stopped.is_set():
+            ready, _, _ = select.select([self._fd], [], [], STOP_CHECK_INTERVAL)
+            if not ready:
+                continue
+            try:
+                data = os.read(self._fd, 64 * 1024)
+            except OSError as e:
+                logger.error("Error reading fanotify events: %s", str(e))
+                return
+            offset = 0
+            while offset + _FAN_EVENT.size <= len(data):
+                length, version, _reserved, _size, mask, fd, pid = _FAN_EVENT.unpack_from(data, offset)
+                offset += max(length, _FAN_EVENT.size)
+                if version != FANOTIFY_METADATA_VERSION:
+                    continue
+                if mask & FAN_Q_OVERFLOW:
+                    # Closes were lost with the rest; stop ignoring writes to any file
+                    logger.warning("fanotify queue overflowed; some writers are not known")
+                    self._libc.fanotify_mark(self._fd, FAN_MARK_FLUSH, 0, AT_FDCWD, None)
+                if fd < 0:
+                    continue
+                try:
+                    self._handle(mask, fd, pid if pid != own else None)
+                finally:
+                    os.close(fd)
+
+    def _handle(self, mask: int, fd: int, pid: Optional[int]) -> None:
+        """Handle one event for the file open as fd; pid is None for writes of our own."""
+        if mask & FAN_MODIFY:
+            # The first write names the writer; the rest are ignored until it closes
+            self._libc.fanotify_mark(self._fd, FAN_MARK_ADD | FAN_MARK_IGNORED_MASK | FAN_MARK_IGNORED_SURV_MODIFY,
+                                     FAN_MODIFY, fd, None)
+            try:
+                path = os.readlink(f"/proc/self/fd/{fd}")
+            except OSError:
+                path = ""
+            if pid is not None and path and os.path.normcase(path).startswith(self._prefixes):
+                try:
+                    self.callback(path, pid)
+                except Exception as e:
+                    logger.error("Error noting the writer of %s: %s", path, str(e))
+        if mask & FAN_CLOSE_WRITE:
+            self._libc.fanotify_mark(self._fd, FAN_MARK_REMOVE | FAN_MARK_IGNORED_MASK, FAN_MODIFY, fd, None)
+
+
+class ProcProcessProvider(ProcessProvider):
+    """Process details from /proc, exits from pidfds and writers from fanotify."""
+
+    def __init__(self) -> None:
+        self._exits = _ExitWatcher()
+        self._writers: Optional[FanotifyWriters] = None
+
+    def info(self, pid: int) -> Optional[ProcessInfo]:
+        return read_proc_info(pid)
+
+    def watch_exit(self, pid: int, callback: Callable[[int], Any]) -> bool:
+        return self._exits.watch(pid, callback)
+
+    def unwatch_exit(self, pid: int) -> None:
+        self._exits.unwatch(pid)
+
+    def watch_writes(self, paths: Iterable[str], callback: Callable[[str, int], Any]) -> bool:
+        if self._writers is not None:
+            self._writers.callback = callback
+            return self._writers.mark(paths)
+        writers = FanotifyWriters(callback)
+        if not writers.start(paths):
+            return False
+        self._writers = writers
+        return True
+
+    def stop(self) -> None:
+        self._exits.stop()
+        if self._writers is not None:
+            self._writers.stop()
+
+
+class LinuxBackend(Backend):
+    """Linux access: inotify for watching, pyperclip for the clipboard.
+
+    Hotkeys need the keyboard package and root; without them the engine
+    polls the clipboard instead. No privileges are needed to watch files;
+    finding out which process wrote a file needs root (fanotify).
+    """
+
+    name = "linux"
+
+    def clipboard(self) -> ClipboardBackend:
+        return TextClipboardBackend()
+
+    def foreground(self) -> ForegroundBackend:
+        return XForegroundBackend()
+
+    def processes(self) -> Optional[ProcessProvider]:
+        return ProcProcessProvider()
+
+    def hotkeys(self, dispatcher: TriggerDispatcher) -> Optional[Any]:
+        return HotkeyTrigger(dispatcher)
+
+    def warn(self, title: str, message: str) -> None:
+        logger.warning("%s: %s", title, message)
+
+    def observer(self) -> Any:
+        from watchdog.observers.inotify import InotifyObserver
+        return InotifyObserver()
+
+
+def create_backend() -> Backend:
+    return LinuxBackend()
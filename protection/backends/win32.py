@@ -0,0 +1,72 @@
+from __future__ import annotations
+
+import logging
+import threading
+from typing import Any, Callable, Optional
+
+from protection.backends import Backend
+from protection.clipboard import ClipboardBackend, Win32ClipboardBackend
+from protection.foreground import ForegroundBackend, Win32ForegroundBackend
+from protection.processes import ProcessProvider, Win32ProcessProvider
+from protection.triggers import HotkeyTrigger, TriggerDispatcher, Win32ClipboardListener
+
+logger = logging.getLogger(__name__)
+
+MB_ICONWARNING: int = 0x30
+
+
+class Win32Backend(Backend):
+    """Windows access through pywin32 and keyboard, each imported on first use."""
+
+    name = "win32"
+
+    def __init__(self) -> None:
+        # Held while a warning is on screen
+        self._warning = threading.Lock()
+
+    def clipboard(self) -> ClipboardBackend:
+        return Win32ClipboardBackend()
+
+    def foreground(self) -> ForegroundBackend:
+        return Win32ForegroundBackend()
+
+    def processes(self) -> Optional[ProcessProvider]:
+        return Win32ProcessProvider()
+
+    def hotkeys(self, dispatcher: TriggerDispatcher) -> Optional[Any]:
+        return HotkeyTrigger(dispatcher)
+
+    def clipboard_listener(self, callback: Callable[[], Any]) -> Optional[Any]:
+        return Win32ClipboardListener(callback)
+
+    def check_privileges(self) -> Optional[str]:
+        from win32com.shell import shell
+        if not shell.IsUserAnAdmin():
+            return "Please run this script with administrator privileges"
+        return None
+
+    def warn(self, title: str, message: str) -> None:
+        """Show a message box on its own thread; the caller does not wait for OK.
+
+        While one warning is on screen, further ones are only logged.
+        """
+        if not self._warning.acquire(blocking=False):
+            logger.warning("%s: %s", title, message)
+            return
+        threading.Thread(target=self._show, args=(title, message), name="warning", daemon=True).start()
+
+    def _show(self, title: str, message: str) -> None:
+        import ctypes
+        try:
+            ctypes.windll.user32.MessageBoxW(None, message, title, MB_ICONWARNING)
+        finally:
+            self._warning.release()
+
+    def observer(self) -> Any:
+        # ReadDirectoryChangesW on Windows
+        from watchdog.observers import Observer
+        return Observer()
+
+
+def create_backend() -> Backend:
+    return Win32Backend()
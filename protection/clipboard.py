@@ -0,0 +1,181 @@
+from __future__ import annotations
+
+import os
+import logging
+import threading
+from typing import List, NamedTuple, Optional, Tuple
+
+from protection.metrics import METRICS
+from protection.policy import PathPolicy
+
+logger = logging.getLogger(__name__)
+
+
+class ClipboardSnapshot(NamedTuple):
+    """Parsed clipboard content for one clipboard sequence number."""
+    sequence: int
+    files: Tuple[str, ...]
+    protected_files: Tuple[str, ...]
+
+    @property
+    def has_protected(self) -> bool:
+        return bool(self.protected_files)
+
+
+EMPTY_SNAPSHOT = ClipboardSnapshot(-1, (), ())
+
+
+class ClipboardBackend:
+    """Platform access to the clipboard."""
+
+    def sequence_number(self) -> int:
+        """Return a number that changes whenever the clipboard content changes."""
+        raise NotImplementedError
+
+    def read(self) -> Tuple[Optional[List[str]], Optional[str]]:
+        """Return (dropped file list, unicode text); either may be None."""
+        raise NotImplementedError
+
+    def clear(self) -> None:
+        raise NotImplementedError
+
+
+class Win32ClipboardBackend(ClipboardBackend):
+    """Clipboard access through pywin32, imported on first use."""
+
+    def __init__(self) -> None:
+        import pythoncom
+        import win32clipboard
+        import win32con
+        self._pythoncom = pythoncom
+        self._clipboard = win32clipboard
+        self._con = win32con
+
+    def sequence_number(self) -> int:
+        return self._clipboard.GetClipboardSequenceNumber()
+
+    def read(self) -> Tuple[Optional[List[str]], Optional[str]]:
+        clipboard, con = self._clipboard, self._con
+        try:
+            self._pythoncom.CoInitialize()
+            clipboard.OpenClipboard()
+
+            if clipboard.IsClipboardFormatAvailable(con.CF_HDROP):
+                return list(clipboard.GetClipboardData(con.CF_HDROP)), None
+
+            if clipboard.IsClipboardFormatAvailable(con.CF_UNICODETEXT):
+                return None, clipboard.GetClipboardData(con.CF_UNICODETEXT)
+        finally:
+            try:
+                clipboard.CloseClipboard()
+            except Exception:
+                pass
+            self._pythoncom.CoUninitialize()
+        return None, None
+
+    def clear(self) -> None:
+        import pyperclip
+        self._clipboard.OpenClipboard()
+        self._clipboard.EmptyClipboard()
+        self._clipboard.CloseClipboard()
+        pyperclip.copy('')
+
+
+class FakeClipboardBackend(ClipboardBackend):
+    """In-memory clipboard for tests and benchmarks."""
+
+    def __init__(self) -> None:
+        self._sequence: int = 0
+        self._files: Optional[List[str]] = None
+        self._text: Optional[str] = None
+        self.reads: int = 0
+
+    def set_files(self, files: List[str]) -> None:
+        self._files, self._text = list(files), None
+        self._sequence += 1
+
+    def set_text(self, text: str) -> None:
+        self._files, self._text = None, text
+        self._sequence += 1
+
+    def sequence_number(self) -> int:
+        return self._sequence
+
+    def read(self) -> Tuple[Optional[List[str]], Optional[str]]:
+        self.reads += 1
+        return (list(self._files) if self._files is not None else None), self._text
+
+    def clear(self) -> None:
+        self._files, self._text = None, None
+        self._sequence += 1
+
+
+def is_file_content(content: str) -> bool:
+    try:
+        return os.path.exists(content) or '\r\n' in content
+    except Exception:
+        return False
+
+
+class ClipboardService:
+    """Single shared view of the clipboard.
+
+    The clipboard is only opened and parsed when its sequence number changes;
+    every other call returns the cached snapshot, so any number of consumers
+    can ask for the clipboard on every event without touching the system
+    clipboard again.
+    """
+
+    def __init__(self, backend: ClipboardBackend, policy: PathPolicy) -> None:
+        self.backend = backend
+        self.policy = policy
+        self._lock = threading.Lock()
+        self._snapshot: ClipboardSnapshot = EMPTY_SNAPSHOT
+        self.refreshes: int = 0
+
+    def snapshot(self) -> ClipboardSnapshot:
+        """Return the current snapshot, refreshing it if the clipboard changed."""
+        try:
+            sequence = self.backend.sequence_number()
+        except Exception as e:
+            logger.error("Error reading clipboard sequence: %s", str(e))
+            return self._snapshot
+        if sequence == self._snapshot.sequence:
+            return self._snapshot
+        with self._lock:
+            if sequence != self._snapshot.sequence:
+                self._snapshot = self._read(sequence)
+            return self._snapshot
+
+    def _read(self, sequence: int) -> ClipboardSnapshot:
+        self.refreshes += 1
+        METRICS.incr("clipboard_reads_total")
+        try:
+            with METRICS.timer("clipboard_read_seconds"):
+                file_list, text = self.backend.read()
+        except Exception as e:
+            logger.error("Error reading clipboard: %s", str(e))
+            return ClipboardSnapshot(sequence, (), ())
+        if file_list:
+            files = tuple(file_list)
+        elif text and is_file_content(text):
+            files = (text,)
+        else:
+            files = ()
+        return ClipboardSnapshot(sequence, files, tuple(self.policy.filter_protected(files)))
+
+    def set_policy(self, policy: PathPolicy) -> None:
+        """Judge the clipboard by a new policy from the next snapshot on."""
+        with self._lock:
+            self.policy = policy
+            # The cached snapshot was filtered by the old policy
+            self._snapshot = EMPTY_SNAPSHOT
+
+    def files(self) -> List[str]:
+        return list(self.snapshot().files)
+
+    def clear(self) -> None:
+        try:
+            self.backend.clear()
+        except Exception as e:
+            logger.error("Error clearing clipboard: %s", str(e))
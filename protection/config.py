@@ -0,0 +1,149 @@
+"""Engine settings read from a JSON file and reloaded when it changes.
+
+The file holds one object whose keys are ``EngineConfig`` field names;
+anything it leaves out keeps the value the entry point started with::
+
+    {
+        "roots": ["D:\\\\Projects", "D:\\\\Designs"],
+        "exclude_patterns": ["*.bak"],
+        "safe_windows": ["explorer", "root directory", "total commander"],
+        "clipboard_check_interval": 0.2
+    }
+
+``ConfigWatcher`` checks the file every few seconds and hands each new
+version to the engine, which swaps it in without stopping the observer.
+"""
+from __future__ import annotations
+
+import os
+import json
+import logging
+import threading
+from typing import TYPE_CHECKING, Any, Callable, Dict, Optional, Tuple
+
+from protection.metrics import METRICS
+
+if TYPE_CHECKING:
+    from protection.engine import EngineConfig
+
+logger = logging.getLogger(__name__)
+
+# Seconds between checks of the config file for changes
+DEFAULT_CHECK_INTERVAL: float = 2.0
+
+
+def _convert(name: str, value: Any, default: Any) -> Any:
+    """Check one value from the file against the type of the field it sets."""
+    if isinstance(default, tuple) or (default is None and isinstance(value, list)):
+        if not isinstance(value, list) or not all(isinstance(item, str) for item in value):
+            raise ValueError(f"{name} must be a list of strings")
+        return tuple(value)
+    if isinstance(default, bool):
+        if not isinstance(value, bool):
+            raise ValueError(f"{name} must be true or false")
+        return value
+    if isinstance(value, bool):
+        raise ValueError(f"{name} cannot be true or false")
+    if isinstance(default, float) and isinstance(value, (int, float)):
+        return float(value)
+    if default is None or isinstance(value, type(default)):
+        return value
+    raise ValueError(f"{name} must be a {type(default).__name__}")
+
+
+def parse_config(data: Any, base: EngineConfig) -> EngineConfig:
+    """Return base with the fields set in a decoded config object replaced."""
+    if not isinstance(data, dict):
+        raise ValueError("config must be a JSON object")
+    unknown = sorted(set(data) - set(base._fields))
+    if unknown:
+        raise ValueError(f"unknown setting(s): {', '.join(unknown)}")
+    values: Dict[str, Any] = {
+        name: _convert(name, value, getattr(base, name)) for name, value in data.items()
+    }
+    if "roots" in values:
+        if not values["roots"]:
+            raise ValueError("roots must not be empty")
+        values["roots"] = tuple(os.path.abspath(root) for root in values["roots"])
+    return base._replace(**values)
+
+
+def load_config(path: str, base: EngineConfig) -> EngineConfig:
+    """Read a config file on top of base; raise ValueError if it cannot be used."""
+    try:
+        with open(path, "r", encoding="utf-8") as handle:
+            data = json.load(handle)
+    except OSError as e:
+        raise ValueError(f"cannot read {path}: {e.strerror or e}") from None
+    except json.JSONDecodeError as e:
+        raise ValueError(f"{path} is not valid JSON: {e}") from None
+    try:
+        return parse_config(data, base)
+    except ValueError as e:
+        raise ValueError(f"{path}: {e}") from None
+
+
+def _file_token(path: str) -> Optional[Tuple[int, int, int]]:
+    try:
+        info = os.stat(path)
+    except OSError:
+        return None
+    return info.st_mtime_ns, info.st_size, info.st_ino
+
+
+class ConfigWatcher:
+    """Reloads a config file whenever it changes and passes it to apply.
+
+    The file is checked with one ``stat`` per interval, which works on every
+    platform and also sees editors that save by renaming a new file over
+    the old one. A version that cannot be read or does not validate is
+    logged and skipped; the settings in use stay as they are.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        base: EngineConfig,
+        apply: Callable[[EngineConfig], Any],
+        interval: float = DEFAULT_CHECK_INTERVAL,
+    ) -> None:
+        self.path = path
+        self.base = base
+        self.apply = apply
+        self.interval = interval
+        self.reloads: int = 0
+        self._token = _file_token(path)
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="config-watcher", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        if self._thread.is_alive():
+            self._thread.join()
+
+    def check(self) -> bool:
+        """Reload the file if it changed since the last check; True if it was applied."""
+        token = _file_token(self.path)
+        if token == self._token:
+            return False
+        self._token = token
+        if token is None:
+            logger.warning("Config file %s is gone; keeping the current settings", self.path)
+            return False
+        try:
+            config = load_config(self.path, self.base)
+            self.apply(config)
+        except Exception as e:
+            METRICS.incr("config_reloads_total", result="error")
+            logger.error("Config not reloaded: %s", str(e))
+            return False
+        self.reloads += 1
+        METRICS.incr("config_reloads_total", result="ok")
+        return True
+
+    def _run(self) -> None:
+        while not self._stopped.wait(self.interval):
+            self.check()
@@ -0,0 +1,189 @@
+from __future__ import annotations
+
+import os
+import time
+import logging
+import threading
+from typing import Callable, Dict, List, Optional
+
+from protection.dedup import normalize_path
+from protection.metrics import METRICS
+from protection.provenance import FINGERPRINT_SAMPLE_SIZE, ProvenanceIndex, head_digest
+
+logger = logging.getLogger(__name__)
+
+# Seconds a file's size and mtime must stay unchanged before it counts as written
+DEFAULT_SETTLE_TIME: float = 1.0
+# How often pending copies are checked for completion
+DEFAULT_CHECK_INTERVAL: float = 0.5
+
+
+class PendingCopy:
+    __slots__ = ("path", "first_seen", "events", "state", "stable_since", "decision", "head_checked")
+
+    def __init__(self, path: str, now: float) -> None:
+        self.path = path
+        self.first_seen = now
+        self.events = 0
+        self.state = None
+        self.stable_since = now
+        # True once the head matched a root file; None until then
+        self.decision: Optional[bool] = None
+        self.head_checked = False
+
+
+def is_released(path: str) -> bool:
+    """Check whether no other process still holds a file open for writing.
+
+    On Windows a file that is open without delete sharing, as a file being
+    copied is, cannot be renamed, so renaming it onto itself is a cheap probe.
+    Elsewhere there is no such lock, and the settle time has to do.
+    """
+    if os.name != "nt":
+        return True
+    try:
+        os.rename(path, path)
+    except PermissionError:
+        return False
+    except OSError:
+        return True
+    return True
+
+
+class CopyTracker:
+    """Collapses the stream of write events from a file copy into one decision.
+
+    The first event for a file starts tracking it. As soon as the file's
+    first block is on disk, it is matched against the provenance index, so
+    a copy under its own name is known early; anything else is checked in
+    full once the file settles, where renamed and edited copies are matched
+    by content. Later events for the same file only bump a
+    counter. A background thread enforces the decision once, after the file
+    has stopped changing and the copying process has released it.
+    """
+
+    def __init__(
+        self,
+        provenance: ProvenanceIndex,
+        enforce: Callable[[str], None],
+        settle_time: float = DEFAULT_SETTLE_TIME,
+        check_interval: float = DEFAULT_CHECK_INTERVAL,
+        head_size: int = FINGERPRINT_SAMPLE_SIZE,
+    ) -> None:
+        self.provenance = provenance
+        self.enforce = enforce
+        self.settle_time = settle_time
+        self.check_interval = check_interval
+        self.head_size = head_size
+        self._pending: Dict[str, PendingCopy] = {}
+        self._changed = threading.Condition()
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name="copy-tracker", daemon=True)
+        self._thread.start()
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def observe(self, path: str, block: bool = False) -> None:
+        """Record a create or modify event for a file outside the protected roots.
+
+        With block, the file is blocked once written whatever it contains,
+        e.g. because it was pasted while protected files were on the clipboard.
+        """
+        key = normalize_path(path)
+        now = time.monotonic()
+        with self._changed:
+            pending = self._pending.get(key)
+            if pending is None:
+                pending = self._pending[key] = PendingCopy(path, now)
+                self._changed.notify_all()
+            pending.events += 1
+            if block:
+                pending.decision = pending.head_checked = True
+            undecided = not pending.head_checked
+        if pending.events > 1:
+            METRICS.incr("copy_events_collapsed_total")
+        if undecided:
+            self._decide_early(pending)
+
+    def pending_paths(self) -> List[str]:
+        """Return the files still being copied, e.g. to resume them after a restart."""
+        with self._changed:
+            return [pending.path for pending in self._pending.values()]
+
+    def forget(self, path: str) -> None:
+        """Stop tracking a file, e.g. because it was deleted."""
+        with self._changed:
+            self._pending.pop(normalize_path(path), None)
+
+    def drain(self, timeout: Optional[float] = None) -> bool:
+        """Wait until every tracked copy has been decided; False on timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._changed:
+            while self._pending:
+                wait = self.check_interval
+                if deadline is not None:
+                    wait = min(wait, deadline - time.monotonic())
+                    if wait <= 0:
+                        return False
+                self._changed.wait(wait)
+        return True
+
+    def stop(self) -> None:
+        with self._changed:
+            self._stopping = True
+            self._changed.notify_all()
+        self._thread.join()
+
+    def _decide_early(self, pending: PendingCopy) -> None:
+        try:
+            if os.path.getsize(pending.path) < self.head_size:
+                return
+            head = head_digest(pending.path, self.head_size)
+        except OSError:
+            return
+        pending.head_checked = True
+        # A different head can still be a renamed or edited copy, which only
+        # the full check finds
+        if head is not None and self.provenance.match_head(os.path.basename(pending.path), head):
+            pending.decision = True
+
+    def _run(self) -> None:
+        while True:
+            with self._changed:
+                while not self._pending and not self._stopping:
+                    self._changed.wait()
+                if self._stopping:
+                    return
+                pending_copies = list(self._pending.values())
+            for pending in pending_copies:
+                self._check(pending)
+            with self._changed:
+                if self._stopping:
+                    return
+                self._changed.wait(self.check_interval)
+
+    def _check(self, pending: PendingCopy) -> None:
+        now = time.monotonic()
+        try:
+            st = os.stat(pending.path)
+        except OSError:
+            self.forget(pending.path)
+            return
+        state = (st.st_size, st.st_mtime_ns)
+        if state != pending.state:
+            pending.state, pending.stable_since = state, now
+            return
+        if now - pending.stable_since < self.settle_time or not is_released(pending.path):
+            return
+
+        self.forget(pending.path)
+        decision = pending.decision
+        if decision is None:
+            decision = self.provenance.contains(pending.path)
+        METRICS.incr("copy_decisions_total", outcome="blocked" if decision else "allowed")
+        if decision:
+            try:
+                self.enforce(pending.path)
+            except Exception as e:
+                logger.error("Error enforcing copy of %s: %s", pending.path, str(e))
@@ -0,0 +1,91 @@
+from __future__ import annotations
+
+import os
+import time
+import threading
+from collections import OrderedDict
+from typing import Callable, Hashable, Optional, Tuple
+
+from protection.metrics import METRICS
+
+DEFAULT_TTL: float = 5.0
+DEFAULT_MAX_ENTRIES: int = 100_000
+
+
+def normalize_path(path: str) -> str:
+    """Return the key used for a path, so spellings of the same file collapse."""
+    return os.path.normcase(os.path.abspath(path))
+
+
+class EventDeduplicator:
+    """Drops repeated filesystem events for the same path within a time window.
+
+    Entries live in insertion order with the time they were recorded, so
+    expired entries are always at the front and are dropped in amortized
+    O(1) per call, whatever ``ttl`` is changed to in between. The
+    number of entries is capped; when the cap is reached the oldest entry is
+    evicted first.
+
+    An optional token (for example the file's size and mtime) can be passed
+    with each event. A repeated event is only dropped if its token matches the
+    one recorded, so a file that keeps changing is still re-examined.
+    """
+
+    def __init__(
+        self,
+        ttl: float = DEFAULT_TTL,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.ttl: float = ttl
+        self.max_entries: int = max_entries
+        self._clock = clock
+        self._lock = threading.Lock()
+        # (kind, path) -> (time recorded, token)
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[float, Optional[Hashable]]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def should_process(self, path: str, kind: str = "", token: Optional[Hashable] = None) -> bool:
+        """Record an event and return False if it duplicates a recent one."""
+        key = (kind, normalize_path(path))
+        now = self._clock()
+        with self._lock:
+            self._expire(now)
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] == token:
+                METRICS.incr("events_deduplicated_total", kind=kind)
+                return False
+            self._entries.pop(key, None)
+            self._entries[key] = (now, token)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            return True
+
+    def forget(self, path: str, kind: str = "") -> None:
+        """Drop the record for a path so its next event is always processed."""
+        with self._lock:
+            self._entries.pop((kind, normalize_path(path)), None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def _expire(self, now: float) -> None:
+        entries = self._entries
+        cutoff = now - self.ttl
+        while entries:
+            key, (recorded, _token) = next(iter(entries.items()))
+            if recorded > cutoff:
+                break
+            del entries[key]
+
+
+def stat_token(path: str) -> Optional[Tuple[int, int]]:
+    """Return a cheap (size, mtime) token describing the current state of a file."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_size, st.st_mtime_ns
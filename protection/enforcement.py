@@ -0,0 +1,163 @@
+from __future__ import annotations
+
+import time
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from protection.dedup import normalize_path
+from protection.metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+# What to do with work for a new path when a worker queue is full
+OVERFLOW_INLINE: str = "inline"  # run it on the submitting thread
+OVERFLOW_DROP: str = "drop"  # discard it and count it as dropped
+
+DEFAULT_WORKERS: int = 4
+DEFAULT_MAX_PENDING: int = 10_000
+
+# (callable, arguments, time the task was first queued)
+Task = Tuple[Callable[..., Any], tuple, float]
+# Combines the arguments of a queued call with those of a newer call to the
+# same callable into one call that does the work of both
+Merge = Callable[[tuple, tuple], tuple]
+
+
+class _Worker:
+    def __init__(self, name: str, capacity: int) -> None:
+        self.capacity = capacity
+        # Pending tasks of each path, oldest first
+        self.tasks: "OrderedDict[str, List[Task]]" = OrderedDict()
+        self.pending = 0
+        # Path of the task running now; its later tasks must wait for it
+        self.running: Optional[str] = None
+        self.ready = threading.Condition()
+        self.stopping = False
+        self.thread = threading.Thread(target=self.run, name=name, daemon=True)
+
+    def run(self) -> None:
+        while True:
+            with self.ready:
+                while not self.tasks and not self.stopping:
+                    self.ready.wait()
+                if not self.tasks:
+                    return
+                key, queued = next(iter(self.tasks.items()))
+                func, args, queued_at = queued.pop(0)
+                if not queued:
+                    del self.tasks[key]
+                self.pending -= 1
+                self.running = key
+            # Read once: a reload may switch metrics on or off while the task runs
+            timed = METRICS.enabled
+            if timed:
+                began = time.perf_counter()
+                METRICS.observe("enforcement_queue_wait_seconds", began - queued_at)
+            try:
+                func(*args)
+            except Exception as e:
+                logger.error("Enforcement task failed: %s", str(e))
+            if timed:
+                METRICS.observe("enforcement_task_seconds", time.perf_counter() - began)
+            with self.ready:
+                self.running = None
+
+
+class EnforcementQueue:
+    """Runs enforcement work off the watchdog emitter thread.
+
+    Work is routed to one of a fixed pool of workers by a hash of its path, so
+    everything submitted for one path runs in submission order on the same
+    worker. A task identical to the last one still pending for its path is
+    dropped, since that one does the same work; a call to the same callable
+    is folded into it where the submitter says how (``merge``). Different
+    work for one path is never replaced. Each worker queue is bounded, and
+    work for a path with nothing pending or running that arrives while it
+    is full is handled by the overflow policy; other work waits its turn.
+
+    With ``workers=0`` every task runs synchronously on the caller's thread.
+    """
+
+    def __init__(
+        self,
+        workers: int = DEFAULT_WORKERS,
+        max_pending: int = DEFAULT_MAX_PENDING,
+        overflow: str = OVERFLOW_INLINE,
+    ) -> None:
+        if overflow not in (OVERFLOW_INLINE, OVERFLOW_DROP):
+            raise ValueError(f"Unknown overflow policy: {overflow}")
+        self.overflow: str = overflow
+        self.stats: Dict[str, int] = {
+            "submitted": 0, "coalesced": 0, "dropped": 0, "inline": 0,
+        }
+        self._stats_lock = threading.Lock()
+        capacity = max(1, max_pending // workers) if workers else 0
+        self._workers: List[_Worker] = [
+            _Worker(f"enforcement-{i}", capacity) for i in range(workers)
+        ]
+        for worker in self._workers:
+            worker.thread.start()
+
+    def _count(self, name: str) -> None:
+        with self._stats_lock:
+            self.stats[name] += 1
+        METRICS.incr("enforcement_tasks_total", outcome=name)
+
+    def submit(self, path: str, func: Callable[..., Any], *args: Any, merge: Optional[Merge] = None) -> bool:
+        """Queue func(*args) as the next piece of work for a path.
+
+        merge(queued_args, args) combines this call with a pending call to
+        func for the same path. Returns False if the work was dropped because
+        of overflow.
+        """
+        self._count("submitted")
+        if not self._workers:
+            func(*args)
+            return True
+
+        key = normalize_path(path)
+        worker = self._workers[hash(key) % len(self._workers)]
+        with worker.ready:
+            queued = worker.tasks.get(key)
+            if queued:
+                last_func, last_args, queued_at = queued[-1]
+                if last_func == func and (last_args == args or merge is not None):
+                    if last_args != args:
+                        queued[-1] = (func, merge(last_args, args), queued_at)
+                    self._count("coalesced")
+                    return True
+            # Work for a path already in hand queues behind it, even over
+            # capacity, so it never runs alongside or ahead of that work
+            in_hand = bool(queued) or worker.running == key
+            if (in_hand or worker.pending < worker.capacity) and not worker.stopping:
+                worker.tasks.setdefault(key, []).append((func, args, time.perf_counter()))
+                worker.pending += 1
+                worker.ready.notify()
+                return True
+
+        if self.overflow == OVERFLOW_DROP:
+            self._count("dropped")
+            logger.warning("Enforcement queue full, dropped work for %s", path)
+            return False
+        self._count("inline")
+        func(*args)
+        return True
+
+    def depth(self) -> int:
+        """Return the number of tasks waiting across all workers."""
+        return sum(worker.pending for worker in self._workers)
+
+    def stop(self, wait: bool = True) -> None:
+        """Stop accepting work; with wait, drain what is queued first."""
+        for worker in self._workers:
+            with worker.ready:
+                worker.stopping = True
+                if not wait:
+                    worker.tasks.clear()
+                    worker.pending = 0
+                worker.ready.notify()
+        if wait:
+            for worker in self._workers:
+                worker.thread.join()
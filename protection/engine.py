@@ -0,0 +1,869 @@
+"""The protection engine shared by every entry point.
+
+``python -m protection ROOT...`` runs it from the command line, and the
+scripts in the repository root run it with their own settings. All platform
+access goes through a backend from ``protection.backends``, so importing the
+engine imports no platform library, and the same engine runs against the
+fake backend in tests and benchmarks.
+"""
+from __future__ import annotations
+
+import os
+import sys
+import time
+import logging
+import argparse
+import threading
+from typing import Any, Callable, Dict, FrozenSet, Iterable, List, NamedTuple, Optional, Tuple
+
+from protection.audit import AUDIT, start_audit, start_queue_logging
+from protection.backends import BACKENDS, Backend, load_backend
+from protection.clipboard import ClipboardService
+from protection.config import DEFAULT_CHECK_INTERVAL, ConfigWatcher, load_config
+from protection.copy_tracker import CopyTracker
+from protection.dedup import EventDeduplicator, stat_token
+from protection.enforcement import EnforcementQueue, OVERFLOW_INLINE
+from protection.foreground import ForegroundBackend
+from protection.metrics import METRICS, start_metrics
+from protection.policy import OUTSIDE, PROTECTED, PathPolicy
+from protection.processes import DEFAULT_PROCESS_TTL, ProcessCache, ProcessInfo, describe, matches
+from protection.provenance import ProvenanceIndex
+from protection.quarantine import ACTION_DELETE, ACTION_QUARANTINE, Quarantine, block, select_quarantine_dir
+from protection.similarity import SimilarityIndex
+from protection.snapshot import DEFAULT_SNAPSHOT_INTERVAL, warm_start
+from protection.tree_moves import MoveBatcher, restore_move
+from protection.triggers import (
+    AdaptiveInterval,
+    TriggerDispatcher,
+    TRIGGER_CLIPBOARD,
+    TRIGGER_COPY,
+    TRIGGER_QUIT,
+)
+from protection.watch_plan import (
+    EventFilter,
+    FilteredEventHandler,
+    Watch,
+    WatchPlan,
+    WatchPlanner,
+    default_destinations,
+)
+
+logger = logging.getLogger(__name__)
+
+LOG_FORMAT: str = "%(asctime)s - %(levelname)s - %(message)s"
+
+# Trigger modes: OS notifications and hotkeys, polling the clipboard, or
+# none, where another process guards the clipboard (see protection.shards)
+TRIGGERS_HOOKS: str = "hooks"
+TRIGGERS_POLLING: str = "polling"
+TRIGGERS_NONE: str = "none"
+# Thread that polls the clipboard when there are no notifications
+CLIPBOARD_POLL_THREAD: str = "clipboard-poll"
+# Seconds after the first file of a blocked paste within which the rest of
+# that paste must appear to be blocked too, once the clipboard has been cleared
+PASTE_BURST_WINDOW: float = 5.0
+
+# Foreground windows in which protected files may stay on the clipboard
+DEFAULT_SAFE_WINDOWS: Tuple[str, ...] = ("explorer", "root directory")
+# The same by process: Windows Explorer and the common Linux file managers
+DEFAULT_SAFE_PROCESSES: Tuple[str, ...] = ("explorer.exe", "nautilus", "dolphin", "nemo", "thunar", "pcmanfm")
+
+
+class EngineConfig(NamedTuple):
+    """Everything the engine can be told; only roots is required."""
+    roots: Tuple[str, ...]
+    allowed_dirs: Tuple[str, ...] = ()
+    exclude_patterns: Tuple[str, ...] = ()
+    # None watches the default paste destinations
+    paste_destinations: Optional[Tuple[str, ...]] = None
+    # Folders to watch instead of planning watches over the roots and paste
+    # destinations; shard processes get theirs from the supervisor
+    watches: Optional[Tuple[str, ...]] = None
+    # 0 runs in this process; otherwise up to this many shard processes,
+    # one per watched volume (see protection.shards)
+    shards: int = 0
+    # "" picks the backend for this platform
+    backend: str = ""
+    require_privileges: bool = True
+    # Block files copied out of a root, matched against the provenance index
+    check_pastes: bool = True
+    # Clear protected files from the clipboard outside safe windows, and block
+    # files created outside the roots while they are on it
+    clipboard_guard: bool = True
+    restore_moves: bool = True
+    warn_on_block: bool = False
+    # Log and audit what would be blocked, leaving files and the clipboard alone
+    dry_run: bool = False
+    safe_windows: Tuple[str, ...] = DEFAULT_SAFE_WINDOWS
+    # Executable names or full paths of the safe foreground processes; window
+    # titles are only used where the foreground process cannot be found
+    safe_processes: Tuple[str, ...] = DEFAULT_SAFE_PROCESSES
+    # Processes whose files outside the roots are never blocked, nor those of
+    # processes they started, e.g. a backup agent; setting this turns on
+    # attribute_writes
+    trusted_writers: Tuple[str, ...] = ()
+    # Find which process wrote each blocked file and name it in the audit log
+    # (Linux: fanotify, which needs root; not available on Windows)
+    attribute_writes: bool = False
+    process_cache_ttl: float = DEFAULT_PROCESS_TTL
+    trigger_mode: str = TRIGGERS_HOOKS
+    clipboard_check_interval: float = 0.1
+    clipboard_max_interval: float = 2.0
+    dedup_ttl: float = 5.0
+    dedup_max_entries: int = 100_000
+    workers: int = 4
+    queue_size: int = 10_000
+    overflow: str = OVERFLOW_INLINE
+    copy_settle_time: float = 1.0
+    move_batch_ttl: float = 10.0
+    blocked_action: str = ACTION_QUARANTINE
+    # "" uses the per-user quarantine directory
+    quarantine_dir: str = ""
+    # "" rebuilds the index at every start
+    snapshot_path: str = ""
+    snapshot_interval: float = DEFAULT_SNAPSHOT_INTERVAL
+    scan_walkers: int = 8
+    scan_mb_per_second: float = 0
+    # 0 matches pasted files by name and content only
+    similarity_threshold: float = 0.5
+    metrics_port: Optional[int] = None
+    metrics_json_path: str = ""
+    metrics_json_interval: float = 10.0
+    audit_log_path: str = ""
+    # JSON file of settings that override these and are reloaded on change
+    config_path: str = ""
+    config_check_interval: float = DEFAULT_CHECK_INTERVAL
+    # Record everything the engine sees to this file (see protection.trace)
+    trace_path: str = ""
+
+
+# Settings a running engine cannot change; a reload that changes them keeps
+# the old values and logs that a restart is needed
+RESTART_FIELDS: Tuple[str, ...] = (
+    "backend", "require_privileges", "check_pastes", "clipboard_guard", "trigger_mode",
+    "dedup_max_entries", "workers", "queue_size", "overflow", "quarantine_dir",
+    "snapshot_path", "snapshot_interval", "similarity_threshold", "metrics_port",
+    "metrics_json_path", "metrics_json_interval", "audit_log_path", "config_path",
+    "config_check_interval", "shards", "trace_path", "attribute_writes",
+)
+# Settings that decide which paths are protected or watched
+POLICY_FIELDS: Tuple[str, ...] = ("roots", "allowed_dirs", "exclude_patterns")
+
+
+def changed_fields(old: EngineConfig, new: EngineConfig) -> Tuple[EngineConfig, List[str]]:
+    """Return new with RESTART_FIELDS kept at their old values, and the fields that still differ."""
+    changed = [name for name in EngineConfig._fields if getattr(new, name) != getattr(old, name)]
+    restart = [name for name in changed if name in RESTART_FIELDS]
+    if restart:
+        logger.warning("Restart to apply: %s", ", ".join(restart))
+        new = new._replace(**{name: getattr(old, name) for name in restart})
+    return new, [name for name in changed if name not in restart]
+
+
+def _paste_entries(path: str, pasted: Iterable[str]) -> FrozenSet[str]:
+    """Return the top-level entries a paste that created path creates in all.
+
+    The folder pasted into is the parent of the nearest ancestor of path
+    (or path itself) named like a pasted file; each pasted name directly
+    under it is an entry. A file renamed on the way is an entry of its own.
+    """
+    names = {os.path.normcase(os.path.basename(p)) for p in pasted}
+    created = os.path.normcase(os.path.abspath(path))
+    entry = created
+    while os.path.basename(entry) not in names:
+        parent = os.path.dirname(entry)
+        if parent == entry:
+            entry = created
+            break
+        entry = parent
+    destination = os.path.dirname(entry)
+    return frozenset([entry] + [os.path.join(destination, name) for name in names])
+
+
+def _merge_writes(queued: tuple, new: tuple) -> tuple:
+    """One write check for a path covers the next; it is a creation if either was."""
+    return queued[0], queued[1] or new[1]
+
+
+class ProtectionHandler:
+    """Decides what to do about each filesystem event.
+
+    Writes inside a root keep the provenance index current. A file written
+    outside the roots is blocked once it has finished copying if it came
+    from a root, or at once if it appeared while protected files were on
+    the clipboard. A file or folder moved out of a root is moved back.
+    Decisions that touch the disk run on the enforcement queue.
+
+    Observers call ``dispatch`` as they would on a watchdog event handler.
+    """
+
+    def __init__(
+        self,
+        config: EngineConfig,
+        policy: PathPolicy,
+        provenance: Optional[ProvenanceIndex] = None,
+        clipboard: Optional[ClipboardService] = None,
+        enforcement: Optional[EnforcementQueue] = None,
+        copies: Optional[CopyTracker] = None,
+        quarantine: Optional[Quarantine] = None,
+        warn: Optional[Callable[[str, str], None]] = None,
+        processes: Optional[ProcessCache] = None,
+    ) -> None:
+        self.config = config
+        self.policy = policy
+        self.provenance = provenance
+        self.clipboard = clipboard
+        self.processes = processes
+        self.enforcement = enforcement if enforcement is not None else EnforcementQueue(
+            config.workers, config.queue_size, config.overflow
+        )
+        # Large pastes arrive as many modified events; decide once per file
+        if copies is None and provenance is not None:
+            copies = CopyTracker(provenance, self.block_paste, config.copy_settle_time)
+        self.copies = copies
+        self.quarantine = quarantine if quarantine is not None else Quarantine(
+            select_quarantine_dir(policy.is_protected, config.quarantine_dir)
+        )
+        self.warn = warn
+        self.recent_events = EventDeduplicator(config.dedup_ttl, config.dedup_max_entries)
+        self.moves = MoveBatcher(config.move_batch_ttl)
+        # Top-level entries of the paste being blocked, and until when
+        self._paste: Tuple[FrozenSet[str], float] = (frozenset(), 0.0)
+
+    def dispatch(self, event) -> None:
+        handler = getattr(self, f"on_{event.event_type}", None)
+        if handler is not None:
+            handler(event)
+
+    def on_created(self, event) -> None:
+        if not event.is_directory:
+            self.enforcement.submit(event.src_path, self.handle_write, event.src_path, True,
+                                    merge=_merge_writes)
+
+    def on_modified(self, event) -> None:
+        if not event.is_directory:
+            self.enforcement.submit(event.src_path, self.handle_write, event.src_path, False,
+                                    merge=_merge_writes)
+
+    def on_deleted(self, event) -> None:
+        if self.policy.is_protected(event.src_path):
+            if self.provenance is not None:
+                self.provenance.remove(event.src_path)
+        elif self.copies is not None:
+            # A paste that was cancelled or removed
+            self.copies.forget(event.src_path)
+
+    def on_moved(self, event) -> None:
+        src_path, dest_path = event.src_path, event.dest_path
+        # A folder move is handled once; the events for its contents are dropped
+        if self.moves.covers(src_path, dest_path):
+            return
+        if not self.recent_events.should_process(dest_path, "moved", src_path):
+            return
+        logger.debug("Move detected: %s -> %s", src_path, dest_path)
+
+        src_decision, dest_decision = self.policy.classify([src_path, dest_path])
+        if src_decision != PROTECTED:
+            return
+        if dest_decision == OUTSIDE and self.config.restore_moves:
+            if event.is_directory:
+                self.moves.claim(src_path, dest_path)
+            self.enforcement.submit(dest_path, self.block_move, src_path, dest_path)
+            return
+        # Keep the provenance index in step with renames inside the roots
+        if self.provenance is not None:
+            if dest_decision == PROTECTED:
+                self.provenance.move(src_path, dest_path)
+            else:
+                self.provenance.remove(src_path)
+        if event.is_directory:
+            self.moves.claim(src_path, dest_path)
+
+    def handle_write(self, path: str, created: bool = False) -> None:
+        if self.quarantine.holds(path):
+            return  # files we moved into quarantine ourselves
+        # Created and modified events for a file that has not changed since
+        # the last one are duplicates and would reach the same decision
+        if not self.recent_events.should_process(path, "write", stat_token(path)):
+            return
+        logger.debug("File written: %s", path)
+
+        decision = self.policy.decide(path)
+        if decision == PROTECTED:
+            if self.provenance is not None:
+                self.provenance.add(path)
+        elif decision == OUTSIDE:
+            if self.config.trusted_writers and self._trusted(self._writer(path)):
+                return
+            # Served from the shared snapshot; the clipboard is only read on change
+            snapshot = self.clipboard.snapshot() if created and self.clipboard is not None else None
+            if snapshot is not None and (snapshot.has_protected or self._in_paste(path)):
+                if self.config.trusted_writers and self.copies is not None:
+                    # Its writer is only known once it writes; judged when done
+                    self.copies.observe(path, block=True)
+                else:
+                    self.block_paste(path)
+                if snapshot.has_protected:
+                    # The rest of this paste arrives after the clipboard is cleared
+                    entries = _paste_entries(path, snapshot.protected_files)
+                    self._paste = (entries, time.monotonic() + PASTE_BURST_WINDOW)
+                    if not self.config.dry_run:
+                        self.clipboard.clear()
+                        METRICS.incr("enforcement_actions_total", action="clear_clipboard")
+            elif self.copies is not None:
+                # Blocked once the copy has finished writing, if it came from a root
+                self.copies.observe(path)
+
+    def _in_paste(self, path: str) -> bool:
+        """True if a new file belongs to the paste last blocked: it is one of
+        the entries that paste created, or inside one, and arrived in time."""
+        entries, until = self._paste
+        if not entries or time.monotonic() > until:
+            return False
+        current = os.path.normcase(os.path.abspath(path))
+        while current not in entries:
+            parent = os.path.dirname(current)
+            if parent == current:
+                return False
+            current = parent
+        return True
+
+    def block_paste(self, path: str) -> None:
+        """Quarantine or delete a file that was pasted outside the roots."""
+        try:
+            writer = self._writer(path)
+            fields = {"writer": describe(writer)} if writer else {}
+            if self._trusted(writer):
+                AUDIT.record("allow", path, reason="trusted writer", **fields)
+                logger.info("Not blocking %s, written by %s", path, describe(writer))
+                return
+            if self.config.dry_run:
+                action = f"would_{self.config.blocked_action}"
+            else:
+                METRICS.observe_file_age("file_creation_to_deletion_seconds", path)
+                action = block(path, self.config.blocked_action, self.quarantine, reason="pasted outside root")
+            AUDIT.record(action, path, reason="pasted outside root", **fields)
+            # A new file at the same path must be checked again
+            self.recent_events.forget(path, "write")
+            logger.info("Blocked file pasted outside root (%s): %s", action, path)
+        except Exception as e:
+            logger.error("Error removing pasted file %s: %s", path, str(e))
+
+    def block_move(self, src_path: str, dest_path: str) -> None:
+        """Move a file or folder back into its root, or quarantine it if that fails."""
+        if self.config.dry_run:
+            AUDIT.record("would_restore", dest_path, src=src_path)
+            self.recent_events.forget(dest_path, "moved")
+            logger.info("Dry run, not blocking move: %s -> %s", src_path, dest_path)
+            return
+        # One rename puts a whole folder back
+        if restore_move(src_path, dest_path):
+            METRICS.incr("enforcement_actions_total", action="restore")
+            AUDIT.record("restore", dest_path, src=src_path)
+        else:
+            try:
+                if os.path.lexists(dest_path):
+                    # Quarantined content remembers where it came from, for restore
+                    action = block(dest_path, self.config.blocked_action, self.quarantine,
+                                   src_path, "moved out of root")
+                    AUDIT.record(action, dest_path, src=src_path, reason="moved out of root")
+            except Exception as e:
+                logger.error("Error blocking moved file %s: %s", dest_path, str(e))
+            if self.provenance is not None:
+                self.provenance.remove(src_path)
+        self.recent_events.forget(dest_path, "moved")
+        logger.info("Blocked move: %s -> %s", src_path, dest_path)
+        if self.warn is not None and self.config.warn_on_block:
+            self.warn(
+                "Operation Not Allowed",
+                "Move operation not allowed!\nFiles or folders from "
+                f"{', '.join(self.config.roots)} cannot be moved outside the root directory.",
+            )
+
+    def _writer(self, path: str) -> List[ProcessInfo]:
+        """Return the process that wrote path and its parents, where writes are attributed."""
+        if self.processes is None:
+            return []
+        return self.processes.writer_chain(path)
+
+    def _trusted(self, writer: List[ProcessInfo]) -> bool:
+        trusted = self.config.trusted_writers
+        return bool(trusted) and any(matches(info, trusted) for info in writer)
+
+    def reconfigure(self, config: EngineConfig, policy: PathPolicy) -> None:
+        """Switch to new settings; checks already running finish with the old ones."""
+        self.recent_events.ttl = config.dedup_ttl
+        self.moves.ttl = config.move_batch_ttl
+        if self.copies is not None:
+            self.copies.settle_time = config.copy_settle_time
+        self.policy = policy
+        self.config = config
+
+    def stop(self) -> None:
+        """Finish the checks already queued, then the copies still being watched."""
+        self.enforcement.stop()
+        if self.copies is not None:
+            self.copies.stop()
+
+
+class ClipboardGuard:
+    """Clears protected files from the clipboard unless a safe window is in front.
+
+    With processes, the window in front is judged by the process that owns
+    it, which a window title cannot fake; its title is only read where that
+    process cannot be found.
+    """
+
+    def __init__(self, clipboard: ClipboardService, foreground: ForegroundBackend,
+                 safe_windows: Tuple[str, ...] = DEFAULT_SAFE_WINDOWS,
+                 processes: Optional[ProcessCache] = None,
+                 safe_processes: Tuple[str, ...] = DEFAULT_SAFE_PROCESSES) -> None:
+        self.clipboard = clipboard
+        self.foreground = foreground
+        self.safe_windows = tuple(title.lower() for title in safe_windows)
+        self.processes = processes
+        self.safe_processes = safe_processes
+        self.last_blocked_time: float = 0
+        self.interval: Optional[AdaptiveInterval] = None
+        self.dry_run: bool = False
+
+    def check(self, trigger: str = TRIGGER_CLIPBOARD) -> bool:
+        """Check the clipboard once; return True while protected files are on it."""
+        # Cached snapshot; the clipboard itself is only read on change
+        protected_files = self.clipboard.snapshot().protected_files
+        if not protected_files:
+            return False
+        safe, foreground = self.foreground_is_safe()
+        if not safe:
+            logger.info("Blocking copy of protected files: %s", ", ".join(protected_files))
+            action = "clear_clipboard"
+            if self.dry_run:
+                action = "would_clear_clipboard"
+            else:
+                self.clipboard.clear()
+                METRICS.incr("enforcement_actions_total", action=action)
+            for path in protected_files:
+                AUDIT.record(action, path, trigger=trigger, **foreground)
+            self.last_blocked_time = time.time()
+        return True
+
+    def foreground_is_safe(self) -> Tuple[bool, Dict[str, str]]:
+        """Return whether a safe window is in front, and what is, for the audit log."""
+        if self.processes is not None:
+            pid = self.foreground.process_id()
+            info = self.processes.get(pid) if pid else None
+            if info is not None:
+                return matches(info, self.safe_processes), {"process": describe([info])}
+        active_window = self.foreground.window_title().lower()
+        return any(safe in active_window for safe in self.safe_windows), {"window": active_window}
+
+    def poll(self, minimum: float, maximum: float, stopped: threading.Event) -> None:
+        """Polling fallback for when clipboard notifications are unavailable."""
+        interval = self.interval = AdaptiveInterval(minimum, maximum)
+        while True:
+            active = False
+            try:
+                active = self.check()
+            except Exception as e:
+                logger.error("Clipboard monitor error: %s", str(e))
+            if stopped.wait(interval.next(active)):
+                return
+
+    def reconfigure(self, config: EngineConfig) -> None:
+        self.safe_windows = tuple(title.lower() for title in config.safe_windows)
+        self.safe_processes = config.safe_processes
+        self.dry_run = config.dry_run
+        if self.interval is not None:
+            self.interval.minimum = config.clipboard_check_interval
+            self.interval.maximum = config.clipboard_max_interval
+
+
+class Engine:
+    """Builds, starts and stops everything that protects the roots.
+
+    ``start`` returns once the roots are protected: watches are scheduled
+    and the clipboard triggers are running, while the provenance index is
+    still being loaded or scanned in the background. The time this takes
+    is kept in ``startup_seconds`` and the ``startup_seconds`` metric.
+
+    ``reload`` applies new settings while running, e.g. from the file in
+    ``config_path``, without stopping the observer or dropping queued work.
+    """
+
+    def __init__(self, config: EngineConfig, backend: Optional[Backend] = None,
+                 provenance: Optional[Any] = None) -> None:
+        self.config = config
+        self.backend = backend if backend is not None else load_backend(config.backend or None)
+        self.policy = PathPolicy(config.roots, config.allowed_dirs, config.exclude_patterns)
+        self.handler: Optional[ProtectionHandler] = None
+        self.clipboard: Optional[ClipboardService] = None
+        self.guard: Optional[ClipboardGuard] = None
+        self.processes: Optional[ProcessCache] = None
+        # An index passed in is kept current by its owner, not loaded or scanned here
+        self.provenance: Optional[Any] = provenance
+        self._owns_index = provenance is None
+        self.observer: Any = None
+        self.startup_seconds: Optional[float] = None
+        self.protected = threading.Event()
+        self.stop_requested = threading.Event()
+        self._stopped = threading.Event()
+        self._scan: Any = None
+        self._dispatcher: Optional[TriggerDispatcher] = None
+        self._triggers: List[Any] = []
+        self._services: List[Any] = []
+        self._event_filter: Optional[EventFilter] = None
+        self._filtered: Optional[FilteredEventHandler] = None
+        self._watches: Dict[Watch, Any] = {}
+        self._watch_plan: Optional[WatchPlan] = None
+        self._config_watcher: Optional[ConfigWatcher] = None
+        self._reload_lock = threading.Lock()
+
+    def start(self) -> None:
+        began = time.perf_counter()
+        config = self.config
+        if config.config_path:
+            # Watch before reading, so an edit made in between is not missed
+            self._config_watcher = ConfigWatcher(config.config_path, config, self.reload,
+                                                 config.config_check_interval)
+            self.config = config = load_config(config.config_path, config)
+            self.policy = PathPolicy(config.roots, config.allowed_dirs, config.exclude_patterns)
+        if config.require_privileges:
+            error = self.backend.check_privileges()
+            if error:
+                raise PermissionError(error)
+        # Checked before anything starts: files kept inside a root would be root files
+        quarantine = Quarantine(select_quarantine_dir(self.policy.is_protected, config.quarantine_dir))
+
+        self._services = start_metrics(config.metrics_port, config.metrics_json_path,
+                                       config.metrics_json_interval)
+        self._services += start_audit(config.audit_log_path)
+        if config.trace_path:
+            # Everything the engine sees from the platform from here on is recorded
+            from protection.trace import record
+            self.backend = record(self.backend, config.trace_path, config)
+            self._services.append(self.backend)
+
+        if config.clipboard_guard:
+            # One clipboard service is shared by the guard and the handler
+            self.clipboard = ClipboardService(self.backend.clipboard(), self.policy)
+        if config.check_pastes and self.provenance is None:
+            similarity = None
+            if config.similarity_threshold:
+                similarity = SimilarityIndex(threshold=config.similarity_threshold)
+            self.provenance = ProvenanceIndex(*config.roots, similarity=similarity)
+        provider = self.backend.processes()
+        if provider is not None:
+            self.processes = ProcessCache(provider, config.process_cache_ttl)
+            self._services.append(self.processes)
+        self.handler = ProtectionHandler(config, self.policy, self.provenance, self.clipboard,
+                                         quarantine=quarantine, warn=self.backend.warn,
+                                         processes=self.processes)
+        self._register_gauges()
+
+        if self.provenance is not None and self._owns_index:
+            # Load the index saved by the last run, then re-read only files
+            # changed since in the background; the first run scans the same way
+            pending, services = warm_start(
+                self.provenance, config.snapshot_path or None, config.snapshot_interval,
+                self.handler.copies.pending_paths,
+                walkers=config.scan_walkers,
+                bytes_per_second=config.scan_mb_per_second * 1024 * 1024,
+            )
+            self._scan = services[0]
+            self._services += services
+            for path in pending:
+                if os.path.exists(path):
+                    self.handler.copies.observe(path)  # pastes in progress at shutdown
+
+        # Watch only the protected roots and paste destinations, and drop
+        # system-path events before they reach the handler
+        self._event_filter = EventFilter(self.policy, destinations=self._destinations(config))
+        self._filtered = FilteredEventHandler(self.handler, self._event_filter)
+        self.observer = self.backend.observer()
+        self._watches = self._plan(config).schedule(self.observer, self._filtered)
+        self.observer.start()
+        self._attribute_writes()
+
+        if self.clipboard is not None:
+            self._start_triggers()
+        if self._config_watcher is not None:
+            self._config_watcher.start()
+
+        self.startup_seconds = time.perf_counter() - began
+        METRICS.observe("startup_seconds", self.startup_seconds)
+        self.protected.set()
+        logger.info("Protecting %s (ready in %.3fs)", ", ".join(config.roots), self.startup_seconds)
+
+    @staticmethod
+    def _destinations(config: EngineConfig) -> Tuple[str, ...]:
+        if config.watches is not None:
+            return tuple(config.watches)
+        if config.paste_destinations is None:
+            return tuple(default_destinations())
+        return tuple(config.paste_destinations)
+
+    def _plan(self, config: EngineConfig):
+        if config.watches is not None:
+            return WatchPlan([Watch(path, True) for path in config.watches], len(config.watches), 0.0, False)
+        planner = WatchPlanner(config.roots, self._destinations(config), self._event_filter)
+        plan = planner.plan(estimate=False)
+        # Walking every watched tree takes long on a large drive, so the
+        # estimate is only logged and exported once it is ready
+        thread = threading.Thread(target=planner.estimate, args=(plan, self._stopped),
+                                  name="watch-estimate", daemon=True)
+        thread.start()
+        self._watch_plan = plan
+        return plan
+
+    def reload(self, config: EngineConfig) -> List[str]:
+        """Apply new settings to the running engine; return the fields that changed.
+
+        The new policy is built first and then swapped in by reference, so
+        events keep being handled throughout and each decision sees either
+        the old policy or the new one. Watches are rescheduled only where
+        the plan changed, and roots that were added are scanned in the
+        background. Fields in RESTART_FIELDS keep their old values. Roots
+        that would take in the quarantine are refused with ValueError.
+        """
+        with self._reload_lock:
+            config, changed = changed_fields(self.config, config)
+            if not changed:
+                return []
+
+            policy = self.policy
+            if any(name in POLICY_FIELDS for name in changed):
+                policy = PathPolicy(config.roots, config.allowed_dirs, config.exclude_patterns)
+                if policy.is_protected(self.handler.quarantine.directory):
+                    raise ValueError(f"Quarantine directory {self.handler.quarantine.directory} "
+                                     "would be inside a protected folder")
+            # Widen the filter before the handler, so events for new roots are not dropped
+            self._event_filter.policy = policy
+            self.handler.reconfigure(config, policy)
+            if self.clipboard is not None:
+                self.clipboard.set_policy(policy)
+            if self.guard is not None:
+                self.guard.reconfigure(config)
+            if self.processes is not None:
+                self.processes.ttl = config.process_cache_ttl
+            self.policy = policy
+            self.config = config
+
+            if self.provenance is not None and self._owns_index and "roots" in changed:
+                added, _removed = self.provenance.set_roots(config.roots)
+                if added:
+                    self._scan_roots(added)
+            if any(name in POLICY_FIELDS or name in ("paste_destinations", "watches") for name in changed):
+                self._event_filter.set_destinations(self._destinations(config))
+                before = set(self._watches)
+                self._watches = self._plan(config).reschedule(self.observer, self._filtered, self._watches)
+                after = set(self._watches)
+                logger.info("Watches: %d added, %d removed, %d unchanged",
+                            len(after - before), len(before - after), len(after & before))
+                self._attribute_writes()
+            logger.info("Configuration reloaded: %s", ", ".join(changed))
+            return changed
+
+    def _attribute_writes(self) -> None:
+        config = self.config
+        if self.processes is None or not (config.attribute_writes or config.trusted_writers):
+            return
+        if not self.processes.watch_writes([watch.path for watch in self._watches]):
+            logger.warning("Cannot find which process writes files here; trusted_writers has no effect")
+
+    def _scan_roots(self, roots: List[str]) -> None:
+        from protection.scanner import BulkScanner
+        config = self.config
+        scan = BulkScanner(self.provenance, walkers=config.scan_walkers,
+                           bytes_per_second=config.scan_mb_per_second * 1024 * 1024, roots=roots)
+        scan.start()
+        self._services.append(scan)
+
+    def _register_gauges(self) -> None:
+        METRICS.register_gauge("enforcement_queue_depth", self.handler.enforcement.depth)
+        METRICS.register_gauge("policy_cache_hits", lambda: self.policy.cache_info().hits)
+        METRICS.register_gauge("policy_cache_misses", lambda: self.policy.cache_info().misses)
+        METRICS.register_gauge("watched_directories",
+                               lambda: self._watch_plan.watch_count if self._watch_plan is not None else 0)
+        if self.handler.copies is not None:
+            METRICS.register_gauge("copies_in_progress", self.handler.copies.__len__)
+        if self.clipboard is not None:
+            METRICS.register_gauge("clipboard_refreshes", lambda: self.clipboard.refreshes)
+        if self.processes is not None:
+            METRICS.register_gauge("process_cache_entries", self.processes.__len__)
+
+    def _start_triggers(self) -> None:
+        config = self.config
+        if config.trigger_mode == TRIGGERS_NONE:
+            return
+        self.guard = ClipboardGuard(self.clipboard, self.backend.foreground(), config.safe_windows,
+                                    self.processes, config.safe_processes)
+        self.guard.dry_run = config.dry_run
+
+        # Hotkeys and clipboard notifications all feed one dispatcher thread
+        dispatcher = TriggerDispatcher()
+        dispatcher.on(TRIGGER_CLIPBOARD, self.guard.check)
+        dispatcher.on(TRIGGER_COPY, lambda: self.guard.check("hotkey"))
+        dispatcher.on(TRIGGER_QUIT, self.stop_requested.set)
+        dispatcher.start()
+        self._dispatcher = dispatcher
+
+        mode = config.trigger_mode
+        if mode == TRIGGERS_HOOKS:
+            hotkeys = self.backend.hotkeys(dispatcher)
+            listener = self.backend.clipboard_listener(lambda: dispatcher.dispatch(TRIGGER_CLIPBOARD))
+            try:
+                for trigger in (hotkeys, listener):
+                    if trigger is not None:
+                        trigger.start()
+                        self._triggers.append(trigger)
+            except Exception as e:
+                logger.warning("Hooks unavailable, falling back to polling: %s", str(e))
+                mode = TRIGGERS_POLLING
+            if listener is None:
+                mode = TRIGGERS_POLLING
+        if mode == TRIGGERS_POLLING:
+            thread = threading.Thread(
+                target=self.guard.poll, name=CLIPBOARD_POLL_THREAD, daemon=True,
+                args=(config.clipboard_check_interval, config.clipboard_max_interval, self._stopped),
+            )
+            thread.start()
+
+        # Check once for anything already on the clipboard
+        dispatcher.dispatch(TRIGGER_CLIPBOARD)
+
+    def wait_indexed(self, timeout: Optional[float] = None) -> bool:
+        """Wait for the startup scan of the roots; True once it has finished."""
+        if self._scan is None:
+            return True
+        return self._scan.wait(timeout) is not None
+
+    def run(self) -> None:
+        """Start, then protect until Ctrl+Q or Ctrl+C."""
+        self.start()
+        try:
+            while not self.stop_requested.wait(1.0):
+                pass
+            logger.info("Exiting...")
+        except KeyboardInterrupt:
+            pass
+        self.stop()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        if self._config_watcher is not None:
+            self._config_watcher.stop()
+        for trigger in self._triggers:
+            trigger.stop()
+        self._triggers.clear()
+        if self._dispatcher is not None:
+            self._dispatcher.stop()
+        if self.observer is not None:
+            self.observer.stop()
+            self.observer.join()
+        if self.handler is not None:
+            self.handler.stop()
+        for service in self._services:
+            service.stop()
+        self._services.clear()
+        self.protected.clear()
+        logger.info("Protection system stopped.")
+
+
+def run(config: EngineConfig, backend: Optional[Backend] = None, check: bool = False) -> Any:
+    """Run the engine with logging on a background thread.
+
+    Exits with status 1 without the privileges the backend asks for, or if
+    the backend or config file cannot be used.
+
+    With check, return as soon as the roots are protected instead of
+    protecting until told to stop. With ``config.shards`` a supervisor runs
+    the engine in shard processes instead (see ``protection.shards``).
+    """
+    log_listener = start_queue_logging()
+    try:
+        if config.shards:
+            from protection.shards import Supervisor
+            engine = Supervisor(config)
+        else:
+            engine = Engine(config, backend)
+        if check:
+            engine.start()
+            engine.stop()
+        else:
+            engine.run()
+    except (PermissionError, ValueError) as e:
+        logger.error("%s", str(e))
+        log_listener.stop()
+        sys.exit(1)
+    log_listener.stop()
+    return engine
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(
+        prog="python -m protection",
+        description="Keep files in protected folders from being copied or moved out.",
+    )
+    parser.add_argument("roots", nargs="+", help="folders to protect")
+    parser.add_argument("--allow", action="append", default=[], metavar="DIR",
+                        help="folder inside a root that is not protected; may be repeated")
+    parser.add_argument("--exclude", action="append", default=[], metavar="PATTERN",
+                        help="glob of paths that are not protected; may be repeated")
+    parser.add_argument("--dest", action="append", metavar="DIR",
+                        help="folder where pasted files are checked; may be repeated "
+                             "(default: the user's profile and removable drives)")
+    parser.add_argument("--config", default="", metavar="PATH",
+                        help="JSON file of settings, reloaded while running when it changes")
+    parser.add_argument("--backend", choices=sorted(BACKENDS), help="platform backend (default: this platform's)")
+    parser.add_argument("--action", choices=(ACTION_QUARANTINE, ACTION_DELETE), default=ACTION_QUARANTINE,
+                        help="what to do with blocked files (default: quarantine)")
+    parser.add_argument("--quarantine-dir", default="", help="where blocked files are kept")
+    parser.add_argument("--snapshot", default="", metavar="PATH",
+                        help="save the index here between runs for fast restarts")
+    parser.add_argument("--audit-log", default="", metavar="PATH", help="JSONL file of every decision")
+    parser.add_argument("--metrics-port", type=int, help="serve Prometheus metrics on this port")
+    parser.add_argument("--no-clipboard-guard", action="store_true",
+                        help="do not watch the clipboard; rely on provenance only")
+    parser.add_argument("--no-paste-check", action="store_true",
+                        help="do not index the roots; rely on the clipboard guard only")
+    parser.add_argument("--polling", action="store_true", help="poll the clipboard instead of using hooks")
+    parser.add_argument("--trust-writer", action="append", default=[], metavar="EXE",
+                        help="program whose files outside the roots are never blocked, "
+                             "nor those of programs it starts; may be repeated (Linux, as root)")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="log and audit what would be blocked without blocking it")
+    parser.add_argument("--record", default="", metavar="PATH",
+                        help="record events, clipboard and window titles to a trace file "
+                             "for python -m protection.trace replay")
+    parser.add_argument("--shards", type=int, default=0, metavar="N",
+                        help="run up to N worker processes, one per watched volume (default: one process)")
+    parser.add_argument("--no-privilege-check", action="store_true",
+                        help="start even without the privileges the backend asks for")
+    parser.add_argument("--check", action="store_true",
+                        help="exit once the roots are protected, after logging the startup time")
+    parser.add_argument("-v", "--verbose", action="store_true", help="log every file event")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO, format=LOG_FORMAT)
+    config = EngineConfig(
+        roots=tuple(os.path.abspath(root) for root in args.roots),
+        allowed_dirs=tuple(args.allow),
+        exclude_patterns=tuple(args.exclude),
+        paste_destinations=tuple(args.dest) if args.dest else None,
+        backend=args.backend or "",
+        require_privileges=not args.no_privilege_check,
+        check_pastes=not args.no_paste_check,
+        clipboard_guard=not args.no_clipboard_guard,
+        trigger_mode=TRIGGERS_POLLING if args.polling else TRIGGERS_HOOKS,
+        blocked_action=args.action,
+        quarantine_dir=args.quarantine_dir,
+        snapshot_path=args.snapshot,
+        metrics_port=args.metrics_port,
+        audit_log_path=args.audit_log,
+        config_path=args.config,
+        shards=args.shards,
+        trusted_writers=tuple(args.trust_writer),
+        dry_run=args.dry_run,
+        trace_path=args.record,
+    )
+    run(config, check=args.check)
@@ -0,0 +1,49 @@
+from __future__ import annotations
+
+from typing import Optional
+
+
+class ForegroundBackend:
+    """Platform access to the foreground window."""
+
+    def window_title(self) -> str:
+        raise NotImplementedError
+
+    def process_id(self) -> Optional[int]:
+        """Return the PID of the process that owns the foreground window, if known."""
+        return None
+
+
+class Win32ForegroundBackend(ForegroundBackend):
+    """Foreground window lookup through pywin32, imported on first use."""
+
+    def __init__(self) -> None:
+        import win32gui
+        import win32process
+        self._win32gui = win32gui
+        self._win32process = win32process
+
+    def window_title(self) -> str:
+        return self._win32gui.GetWindowText(self._win32gui.GetForegroundWindow())
+
+    def process_id(self) -> Optional[int]:
+        hwnd = self._win32gui.GetForegroundWindow()
+        if not hwnd:
+            return None
+        return self._win32process.GetWindowThreadProcessId(hwnd)[1] or None
+
+
+class FakeForegroundBackend(ForegroundBackend):
+    """Fixed foreground window title and process for tests and benchmarks."""
+
+    def __init__(self, title: str = "", pid: Optional[int] = None) -> None:
+        self.title = title
+        self.pid = pid
+        self.lookups: int = 0
+
+    def window_title(self) -> str:
+        self.lookups += 1
+        return self.title
+
+    def process_id(self) -> Optional[int]:
+        return self.pid
@@ -0,0 +1,274 @@
+from __future__ import annotations
+
+import os
+import json
+import time
+import bisect
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds, in seconds, of the latency histogram buckets
+DEFAULT_BUCKETS: Sequence[float] = (
+    0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 60.0,
+)
+METRIC_PREFIX: str = "protection_"
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class _Histogram:
+    __slots__ = ("buckets", "counts", "total", "count")
+
+    def __init__(self, buckets: Sequence[float]) -> None:
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    """Process-wide counters, histograms and gauges.
+
+    Every recording method returns immediately while the registry is
+    disabled, which is the default, so instrumented code pays one attribute
+    check until metrics are switched on.
+    """
+
+    def __init__(self) -> None:
+        self.enabled: bool = False
+        self._lock = threading.Lock()
+        self._counters: Dict[Tuple[str, Labels], float] = {}
+        self._histograms: Dict[Tuple[str, Labels], _Histogram] = {}
+        self._gauges: Dict[str, Callable[[], float]] = {}
+        self._collectors: Dict[str, Callable[[], Optional[Dict[str, object]]]] = {}
+
+    def incr(self, name: str, value: float = 1, **labels: str) -> None:
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name: str, seconds: float, **labels: str) -> None:
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = _Histogram(DEFAULT_BUCKETS)
+            histogram.observe(seconds)
+
+    @contextmanager
+    def timer(self, name: str, **labels: str) -> Iterator[None]:
+        if not self.enabled:
+            yield
+            return
+        began = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - began, **labels)
+
+    def observe_file_age(self, name: str, path: str) -> None:
+        """Record the time since a file was created, e.g. just before deleting it."""
+        if not self.enabled:
+            return
+        try:
+            st = os.stat(path)
+        except OSError:
+            return
+        created = getattr(st, "st_birthtime", st.st_ctime)
+        self.observe(name, max(0.0, time.time() - created))
+
+    def register_gauge(self, name: str, read: Callable[[], float]) -> None:
+        """Register a value that is read each time metrics are exported."""
+        with self._lock:
+            self._gauges[name] = read
+
+    def register_collector(self, shard: str, collect: Callable[[], Optional[Dict[str, object]]]) -> None:
+        """Include another registry's snapshot in every export, labelled with shard.
+
+        The supervisor uses this for the latest snapshot each shard process
+        sent; collect may return None while there is none yet.
+        """
+        with self._lock:
+            self._collectors[shard] = collect
+
+    def unregister_collector(self, shard: str) -> None:
+        with self._lock:
+            self._collectors.pop(shard, None)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def snapshot(self) -> Dict[str, object]:
+        """Return every metric as plain data."""
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {
+                key: (list(h.buckets), list(h.counts), h.total, h.count)
+                for key, h in self._histograms.items()
+            }
+            gauges = dict(self._gauges)
+            collectors = dict(self._collectors)
+        gauge_values = {}
+        for name, read in gauges.items():
+            try:
+                gauge_values[name] = float(read())
+            except Exception:
+                continue
+        data = {
+            "counters": [
+                {"name": name, "labels": dict(labels), "value": value}
+                for (name, labels), value in sorted(counters.items())
+            ],
+            "histograms": [
+                {"name": name, "labels": dict(labels), "buckets": buckets,
+                 "counts": counts, "sum": total, "count": count}
+                for (name, labels), (buckets, counts, total, count) in sorted(histograms.items())
+            ],
+            "gauges": gauge_values,
+            "timestamp": time.time(),
+        }
+        for shard, collect in sorted(collectors.items()):
+            collected = collect()
+            if collected:
+                _merge(data, collected, shard)
+        return data
+
+    def render_prometheus(self) -> str:
+        """Return every metric in the Prometheus text exposition format."""
+        data = self.snapshot()
+        lines: List[str] = []
+        for counter in data["counters"]:
+            lines.append(f"{METRIC_PREFIX}{counter['name']}{_labels(counter['labels'])} {counter['value']}")
+        for histogram in data["histograms"]:
+            name, labels = METRIC_PREFIX + histogram["name"], histogram["labels"]
+            cumulative = 0
+            for bound, count in zip(histogram["buckets"], histogram["counts"]):
+                cumulative += count
+                lines.append(f"{name}_bucket{_labels(labels, le=repr(bound))} {cumulative}")
+            lines.append(f"{name}_bucket{_labels(labels, le='+Inf')} {histogram['count']}")
+            lines.append(f"{name}_sum{_labels(labels)} {histogram['sum']}")
+            lines.append(f"{name}_count{_labels(labels)} {histogram['count']}")
+        for name, value in sorted(data["gauges"].items()):
+            lines.append(f"{METRIC_PREFIX}{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def _merge(data: Dict[str, object], other: Dict[str, object], shard: str) -> None:
+    """Append another snapshot's metrics to data, each labelled with its shard."""
+    for kind in ("counters", "histograms"):
+        for metric in other.get(kind, ()):
+            data[kind].append({**metric, "labels": {**metric["labels"], "shard": shard}})
+    for name, value in other.get("gauges", {}).items():
+        data["gauges"][f'{name}{{shard="{shard}"}}'] = value
+
+
+def _labels(labels: Dict[str, str], **extra: str) -> str:
+    merged = {**labels, **extra}
+    if not merged:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in merged.items()) + "}"
+
+
+METRICS = MetricsRegistry()
+
+
+class MetricsServer:
+    """Serves METRICS as Prometheus text on http://host:port/metrics."""
+
+    def __init__(self, port: int, host: str = "127.0.0.1", registry: MetricsRegistry = METRICS) -> None:
+        registry_ref = registry
+
+        # Imported here; http.server costs more to import than the rest of the package
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = registry_ref.render_prometheus().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args) -> None:
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, name="metrics-http", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+
+class JsonMetricsWriter:
+    """Periodically writes METRICS to a JSON file, replacing it atomically."""
+
+    def __init__(self, path: str, interval: float = 10.0, registry: MetricsRegistry = METRICS) -> None:
+        self.path = path
+        self.interval = interval
+        self.registry = registry
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="metrics-json", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self._thread.join()
+        self.write()
+
+    def write(self) -> None:
+        temporary = f"{self.path}.tmp"
+        try:
+            with open(temporary, "w") as handle:
+                json.dump(self.registry.snapshot(), handle)
+            os.replace(temporary, self.path)
+        except OSError as e:
+            logger.error("Error writing metrics file: %s", str(e))
+
+    def _run(self) -> None:
+        while not self._stopped.wait(self.interval):
+            self.write()
+
+
+def start_metrics(port: Optional[int] = None, json_path: Optional[str] = None,
+                  interval: float = 10.0) -> List[object]:
+    """Enable METRICS and start the requested exporters; return them for stopping."""
+    exporters: List[object] = []
+    if port is None and not json_path:
+        return exporters
+    METRICS.enabled = True
+    if port is not None:
+        server = MetricsServer(port)
+        server.start()
+        logger.info("Serving metrics on http://127.0.0.1:%d/metrics", server.port)
+        exporters.append(server)
+    if json_path:
+        writer = JsonMetricsWriter(json_path, interval)
+        writer.start()
+        exporters.append(writer)
+    return exporters
@@ -0,0 +1,135 @@
+from __future__ import annotations
+
+import os
+import re
+import time
+import fnmatch
+import functools
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from protection.metrics import METRICS
+
+# Decisions returned by PathPolicy
+PROTECTED: str = "protected"
+ALLOWED: str = "allowed"
+EXCLUDED: str = "excluded"
+OUTSIDE: str = "outside"
+
+DEFAULT_CACHE_SIZE: int = 65536
+
+
+def split_path(path: str) -> Tuple[str, ...]:
+    """Normalize a path and split it into its components."""
+    normalized = os.path.normcase(os.path.abspath(path))
+    drive, rest = os.path.splitdrive(normalized)
+    parts = [part for part in rest.split(os.sep) if part]
+    return (drive,) + tuple(parts)
+
+
+class _Node:
+    __slots__ = ("children", "decision", "root")
+
+    def __init__(self) -> None:
+        self.children: Dict[str, _Node] = {}
+        self.decision: Optional[str] = None
+        self.root: Optional[str] = None
+
+
+class PathPolicy:
+    """Compiled protection policy over any number of roots.
+
+    Protected roots and allow-listed directories are stored in a trie of path
+    components, so a lookup costs one step per component of the path no matter
+    how many roots are configured. Matching is by whole component, so a sibling
+    such as ``C:\\Users\\ASUS2`` is not inside ``C:\\Users\\ASUS``. The deepest
+    matching entry wins, which lets an allow-listed folder sit inside a
+    protected root. Paths matching an exclude glob are never protected.
+    """
+
+    def __init__(
+        self,
+        protected_roots: Iterable[str],
+        allowed: Iterable[str] = (),
+        excludes: Iterable[str] = (),
+        cache_size: int = DEFAULT_CACHE_SIZE,
+    ) -> None:
+        self.roots: List[str] = [os.path.abspath(root) for root in protected_roots]
+        self.allowed: List[str] = [os.path.abspath(path) for path in allowed]
+        self.excludes: List[str] = list(excludes)
+        self._trie = _Node()
+        for root in self.roots:
+            self._insert(root, PROTECTED)
+        for path in self.allowed:
+            self._insert(path, ALLOWED)
+        self._exclude_re = None
+        if self.excludes:
+            self._exclude_re = re.compile("|".join(
+                fnmatch.translate(os.path.normcase(pattern)) for pattern in self.excludes
+            ))
+        self._cached = functools.lru_cache(maxsize=cache_size)(self._match)
+
+    def _insert(self, path: str, decision: str) -> None:
+        node = self._trie
+        for part in split_path(path):
+            node = node.children.setdefault(part, _Node())
+        node.decision = decision
+        node.root = path
+
+    def _match(self, path: str) -> Tuple[str, Optional[str]]:
+        # Only cache misses get here, so timing them costs nothing on hits
+        if not METRICS.enabled:
+            return self._walk(path)
+        began = time.perf_counter()
+        try:
+            return self._walk(path)
+        finally:
+            METRICS.observe("policy_classify_seconds", time.perf_counter() - began)
+
+    def _walk(self, path: str) -> Tuple[str, Optional[str]]:
+        parts = split_path(path)
+        if self._exclude_re is not None:
+            normalized = os.path.normcase(os.path.abspath(path))
+            if self._exclude_re.match(normalized) or self._exclude_re.match(parts[-1]):
+                return EXCLUDED, None
+
+        node = self._trie
+        decision, root = OUTSIDE, None
+        for part in parts:
+            node = node.children.get(part)
+            if node is None:
+                break
+            if node.decision is not None:
+                decision, root = node.decision, node.root
+        return decision, root
+
+    def decide(self, path: str) -> str:
+        """Return the decision for a single path."""
+        try:
+            return self._cached(path)[0]
+        except (TypeError, ValueError):
+            return OUTSIDE
+
+    def classify(self, paths: Iterable[str]) -> List[str]:
+        """Return the decision for each path, in order."""
+        return [self.decide(path) for path in paths]
+
+    def is_protected(self, path: str) -> bool:
+        return self.decide(path) == PROTECTED
+
+    def filter_protected(self, paths: Iterable[str]) -> List[str]:
+        """Return only the protected paths, in order."""
+        return [path for path in paths if self.decide(path) == PROTECTED]
+
+    def root_for(self, path: str) -> Optional[str]:
+        """Return the protected root containing a path, if any."""
+        try:
+            decision, root = self._cached(path)
+        except (TypeError, ValueError):
+            return None
+        return root if decision == PROTECTED else None
+
+    def cache_info(self):
+        return self._cached.cache_info()
+
+    def clear_cache(self) -> None:
+        self._cached.cache_clear()
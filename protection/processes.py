@@ -0,0 +1,305 @@
+"""Which process is in front, and which one wrote a file.
+
+Window titles are easy to spoof: any window can call itself "explorer".
+A ``ProcessProvider`` reports what the operating system knows about a
+process instead: its executable, its parent and when it started. The
+backend supplies one (``Backend.processes``), the foreground backend
+reports the PID of the window in front, and providers that can tell which
+process wrote a file report that too.
+
+``ProcessCache`` keeps what a provider returned for a short time, so
+checking the process behind every event costs a dictionary lookup. Where
+the provider can watch for a process to exit, its entry is dropped as soon
+as it does, so a PID that is reused never inherits an old answer. The
+writer of a file is looked up the moment the write is reported, and kept
+with the file, since the writer has usually exited by the time the file
+is judged.
+"""
+from __future__ import annotations
+
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from protection.dedup import normalize_path
+from protection.metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+# Seconds a process's details are trusted; this also bounds how long an
+# exec into another program goes unnoticed
+DEFAULT_PROCESS_TTL: float = 2.0
+DEFAULT_MAX_ENTRIES: int = 256
+# Files whose writer is remembered
+DEFAULT_MAX_WRITERS: int = 10_000
+# Ancestors followed when matching a process's parents
+MAX_CHAIN_DEPTH: int = 16
+
+
+class ProcessInfo(NamedTuple):
+    pid: int
+    ppid: int
+    # Executable file name, e.g. "explorer.exe"; the process name where the
+    # executable cannot be read
+    name: str
+    # Full executable path, or "" where it cannot be read
+    exe: str
+    # Start time in the provider's own units; tells a reused PID apart
+    started: float = 0.0
+
+
+def describe(chain: List[ProcessInfo]) -> str:
+    """Return a process and its parents for logs, e.g. "cp[812] < bash[640]"."""
+    return " < ".join(f"{info.name}[{info.pid}]" for info in chain)
+
+
+def matches(info: ProcessInfo, names: Iterable[str]) -> bool:
+    """True if a process is one of names: file names match the executable's
+    name, and paths its full path, both ignoring case."""
+    name, exe = info.name.lower(), os.path.normcase(info.exe)
+    for entry in names:
+        entry = entry.lower()
+        if os.sep in entry or (os.altsep and os.altsep in entry):
+            if exe and os.path.normcase(entry) == exe:
+                return True
+        elif entry == name:
+            return True
+    return False
+
+
+class ProcessProvider:
+    """Platform access to process details."""
+
+    def info(self, pid: int) -> Optional[ProcessInfo]:
+        """Return a running process's details, or None if it is gone or hidden."""
+        raise NotImplementedError
+
+    def watch_exit(self, pid: int, callback: Callable[[int], Any]) -> bool:
+        """Call callback(pid) once the process exits; False if exits cannot be watched."""
+        return False
+
+    def unwatch_exit(self, pid: int) -> None:
+        pass
+
+    def watch_writes(self, paths: Iterable[str], callback: Callable[[str, int], Any]) -> bool:
+        """Call callback(path, pid) as soon as a process writes a file under paths.
+
+        Calling again replaces the paths. False if writes cannot be watched.
+        """
+        return False
+
+    def stop(self) -> None:
+        pass
+
+
+class ProcessCache:
+    """Process details by PID, kept for ``ttl`` seconds or until the process exits.
+
+    Lookups of a cached PID take no lock and make no system call. Entries
+    for processes that are gone are not kept, and the cache holds at most
+    max_entries processes, dropping the oldest first. Once ``watch_writes``
+    is on, the last writer of up to max_writers files is kept as well.
+    """
+
+    def __init__(self, provider: ProcessProvider, ttl: float = DEFAULT_PROCESS_TTL,
+                 max_entries: int = DEFAULT_MAX_ENTRIES, max_writers: int = DEFAULT_MAX_WRITERS) -> None:
+        self.provider = provider
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_writers = max_writers
+        self._entries: Dict[int, Tuple[ProcessInfo, float]] = {}
+        self._writers: "OrderedDict[str, List[ProcessInfo]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, pid: int) -> Optional[ProcessInfo]:
+        entry = self._entries.get(pid)
+        if entry is not None and entry[1] > time.monotonic():
+            METRICS.incr("process_lookups_total", result="hit")
+            return entry[0]
+        try:
+            info = self.provider.info(pid)
+        except Exception as e:
+            logger.debug("Cannot look up process %d: %s", pid, str(e))
+            info = None
+        if info is None:
+            METRICS.incr("process_lookups_total", result="gone")
+            self.invalidate(pid)
+            return None
+        METRICS.incr("process_lookups_total", result="miss")
+        with self._lock:
+            if pid not in self._entries:
+                while len(self._entries) >= self.max_entries:
+                    oldest = next(iter(self._entries))
+                    del self._entries[oldest]
+                    self.provider.unwatch_exit(oldest)
+                self.provider.watch_exit(pid, self.invalidate)
+            self._entries[pid] = (info, time.monotonic() + self.ttl)
+        return info
+
+    def chain(self, pid: int, depth: int = MAX_CHAIN_DEPTH) -> List[ProcessInfo]:
+        """Return a process followed by its parents, as far as they can be seen."""
+        chain: List[ProcessInfo] = []
+        seen = set()
+        while pid and pid not in seen and len(chain) < depth:
+            seen.add(pid)
+            info = self.get(pid)
+            if info is None:
+                break
+            chain.append(info)
+            pid = info.ppid
+        return chain
+
+    def watch_writes(self, paths: Iterable[str]) -> bool:
+        """Start noting who writes files under paths; False if the provider cannot."""
+        return self.provider.watch_writes(paths, self._wrote)
+
+    def writer_chain(self, path: str) -> List[ProcessInfo]:
+        """Return the process that last wrote path and its parents, or [] if unknown.
+
+        These are the processes as they were at the time of the write, even
+        if they have exited since.
+        """
+        with self._lock:
+            return self._writers.get(normalize_path(path), [])
+
+    def _wrote(self, path: str, pid: int) -> None:
+        # Looked up now, while the writer is most likely still running
+        chain = self.chain(pid)
+        key = normalize_path(path)
+        with self._lock:
+            if not chain:
+                # Gone already; an older writer must not be blamed instead
+                self._writers.pop(key, None)
+                return
+            self._writers[key] = chain
+            self._writers.move_to_end(key)
+            while len(self._writers) > self.max_writers:
+                self._writers.popitem(last=False)
+
+    def invalidate(self, pid: int) -> None:
+        with self._lock:
+            if self._entries.pop(pid, None) is not None:
+                self.provider.unwatch_exit(pid)
+
+    def stop(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._writers.clear()
+        self.provider.stop()
+
+
+class Win32ProcessProvider(ProcessProvider):
+    """Process details through the Toolhelp snapshot and the process's own handle.
+
+    Exits are not watched; entries expire with the cache's ttl. Which
+    process wrote a file is not known on Windows without a file system
+    filter driver, so writes are not watched.
+    """
+
+    def __init__(self) -> None:
+        import ctypes
+        from ctypes import wintypes
+
+        class PROCESSENTRY32W(ctypes.Structure):
+            _fields_ = [
+                ("dwSize", wintypes.DWORD), ("cntUsage", wintypes.DWORD),
+                ("th32ProcessID", wintypes.DWORD), ("th32DefaultHeapID", ctypes.c_size_t),
+                ("th32ModuleID", wintypes.DWORD), ("cntThreads", wintypes.DWORD),
+                ("th32ParentProcessID", wintypes.DWORD), ("pcPriClassBase", ctypes.c_long),
+                ("dwFlags", wintypes.DWORD), ("szExeFile", ctypes.c_wchar * 260),
+            ]
+
+        self._ctypes = ctypes
+        self._entry_type = PROCESSENTRY32W
+        self._kernel32 = ctypes.WinDLL("kernel32", use_last_error=True)
+        self._kernel32.CreateToolhelp32Snapshot.restype = wintypes.HANDLE
+        self._kernel32.OpenProcess.restype = wintypes.HANDLE
+
+    def info(self, pid: int) -> Optional[ProcessInfo]:
+        parent_and_name = self._snapshot_entry(pid)
+        if parent_and_name is None:
+            return None
+        ppid, name = parent_and_name
+        exe, started = self._image_and_start(pid)
+        return ProcessInfo(pid, ppid, name, exe, started)
+
+    def _snapshot_entry(self, pid: int) -> Optional[Tuple[int, str]]:
+        ctypes, kernel32 = self._ctypes, self._kernel32
+        snapshot = kernel32.CreateToolhelp32Snapshot(0x2, 0)  # TH32CS_SNAPPROCESS
+        if not snapshot or snapshot == ctypes.c_void_p(-1).value:
+            return None
+        try:
+            entry = self._entry_type()
+            entry.dwSize = ctypes.sizeof(entry)
+            more = kernel32.Process32FirstW(snapshot, ctypes.byref(entry))
+            while more:
+                if entry.th32ProcessID == pid:
+                    return entry.th32ParentProcessID, entry.szExeFile
+                more = kernel32.Process32NextW(snapshot, ctypes.byref(entry))
+        finally:
+            kernel32.CloseHandle(snapshot)
+        return None
+
+    def _image_and_start(self, pid: int) -> Tuple[str, float]:
+        ctypes, kernel32 = self._ctypes, self._kernel32
+        handle = kernel32.OpenProcess(0x1000, False, pid)  # PROCESS_QUERY_LIMITED_INFORMATION
+        if not handle:
+            return "", 0.0
+        try:
+            buffer = ctypes.create_unicode_buffer(32768)
+            size = ctypes.c_ulong(len(buffer))
+            exe = buffer.value if kernel32.QueryFullProcessImageNameW(handle, 0, buffer, ctypes.byref(size)) else ""
+            times = [ctypes.c_ulonglong() for _ in range(4)]
+            started = 0.0
+            if kernel32.GetProcessTimes(handle, *(ctypes.byref(t) for t in times)):
+                started = float(times[0].value)
+            return exe, started
+        finally:
+            kernel32.CloseHandle(handle)
+
+
+class FakeProcessProvider(ProcessProvider):
+    """Processes that exist only because a test added them."""
+
+    def __init__(self) -> None:
+        self.processes: Dict[int, ProcessInfo] = {}
+        self.lookups: int = 0
+        self._exit_callbacks: Dict[int, Callable[[int], Any]] = {}
+        self._on_write: Optional[Callable[[str, int], Any]] = None
+
+    def add(self, pid: int, name: str, ppid: int = 0, exe: str = "") -> ProcessInfo:
+        info = self.processes[pid] = ProcessInfo(pid, ppid, name, exe, time.time())
+        return info
+
+    def exit(self, pid: int) -> None:
+        """End a process, telling whoever watches it."""
+        self.processes.pop(pid, None)
+        callback = self._exit_callbacks.pop(pid, None)
+        if callback is not None:
+            callback(pid)
+
+    def set_writer(self, path: str, pid: int) -> None:
+        """Report that a process wrote path, if writes are watched."""
+        if self._on_write is not None:
+            self._on_write(path, pid)
+
+    def info(self, pid: int) -> Optional[ProcessInfo]:
+        self.lookups += 1
+        return self.processes.get(pid)
+
+    def watch_exit(self, pid: int, callback: Callable[[int], Any]) -> bool:
+        self._exit_callbacks[pid] = callback
+        return True
+
+    def unwatch_exit(self, pid: int) -> None:
+        self._exit_callbacks.pop(pid, None)
+
+    def watch_writes(self, paths: Iterable[str], callback: Callable[[str, int], Any]) -> bool:
+        self._on_write = callback
+        return True
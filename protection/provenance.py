@@ -0,0 +1,421 @@
+from __future__ import annotations
+
+import os
+import hashlib
+import logging
+import threading
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from protection.metrics import METRICS
+from protection.similarity import SimilarityIndex
+
+logger = logging.getLogger(__name__)
+
+# Number of bytes hashed from the head and the tail of each file
+FINGERPRINT_SAMPLE_SIZE: int = 64 * 1024
+
+Key = Tuple[str, int, str]
+
+# (normalized path, size, digest, head digest or None, mtime in ns, similarity sketch or None)
+Entry = Tuple[str, int, str, Optional[str], int, Optional[bytes]]
+
+
+def fingerprint_with_head(path: str, sample_size: int = FINGERPRINT_SAMPLE_SIZE) -> Tuple[int, str, Optional[str]]:
+    """Return (size, digest, head digest) of a file, hashing only its head and tail.
+
+    The head digest covers the first sample_size bytes only, so it can be
+    compared while a copy of the file is still being written. It is None for
+    files shorter than that.
+    """
+    size = os.path.getsize(path)
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(size.to_bytes(8, "little"))
+    with open(path, "rb") as handle:
+        first = handle.read(sample_size)
+        digest.update(first)
+        if size > 2 * sample_size:
+            handle.seek(size - sample_size)
+            digest.update(handle.read(sample_size))
+        elif size > sample_size:
+            digest.update(handle.read())
+    head = None
+    if len(first) == sample_size:
+        head = hashlib.blake2b(first, digest_size=16).hexdigest()
+    return size, digest.hexdigest(), head
+
+
+def fingerprint_file(path: str, sample_size: int = FINGERPRINT_SAMPLE_SIZE) -> Tuple[int, str]:
+    """Return (size, digest) of a file, hashing only its head and tail."""
+    size, digest, _head = fingerprint_with_head(path, sample_size)
+    return size, digest
+
+
+def head_digest(path: str, sample_size: int = FINGERPRINT_SAMPLE_SIZE) -> Optional[str]:
+    """Return the digest of a file's first sample_size bytes, or None if it is shorter."""
+    with open(path, "rb") as handle:
+        first = handle.read(sample_size)
+    if len(first) < sample_size:
+        return None
+    return hashlib.blake2b(first, digest_size=16).hexdigest()
+
+
+class ProvenanceIndex:
+    """Index of the files under one or more roots, keyed by basename, size and content fingerprint.
+
+    The index is built once at startup and then kept current from filesystem
+    events, so checking whether a file came from a root is a dictionary
+    lookup instead of a walk of the whole tree.
+
+    With a similarity index, files are also matched by content alone, so
+    renamed copies are caught, and by their similarity sketch, so copies
+    that were lightly edited are caught too.
+    """
+
+    def __init__(self, *roots: str, similarity: Optional[SimilarityIndex] = None) -> None:
+        self.roots: List[str] = [os.path.abspath(root) for root in roots]
+        self._lock = threading.Lock()
+        self._entries: Dict[Key, Set[str]] = {}
+        self._by_path: Dict[str, Key] = {}
+        self._name_sizes: Dict[Tuple[str, int], int] = {}
+        self._heads: Dict[Tuple[str, str], int] = {}
+        self._head_by_path: Dict[str, str] = {}
+        self._mtimes: Dict[str, int] = {}
+        self._contents: Dict[Tuple[int, str], int] = {}
+        self._sizes: Dict[int, int] = {}
+        # Directory -> its entries that lead to indexed files, so removing or
+        # moving a directory only visits the files below it
+        self._children: Dict[str, Set[str]] = {}
+        self.similarity = similarity
+        # Bumped on every change, so savers can tell whether anything changed
+        self.version: int = 0
+
+    def __len__(self) -> int:
+        return len(self._by_path)
+
+    @staticmethod
+    def _name(path: str) -> str:
+        return os.path.normcase(os.path.basename(path))
+
+    @staticmethod
+    def _normalize(path: str) -> str:
+        return os.path.normcase(os.path.abspath(path))
+
+    def build(self, **scan_options) -> None:
+        """Scan each root once and index every file found.
+
+        The scan runs in parallel (see ``protection.scanner.BulkScanner``,
+        which takes the options); files become visible in the index batch by
+        batch while it runs.
+        """
+        from protection.scanner import BulkScanner
+        logger.info("Building provenance index for %s", ", ".join(self.roots))
+        BulkScanner(self, **scan_options).run()
+        logger.info("Provenance index ready: %d files", len(self))
+
+    def add(self, path: str) -> None:
+        """Index or re-index a file under a root."""
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns
+            size, digest, head = fingerprint_with_head(path)
+            sketch = self.similarity.sketcher.sketch(path) if self.similarity is not None else None
+        except OSError:
+            return
+        self.add_entry(path, size, digest, head, mtime_ns, sketch)
+
+    def add_entry(self, path: str, size: int, digest: str, head: Optional[str] = None,
+                  mtime_ns: int = 0, sketch: Optional[bytes] = None) -> None:
+        """Index a file whose fingerprint has already been computed."""
+        with self._lock:
+            self._insert(self._normalize(path), size, digest, head, mtime_ns, sketch)
+
+    def add_entries(self, entries: Iterable[Entry]) -> None:
+        """Index many already-normalized entries, e.g. from a snapshot, in one go."""
+        with self._lock:
+            for normalized, size, digest, head, mtime_ns, sketch in entries:
+                self._insert(normalized, size, digest, head, mtime_ns, sketch)
+
+    def indexed_mtimes(self, paths: Iterable[str]) -> List[Optional[int]]:
+        """Return the mtime each already-normalized path was indexed with, or None."""
+        with self._lock:
+            return [self._mtimes.get(normalized) for normalized in paths]
+
+    def add_scanned(self, entries: Iterable[Entry], indexed: Iterable[Optional[int]]) -> int:
+        """Index entries read by a scan unless their path changed in the index meanwhile.
+
+        indexed holds what ``indexed_mtimes`` returned for each path before
+        the scan read it. A path indexed or removed since then has newer
+        information than the scan, so its entry is skipped. Returns how
+        many entries were indexed.
+        """
+        added = 0
+        with self._lock:
+            for entry, before in zip(entries, indexed):
+                if self._mtimes.get(entry[0]) != before:
+                    continue
+                self._insert(*entry)
+                added += 1
+        return added
+
+    def entries(self) -> Iterator[Entry]:
+        """Yield every indexed file; the index may change while this runs."""
+        with self._lock:
+            paths = list(self._by_path.items())
+        for normalized, key in paths:
+            yield (normalized, key[1], key[2], self._head_by_path.get(normalized),
+                   self._mtimes.get(normalized, 0), self.sketch_of(normalized))
+
+    def lookup_keys(self) -> Tuple[List[Tuple[str, int]], List[Key], List[Tuple[int, str]],
+                                   List[int], List[Tuple[str, str]]]:
+        """Return every key ``contains`` and ``match_head`` look up.
+
+        These are (name, size), (name, size, digest), (size, digest), size
+        and (name, head digest), as used by ``protection.shared_index`` to
+        publish the index to other processes.
+        """
+        with self._lock:
+            return (list(self._name_sizes), list(self._entries), list(self._contents),
+                    list(self._sizes), list(self._heads))
+
+    def sketch_of(self, normalized: str) -> Optional[bytes]:
+        """Return the similarity sketch of an indexed file, if it has one."""
+        return self.similarity.get(normalized) if self.similarity is not None else None
+
+    def _insert(self, normalized: str, size: int, digest: str, head: Optional[str],
+                mtime_ns: int, sketch: Optional[bytes] = None) -> None:
+        key = (os.path.basename(normalized), size, digest)
+        self._discard(normalized)
+        self._entries.setdefault(key, set()).add(normalized)
+        self._by_path[normalized] = key
+        self._link(normalized)
+        self._mtimes[normalized] = mtime_ns
+        name_size = (key[0], key[1])
+        self._name_sizes[name_size] = self._name_sizes.get(name_size, 0) + 1
+        self._contents[(size, digest)] = self._contents.get((size, digest), 0) + 1
+        self._sizes[size] = self._sizes.get(size, 0) + 1
+        if head is not None:
+            self._head_by_path[normalized] = head
+            name_head = (key[0], head)
+            self._heads[name_head] = self._heads.get(name_head, 0) + 1
+        if sketch is not None and self.similarity is not None:
+            self.similarity.add(normalized, sketch)
+        self.version += 1
+
+    def reconcile(self, **scan_options) -> Tuple[int, int]:
+        """Bring an index loaded from a snapshot up to date with the disk.
+
+        Each root is listed once and every file's size and mtime compared
+        with the index; only new or changed files are read and fingerprinted.
+        Files indexed at the start that are no longer found are dropped.
+        Returns (files re-indexed, files dropped).
+        """
+        from protection.scanner import BulkScanner
+        result = BulkScanner(self, changed_only=True, **scan_options).run()
+        logger.info("Provenance index reconciled: %d re-indexed, %d dropped",
+                    result.fingerprinted, result.dropped)
+        return result.fingerprinted, result.dropped
+
+    def is_current(self, normalized: str, size: int, mtime_ns: int) -> bool:
+        """Check whether an indexed file still has the given size and mtime.
+
+        A file that should have a similarity sketch but has none, e.g. after
+        loading a snapshot taken without similarity matching, is not current.
+        """
+        with self._lock:
+            key = self._by_path.get(normalized)
+            if key is None or key[1] != size or self._mtimes.get(normalized) != mtime_ns:
+                return False
+        if self.similarity is not None and size >= self.similarity.min_size:
+            return self.similarity.get(normalized) is not None
+        return True
+
+    def set_roots(self, roots: Iterable[str]) -> Tuple[List[str], List[str]]:
+        """Change the indexed roots; return (roots added, roots removed).
+
+        Files under removed roots are dropped at once. Added roots start out
+        empty; scan them (``BulkScanner(index, roots=added)``) to index them.
+        """
+        roots = [os.path.abspath(root) for root in roots]
+        added = [root for root in roots if root not in self.roots]
+        removed = [root for root in self.roots if root not in roots]
+        self.roots = roots
+        for root in removed:
+            self.remove(root)
+        return added, removed
+
+    def discard(self, paths: Iterable[str]) -> None:
+        """Drop already-normalized paths from the index."""
+        with self._lock:
+            for normalized in paths:
+                self._discard(normalized)
+
+    def remove(self, path: str) -> None:
+        """Drop a file, or every file below a directory, from the index."""
+        normalized = self._normalize(path)
+        with self._lock:
+            if normalized in self._by_path:
+                self._discard(normalized)
+                return
+            for indexed in self._below(normalized):
+                self._discard(indexed)
+
+    def move(self, src_path: str, dest_path: str) -> None:
+        """Follow a rename of a file or directory inside a root without re-reading file content."""
+        src = self._normalize(src_path)
+        with self._lock:
+            key = self._by_path.get(src)
+            head = self._head_by_path.get(src)
+            mtime_ns = self._mtimes.get(src, 0)
+            sketch = self.sketch_of(src)
+            if key is None and self._move_tree(src, self._normalize(dest_path)):
+                return
+        if key is None:
+            self.remove(src_path)
+            self.add(dest_path)
+            return
+        self.remove(src_path)
+        self.add_entry(dest_path, key[1], key[2], head, mtime_ns, sketch)
+
+    def contains(self, file_path: str) -> bool:
+        """Check whether a file is a copy of a file in a root.
+
+        A copy has the same name and content as a root file or, with a
+        similarity index, the same content under any name or content similar
+        enough to a root file's. Files whose size rules out all of these are
+        not read.
+        """
+        try:
+            size = os.path.getsize(file_path)
+        except OSError:
+            return False
+        name = self._name(file_path)
+        similar = self.similarity is not None and size >= self.similarity.min_size
+        with self._lock:
+            named = (name, size) in self._name_sizes
+            sized = self.similarity is not None and size in self._sizes
+        if not (named or sized or similar):
+            return False
+        if named or sized:
+            try:
+                size, digest = fingerprint_file(file_path)
+            except OSError:
+                return False
+            if named and self.lookup(name, size, digest) is not None:
+                return True
+            with self._lock:
+                renamed = sized and (size, digest) in self._contents
+            if renamed:
+                METRICS.incr("provenance_matches_total", kind="renamed")
+                return True
+        if similar:
+            try:
+                match = self.similarity.match(file_path)
+            except OSError:
+                return False
+            if match is not None:
+                logger.info("%s is %.0f%% similar to %s", file_path, match[1] * 100, match[0])
+                METRICS.incr("provenance_matches_total", kind="similar")
+                return True
+        return False
+
+    def match_head(self, name: str, head: str) -> bool:
+        """Check whether a root file with this name starts with the given head digest."""
+        with self._lock:
+            return (os.path.normcase(name), head) in self._heads
+
+    def lookup(self, name: str, size: int, digest: str) -> Optional[str]:
+        """Return one root path matching the given key, if any."""
+        with self._lock:
+            matches = self._entries.get((os.path.normcase(name), size, digest))
+            return next(iter(matches)) if matches else None
+
+    def _move_tree(self, src: str, dest: str) -> bool:
+        # Basenames do not change, so only the paths need re-keying
+        prefix = src.rstrip(os.sep) + os.sep
+        moved = self._below(src)
+        for old in moved:
+            new = dest.rstrip(os.sep) + os.sep + old[len(prefix):]
+            key = self._by_path.pop(old)
+            matches = self._entries[key]
+            matches.discard(old)
+            matches.add(new)
+            self._by_path[new] = key
+            self._unlink(old)
+            self._link(new)
+            head = self._head_by_path.pop(old, None)
+            if head is not None:
+                self._head_by_path[new] = head
+            self._mtimes[new] = self._mtimes.pop(old, 0)
+            if self.similarity is not None:
+                self.similarity.move(old, new)
+        if moved:
+            self.version += 1
+        return bool(moved)
+
+    def _below(self, directory: str) -> List[str]:
+        # Every indexed file below a directory, found without looking at the rest
+        found = []
+        pending = [directory]
+        while pending:
+            for child in self._children.get(pending.pop(), ()):
+                if child in self._by_path:
+                    found.append(child)
+                if child in self._children:
+                    pending.append(child)
+        return found
+
+    def _link(self, normalized: str) -> None:
+        child, parent = normalized, os.path.dirname(normalized)
+        while parent != child:
+            siblings = self._children.get(parent)
+            if siblings is not None:
+                siblings.add(child)
+                return
+            self._children[parent] = {child}
+            child, parent = parent, os.path.dirname(parent)
+
+    def _unlink(self, normalized: str) -> None:
+        child, parent = normalized, os.path.dirname(normalized)
+        while parent != child:
+            siblings = self._children.get(parent)
+            if siblings is None or child in self._by_path or child in self._children:
+                return
+            siblings.discard(child)
+            if siblings:
+                return
+            del self._children[parent]
+            child, parent = parent, os.path.dirname(parent)
+
+    def _discard(self, normalized: str) -> None:
+        key = self._by_path.pop(normalized, None)
+        if key is None:
+            return
+        self._unlink(normalized)
+        self._mtimes.pop(normalized, None)
+        if self.similarity is not None:
+            self.similarity.discard(normalized)
+        self.version += 1
+        matches = self._entries.get(key)
+        if matches is not None:
+            matches.discard(normalized)
+            if not matches:
+                del self._entries[key]
+        name_size = (key[0], key[1])
+        remaining = self._name_sizes.get(name_size, 0) - 1
+        if remaining > 0:
+            self._name_sizes[name_size] = remaining
+        else:
+            self._name_sizes.pop(name_size, None)
+        for counts, count_key in ((self._contents, (key[1], key[2])), (self._sizes, key[1])):
+            remaining = counts.get(count_key, 0) - 1
+            if remaining > 0:
+                counts[count_key] = remaining
+            else:
+                counts.pop(count_key, None)
+        head = self._head_by_path.pop(normalized, None)
+        if head is not None:
+            name_head = (key[0], head)
+            remaining = self._heads.get(name_head, 0) - 1
+            if remaining > 0:
+                self._heads[name_head] = remaining
+            else:
+                self._heads.pop(name_head, None)
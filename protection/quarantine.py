@@ -0,0 +1,310 @@
+"""Recoverable storage for blocked files.
+
+Blocked files are moved into a quarantine directory instead of being deleted,
+and recorded in an index so they can be listed and restored later, one at a
+time or in a batch. Run ``python -m protection.quarantine --help`` to manage
+the quarantine from the command line.
+"""
+from __future__ import annotations
+
+import os
+import sys
+import json
+import time
+import uuid
+import getpass
+import shutil
+import logging
+import argparse
+import threading
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from protection.dedup import normalize_path
+from protection.metrics import METRICS
+from protection.provenance import fingerprint_file
+from protection.transfer import move_path
+
+logger = logging.getLogger(__name__)
+
+# What to do with a blocked file
+ACTION_DELETE: str = "delete"
+ACTION_QUARANTINE: str = "quarantine"
+
+INDEX_NAME: str = "index.jsonl"
+
+
+def default_data_dir() -> str:
+    """Per-user directory for state kept between runs."""
+    base = os.environ.get("LOCALAPPDATA") or os.environ.get("XDG_DATA_HOME") or os.path.join(
+        os.path.expanduser("~"), ".local", "share"
+    )
+    return os.path.join(base, "FileRestrictor")
+
+
+def default_quarantine_dir() -> str:
+    """Per-user quarantine directory."""
+    return os.path.join(default_data_dir(), "quarantine")
+
+
+def quarantine_dir_candidates() -> List[str]:
+    """Return where the quarantine may go, per-user directory first, then machine-wide."""
+    if os.name == "nt":
+        shared = os.path.join(os.environ.get("ProgramData", r"C:\ProgramData"), "FileRestrictor")
+    else:
+        shared = os.path.join("/var/tmp", "FileRestrictor")
+    return [default_quarantine_dir(), os.path.join(shared, f"quarantine-{getpass.getuser()}")]
+
+
+def select_quarantine_dir(is_protected: Callable[[str], bool], configured: str = "") -> str:
+    """Return the quarantine directory to use, which is never inside a protected root.
+
+    Files kept inside a root would count as root files again, so a
+    configured directory there is refused with ValueError. Without one,
+    the first candidate outside the roots is used, e.g. the machine-wide
+    one when the user's profile is protected.
+    """
+    if configured:
+        if is_protected(configured):
+            raise ValueError(f"Quarantine directory {configured} is inside a protected folder")
+        return configured
+    for candidate in quarantine_dir_candidates():
+        if not is_protected(candidate):
+            if candidate != default_quarantine_dir():
+                logger.warning("%s is inside a protected folder; quarantining to %s",
+                               default_quarantine_dir(), candidate)
+            return candidate
+    raise ValueError("Every quarantine directory is inside a protected folder; set quarantine_dir")
+
+
+def existing_quarantine_dir() -> str:
+    """Return the first candidate that holds a quarantine, for the command line."""
+    for candidate in quarantine_dir_candidates():
+        if os.path.exists(os.path.join(candidate, INDEX_NAME)):
+            return candidate
+    return default_quarantine_dir()
+
+
+class QuarantineItem(NamedTuple):
+    id: str
+    original: str
+    stored: str
+    size: int
+    digest: str
+    quarantined_at: float
+    reason: str
+
+
+class Quarantine:
+    """Blocked files kept under one directory with an append-only index.
+
+    ``put`` moves a file or folder in with a single rename when the
+    quarantine is on the same filesystem, and with a verified kernel copy
+    otherwise (see ``protection.transfer``). Each item is stored under its
+    own id, so files with the same name never collide. The index is one JSON
+    line per item; restoring or purging items rewrites it once per batch.
+    """
+
+    def __init__(self, directory: str) -> None:
+        self.directory: str = os.path.abspath(directory)
+        self._prefix = normalize_path(self.directory) + os.sep
+        self._lock = threading.Lock()
+        self._items: Dict[str, QuarantineItem] = {}
+        self._loaded = False
+
+    def __len__(self) -> int:
+        self._load()
+        return len(self._items)
+
+    @property
+    def index_path(self) -> str:
+        return os.path.join(self.directory, INDEX_NAME)
+
+    def holds(self, path: str) -> bool:
+        """Check whether a path is inside the quarantine directory."""
+        return normalize_path(path).startswith(self._prefix)
+
+    def _load(self) -> None:
+        if self._loaded:
+            return
+        with self._lock:
+            if self._loaded:
+                return
+            try:
+                with open(self.index_path, encoding="utf-8") as index:
+                    for line in index:
+                        if line.strip():
+                            item = QuarantineItem(**json.loads(line))
+                            self._items[item.id] = item
+            except FileNotFoundError:
+                pass
+            except (OSError, ValueError, TypeError) as e:
+                logger.error("Error reading quarantine index %s: %s", self.index_path, str(e))
+            self._loaded = True
+
+    def _rewrite(self) -> None:
+        temp = self.index_path + ".tmp"
+        with open(temp, "w", encoding="utf-8") as index:
+            for item in self._items.values():
+                index.write(json.dumps(item._asdict()) + "\n")
+        os.replace(temp, self.index_path)
+
+    def items(self) -> List[QuarantineItem]:
+        self._load()
+        with self._lock:
+            return sorted(self._items.values(), key=lambda item: item.quarantined_at)
+
+    def get(self, item_id: str) -> Optional[QuarantineItem]:
+        self._load()
+        return self._items.get(item_id)
+
+    def put(self, path: str, original: Optional[str] = None, reason: str = "") -> QuarantineItem:
+        """Move a blocked file or folder into quarantine and record it.
+
+        original is the path to restore to, if it differs from where the
+        blocked content is now, e.g. the source of a move out of a root.
+        """
+        self._load()
+        item_id = uuid.uuid4().hex
+        stored = os.path.join(self.directory, item_id, os.path.basename(path.rstrip("\\/")))
+        size, digest = 0, ""
+        if os.path.isfile(path):
+            try:
+                size, digest = fingerprint_file(path)
+            except OSError:
+                pass
+        os.makedirs(os.path.dirname(stored), exist_ok=True)
+        with METRICS.timer("quarantine_put_seconds"):
+            method = move_path(path, stored)
+        item = QuarantineItem(
+            item_id, os.path.abspath(original or path), stored, size, digest, time.time(), reason
+        )
+        with self._lock:
+            self._items[item_id] = item
+            with open(self.index_path, "a", encoding="utf-8") as index:
+                index.write(json.dumps(item._asdict()) + "\n")
+        METRICS.incr("enforcement_actions_total", action="quarantine")
+        logger.info("Quarantined %s as %s (%s)", path, item_id, method)
+        return item
+
+    def restore(self, item_id: str, destination: Optional[str] = None) -> str:
+        """Restore one item; see restore_many."""
+        restored, failed = self.restore_many([item_id], destination)
+        if failed:
+            raise OSError(f"Could not restore quarantined item {item_id}")
+        return restored[0][1]
+
+    def restore_many(
+        self,
+        item_ids: Optional[Iterable[str]] = None,
+        destination: Optional[str] = None,
+    ) -> Tuple[List[Tuple[QuarantineItem, str]], List[QuarantineItem]]:
+        """Restore items, all of them by default, in one batch.
+
+        Each item goes back to its original path, or into destination if one
+        is given. An item whose target already exists is left in quarantine.
+        Returns ([(item, restored path)], [items that failed]).
+        """
+        self._load()
+        with self._lock:
+            if item_ids is None:
+                batch = list(self._items.values())
+            else:
+                batch = [self._items[i] for i in item_ids if i in self._items]
+        # Parents before children, so restored folders exist for their contents
+        batch.sort(key=lambda item: item.original)
+
+        restored: List[Tuple[QuarantineItem, str]] = []
+        failed: List[QuarantineItem] = []
+        for item in batch:
+            target = item.original
+            if destination is not None:
+                target = os.path.join(destination, os.path.basename(item.original))
+            try:
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                move_path(item.stored, target)
+            except OSError as e:
+                logger.error("Error restoring %s to %s: %s", item.id, target, str(e))
+                failed.append(item)
+                continue
+            self._remove_stored_dir(item)
+            restored.append((item, target))
+
+        if restored:
+            with self._lock:
+                for item, _target in restored:
+                    self._items.pop(item.id, None)
+                self._rewrite()
+            METRICS.incr("quarantine_restored_total", value=len(restored))
+        return restored, failed
+
+    def purge(self, item_ids: Optional[Iterable[str]] = None) -> int:
+        """Permanently delete items, all of them by default; return how many."""
+        self._load()
+        with self._lock:
+            ids = list(self._items) if item_ids is None else [i for i in item_ids if i in self._items]
+            for item_id in ids:
+                item = self._items.pop(item_id)
+                shutil.rmtree(os.path.dirname(item.stored), ignore_errors=True)
+            if ids:
+                self._rewrite()
+        return len(ids)
+
+    def _remove_stored_dir(self, item: QuarantineItem) -> None:
+        try:
+            os.rmdir(os.path.dirname(item.stored))
+        except OSError:
+            pass
+
+
+def block(path: str, action: str, quarantine: Optional[Quarantine],
+          original: Optional[str] = None, reason: str = "") -> str:
+    """Apply the configured action to a blocked file; return what was done.
+
+    Falls back to deleting if quarantining fails, since a blocked file must
+    not stay where it is.
+    """
+    if action == ACTION_QUARANTINE and quarantine is not None:
+        try:
+            quarantine.put(path, original, reason)
+            return ACTION_QUARANTINE
+        except OSError as e:
+            logger.error("Error quarantining %s, deleting it instead: %s", path, str(e))
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    else:
+        os.remove(path)
+    METRICS.incr("enforcement_actions_total", action="delete")
+    return ACTION_DELETE
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--dir", default=existing_quarantine_dir(), help="quarantine directory")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("list", help="list quarantined items")
+    restore = commands.add_parser("restore", help="restore items to where they came from")
+    restore.add_argument("ids", nargs="*", help="item ids; all items if omitted")
+    restore.add_argument("--to", help="restore into this folder instead")
+    purge = commands.add_parser("purge", help="delete items permanently")
+    purge.add_argument("ids", nargs="*", help="item ids; all items if omitted")
+    args = parser.parse_args(argv)
+
+    quarantine = Quarantine(args.dir)
+    if args.command == "list":
+        for item in quarantine.items():
+            when = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(item.quarantined_at))
+            print(f"{item.id}  {when}  {item.size:>12}  {item.original}  {item.reason}")
+    elif args.command == "restore":
+        restored, failed = quarantine.restore_many(args.ids or None, args.to)
+        for item, target in restored:
+            print(f"restored {item.id} -> {target}")
+        for item in failed:
+            print(f"failed   {item.id} -> {item.original}", file=sys.stderr)
+        if failed:
+            sys.exit(1)
+    else:
+        print(f"purged {quarantine.purge(args.ids or None)} item(s)")
+
+
+if __name__ == "__main__":
+    main()
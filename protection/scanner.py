@@ -0,0 +1,331 @@
+from __future__ import annotations
+
+import os
+import time
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+from protection.metrics import METRICS
+from protection.provenance import (
+    FINGERPRINT_SAMPLE_SIZE,
+    Entry,
+    ProvenanceIndex,
+    fingerprint_with_head,
+)
+from protection.similarity import Sketcher
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WALKERS: int = 8
+DEFAULT_FINGERPRINT_WORKERS: int = min(4, os.cpu_count() or 1)
+DEFAULT_BATCH_SIZE: int = 256
+DEFAULT_PROGRESS_INTERVAL: float = 10.0
+
+
+class ScanProgress(NamedTuple):
+    directories: int
+    files: int
+    fingerprinted: int
+    unchanged: int
+    dropped: int
+    stale: int
+    bytes_read: int
+    errors: int
+    elapsed: float
+    done: bool
+
+    @property
+    def files_per_second(self) -> float:
+        return self.files / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def mib_per_second(self) -> float:
+        return self.bytes_read / (1024 * 1024) / self.elapsed if self.elapsed else 0.0
+
+    def __str__(self) -> str:
+        state = "done" if self.done else "scanning"
+        return (f"{state}: {self.directories} dirs, {self.files} files, "
+                f"{self.fingerprinted} fingerprinted, {self.unchanged} unchanged, "
+                f"{self.dropped} dropped, {self.stale} stale, "
+                f"{self.errors} errors in {self.elapsed:.1f}s "
+                f"({self.files_per_second:.0f} files/s, {self.mib_per_second:.1f} MiB/s)")
+
+
+class Throttle:
+    """Paces work to at most a number of files and bytes per second.
+
+    Shared by every thread of a scan; each call reserves its share of time
+    and sleeps outside the lock until that share starts. Zero disables a
+    limit.
+    """
+
+    def __init__(self, files_per_second: float = 0, bytes_per_second: float = 0) -> None:
+        self.files_per_second = files_per_second
+        self.bytes_per_second = bytes_per_second
+        self._lock = threading.Lock()
+        self._next = 0.0
+
+    def acquire(self, files: int, nbytes: int) -> None:
+        cost = 0.0
+        if self.files_per_second > 0:
+            cost = files / self.files_per_second
+        if self.bytes_per_second > 0:
+            cost = max(cost, nbytes / self.bytes_per_second)
+        if cost <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + cost
+        if start > now:
+            time.sleep(start - now)
+
+
+def _fingerprint_batch(batch: List[Tuple[str, int]],
+                       sketcher: Optional[Sketcher] = None) -> List[Optional[Entry]]:
+    """Fingerprint, and sketch if asked to, (path, mtime) pairs; runs in a pool worker."""
+    results: List[Optional[Entry]] = []
+    for path, mtime_ns in batch:
+        try:
+            size, digest, head = fingerprint_with_head(path)
+            sketch = sketcher.sketch(path) if sketcher is not None else None
+        except OSError:
+            results.append(None)
+            continue
+        results.append((os.path.normcase(os.path.abspath(path)), size, digest, head, mtime_ns, sketch))
+    return results
+
+
+class BulkScanner:
+    """Inventories and fingerprints the roots of an index in parallel.
+
+    Directory listing is spread over a pool of walker threads that share a
+    queue of directories, each listed once with ``os.scandir``. Files are
+    handed to a process pool in batches to be fingerprinted, and each batch
+    is added to the index as soon as it is done, so lookups see partial
+    results while the scan is still running. A file indexed or removed by
+    an event after its batch was handed out keeps what the event left. If the index has a similarity
+    index, files are sketched in the same pass. In-flight batches are bounded,
+    and an optional throttle caps files and bytes read per second.
+
+    With ``changed_only`` the scan reconciles instead: files whose size and
+    mtime match the index are not read, and files that were indexed when
+    the scan started but are no longer found are dropped.
+
+    ``roots`` limits the scan to some of the index's roots, e.g. ones just
+    added to it.
+    """
+
+    def __init__(
+        self,
+        index: ProvenanceIndex,
+        walkers: int = DEFAULT_WALKERS,
+        fingerprint_workers: int = DEFAULT_FINGERPRINT_WORKERS,
+        use_processes: bool = True,
+        files_per_second: float = 0,
+        bytes_per_second: float = 0,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        changed_only: bool = False,
+        progress: Optional[Callable[[ScanProgress], None]] = None,
+        progress_interval: float = DEFAULT_PROGRESS_INTERVAL,
+        roots: Optional[Iterable[str]] = None,
+    ) -> None:
+        self.index = index
+        self.roots = list(roots) if roots is not None else None
+        self.walkers = max(1, walkers)
+        self.fingerprint_workers = max(1, fingerprint_workers)
+        self.use_processes = use_processes
+        self.throttle = Throttle(files_per_second, bytes_per_second)
+        self.batch_size = batch_size
+        self.changed_only = changed_only
+        self.progress = progress if progress is not None else self._log_progress
+        self.progress_interval = progress_interval
+        self._sketcher = index.similarity.sketcher if index.similarity is not None else None
+
+        self._lock = threading.Lock()
+        self._work = threading.Condition(self._lock)
+        self._directories: List[str] = []
+        self._open = 0
+        self._cancelled = threading.Event()
+        self._finished = threading.Event()
+        self._in_flight = threading.BoundedSemaphore(self.fingerprint_workers * 4)
+        self._seen: Set[str] = set()
+        self._started = 0.0
+        self._counts = {
+            "directories": 0, "files": 0, "fingerprinted": 0,
+            "unchanged": 0, "dropped": 0, "stale": 0, "bytes_read": 0, "errors": 0,
+        }
+        self._thread: Optional[threading.Thread] = None
+        self.result: Optional[ScanProgress] = None
+
+    @staticmethod
+    def _log_progress(progress: ScanProgress) -> None:
+        logger.info("Root scan %s", progress)
+
+    def snapshot(self, done: bool = False) -> ScanProgress:
+        with self._lock:
+            counts = dict(self._counts)
+        return ScanProgress(elapsed=time.monotonic() - self._started, done=done, **counts)
+
+    def start(self) -> None:
+        """Run the scan on a background thread."""
+        self._thread = threading.Thread(target=self.run, name="bulk-scan", daemon=True)
+        self._thread.start()
+
+    def wait(self, timeout: Optional[float] = None) -> Optional[ScanProgress]:
+        if self._thread is not None:
+            self._thread.join(timeout)
+        return self.result
+
+    def stop(self) -> None:
+        """Cancel a background scan and wait for work in flight to finish."""
+        self.cancel()
+        self.wait()
+
+    def cancel(self) -> None:
+        self._cancelled.set()
+        self._finished.set()
+        with self._work:
+            self._work.notify_all()
+
+    def run(self) -> ScanProgress:
+        self._started = time.monotonic()
+        known = set(path for path, *_rest in self.index.entries()) if self.changed_only else set()
+        with self._work:
+            self._directories = list(self.roots if self.roots is not None else self.index.roots)
+            self._open = len(self._directories)
+            if not self._open:
+                self._finished.set()
+
+        executor = self._executor()
+        threads = [
+            threading.Thread(target=self._walk, args=(executor,), name=f"bulk-scan-{i}", daemon=True)
+            for i in range(self.walkers)
+        ]
+        for thread in threads:
+            thread.start()
+        while not self._finished.wait(self.progress_interval):
+            self.progress(self.snapshot())
+        for thread in threads:
+            thread.join()
+        executor.shutdown(wait=True)
+
+        if self.changed_only and not self._cancelled.is_set():
+            gone = known - self._seen
+            self.index.discard(gone)
+            with self._lock:
+                self._counts["dropped"] = len(gone)
+        self.result = self.snapshot(done=True)
+        self.progress(self.result)
+        METRICS.observe("scan_seconds", self.result.elapsed)
+        return self.result
+
+    def _executor(self) -> Executor:
+        if self.use_processes and self.fingerprint_workers > 1:
+            try:
+                # Forking a process that runs threads can copy a lock while it is held
+                return ProcessPoolExecutor(self.fingerprint_workers,
+                                           mp_context=multiprocessing.get_context("spawn"))
+            except (OSError, NotImplementedError, ImportError) as e:
+                logger.warning("Process pool unavailable, fingerprinting in threads: %s", str(e))
+        return ThreadPoolExecutor(self.fingerprint_workers, thread_name_prefix="fingerprint")
+
+    def _next_directory(self) -> Optional[str]:
+        with self._work:
+            while not self._directories or self._cancelled.is_set():
+                if not self._open or self._cancelled.is_set():
+                    return None
+                self._work.wait()
+            return self._directories.pop()
+
+    def _walk(self, executor: Executor) -> None:
+        batch: List[Tuple[str, int]] = []
+        batch_bytes = 0
+        while True:
+            directory = self._next_directory()
+            if directory is None:
+                break
+            subdirectories, files, found, seen = self._list(directory)
+            with self._work:
+                self._directories.extend(subdirectories)
+                # This directory is finished once its children are queued
+                self._open += len(subdirectories) - 1
+                self._counts["directories"] += 1
+                self._counts["files"] += found
+                self._counts["unchanged"] += found - len(files)
+                self._seen.update(seen)
+                if subdirectories:
+                    self._work.notify_all()
+                elif not self._open:
+                    self._finished.set()
+                    self._work.notify_all()
+            for path, size, mtime_ns in files:
+                batch.append((path, mtime_ns))
+                batch_bytes += min(size, 2 * FINGERPRINT_SAMPLE_SIZE)
+                if self._sketcher is not None and size >= self._sketcher.min_size:
+                    batch_bytes += min(size, self._sketcher.max_bytes)
+                if len(batch) >= self.batch_size:
+                    self._submit(executor, batch, batch_bytes)
+                    batch, batch_bytes = [], 0
+        if batch and not self._cancelled.is_set():
+            self._submit(executor, batch, batch_bytes)
+
+    def _list(self, directory: str) -> Tuple[List[str], List[Tuple[str, int, int]], int, List[str]]:
+        """Return (subdirectories, files to fingerprint, files found, paths seen)."""
+        subdirectories: List[str] = []
+        files: List[Tuple[str, int, int]] = []
+        seen: List[str] = []
+        found = 0
+        try:
+            scan = os.scandir(directory)
+        except OSError:
+            with self._lock:
+                self._counts["errors"] += 1
+            return subdirectories, files, found, seen
+        with scan:
+            for entry in scan:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirectories.append(entry.path)
+                        continue
+                    if not entry.is_file(follow_symlinks=False):
+                        continue
+                    st = entry.stat(follow_symlinks=False)
+                except OSError:
+                    continue
+                found += 1
+                if self.changed_only:
+                    normalized = os.path.normcase(os.path.abspath(entry.path))
+                    seen.append(normalized)
+                    if self.index.is_current(normalized, st.st_size, st.st_mtime_ns):
+                        continue
+                files.append((entry.path, st.st_size, st.st_mtime_ns))
+        return subdirectories, files, found, seen
+
+    def _submit(self, executor: Executor, batch: List[Tuple[str, int]], nbytes: int) -> None:
+        self.throttle.acquire(len(batch), nbytes)
+        self._in_flight.acquire()
+        # Taken before the files are read, so results made stale by events meanwhile are skipped
+        indexed = self.index.indexed_mtimes([os.path.normcase(os.path.abspath(path)) for path, _ in batch])
+        future = executor.submit(_fingerprint_batch, batch, self._sketcher)
+        future.add_done_callback(lambda done: self._collect(done, nbytes, indexed))
+
+    def _collect(self, future: Future, nbytes: int, indexed: List[Optional[int]]) -> None:
+        self._in_flight.release()
+        try:
+            results = future.result()
+        except Exception as e:
+            logger.error("Fingerprinting batch failed: %s", str(e))
+            with self._lock:
+                self._counts["errors"] += 1
+            return
+        read = [(entry, before) for entry, before in zip(results, indexed) if entry is not None]
+        added = self.index.add_scanned([entry for entry, _ in read], [before for _, before in read])
+        with self._lock:
+            self._counts["fingerprinted"] += added
+            self._counts["stale"] += len(read) - added
+            self._counts["errors"] += len(results) - len(read)
+            self._counts["bytes_read"] += nbytes
@@ -0,0 +1,505 @@
+"""Sharded protection: one engine process per watched volume.
+
+A single process watches every volume through one observer and decides
+every event under one GIL, so a burst on one drive delays the others. In
+shard mode (``EngineConfig.shards``, ``--shards N``) a ``Supervisor`` splits
+the watch plan by volume and runs an ``Engine`` for each group of volumes
+in its own process:
+
+- The supervisor owns the provenance index: it loads or scans it, saves
+  snapshots, and publishes it read-only to shared memory
+  (``protection.shared_index``), so shards need neither a copy nor a scan.
+- Shards send changes they see under a root back to the supervisor, which
+  applies them to the index and republishes it.
+- Shards send their audit records and metrics to the supervisor, which
+  writes the one audit log and exports every shard's metrics, labelled
+  with the shard.
+- Only the first shard guards the clipboard; the others only read it.
+- A shard that exits is started again, waiting longer after each crash.
+"""
+from __future__ import annotations
+
+import os
+import time
+import queue
+import signal
+import logging
+import threading
+import itertools
+import multiprocessing
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from protection.audit import AUDIT, start_audit
+from protection.backends import load_backend
+from protection.config import ConfigWatcher, load_config
+from protection.engine import (
+    Engine,
+    EngineConfig,
+    LOG_FORMAT,
+    TRIGGERS_NONE,
+    changed_fields,
+)
+from protection.metrics import METRICS, start_metrics
+from protection.policy import PathPolicy
+from protection.provenance import ProvenanceIndex
+from protection.shared_index import SharedProvenance, TablePublisher
+from protection.similarity import SimilarityIndex, Sketcher
+from protection.snapshot import warm_start
+from protection.watch_plan import EventFilter, WatchPlanner, default_destinations
+
+logger = logging.getLogger(__name__)
+
+# Seconds between checks for shards that have exited
+MONITOR_INTERVAL: float = 1.0
+# Longest wait before restarting a shard that keeps crashing; a shard that
+# ran at least this long starts over from a one second wait
+MAX_RESTART_DELAY: float = 60.0
+# Seconds start() waits for every shard to report that it is protecting
+START_TIMEOUT: float = 60.0
+# Seconds a shard waits for the supervisor to answer a similarity lookup
+SIMILARITY_TIMEOUT: float = 5.0
+# Seconds between the metrics snapshots each shard sends
+METRICS_INTERVAL: float = 2.0
+# Seconds a stopping shard gets to finish before it is terminated
+STOP_TIMEOUT: float = 10.0
+
+
+def volume_of(path: str) -> str:
+    """Return an identifier of the volume a path is on."""
+    path = os.path.abspath(path)
+    if os.name == "nt":
+        return os.path.splitdrive(path)[0].upper() or path
+    try:
+        return f"dev{os.stat(path).st_dev}"
+    except OSError:
+        return path
+
+
+class ShardSpec(NamedTuple):
+    name: str
+    watches: Tuple[str, ...]
+
+
+def plan_shards(config: EngineConfig, max_shards: int) -> List[ShardSpec]:
+    """Split the watch plan into at most max_shards groups of whole volumes."""
+    destinations = config.paste_destinations
+    if destinations is None:
+        destinations = tuple(default_destinations())
+    policy = PathPolicy(config.roots, config.allowed_dirs, config.exclude_patterns)
+    event_filter = EventFilter(policy, destinations=destinations)
+    plan = WatchPlanner(config.roots, destinations, event_filter).plan(estimate=False)
+    volumes: Dict[str, List[str]] = {}
+    for watch in plan.watches:
+        volumes.setdefault(volume_of(watch.path), []).append(watch.path)
+    ordered = sorted(volumes.items())
+    groups: List[List[Tuple[str, List[str]]]] = [[] for _ in range(min(max(1, max_shards), len(ordered)))]
+    # More volumes than shards: the volumes are dealt out in turn
+    for i, volume in enumerate(ordered):
+        groups[i % len(groups)].append(volume)
+    return [
+        ShardSpec("+".join(name for name, _paths in group),
+                  tuple(path for _name, paths in group for path in paths))
+        for group in groups
+    ]
+
+
+def shard_config(config: EngineConfig, spec: ShardSpec, guard: bool) -> EngineConfig:
+    """Return the settings of one shard; only the guarding shard runs clipboard triggers."""
+    return config._replace(
+        watches=spec.watches,
+        shards=0,
+        require_privileges=False,
+        trigger_mode=config.trigger_mode if guard else TRIGGERS_NONE,
+        snapshot_path="",
+        metrics_port=None,
+        metrics_json_path="",
+        audit_log_path="",
+        config_path="",
+        trace_path=_suffixed(config.trace_path, spec.name),
+    )
+
+
+def _suffixed(path: str, name: str) -> str:
+    """Return path with a shard name before its extension, so each shard writes its own file."""
+    if not path:
+        return path
+    stem, extension = os.path.splitext(path)
+    return f"{stem}-{name}{extension}"
+
+
+class Shard:
+    """The shard side: an engine plus the channels to the supervisor."""
+
+    def __init__(self, name: str, config: EngineConfig, table: Optional[str],
+                 sketcher: Optional[Sketcher], inbox: Any, outbox: Any) -> None:
+        self.name = name
+        self.config = config
+        self.table = table
+        self.sketcher = sketcher
+        self.inbox = inbox
+        self.outbox = outbox
+        self._ids = itertools.count()
+        self._waiting: Dict[int, List[Any]] = {}
+
+    def send(self, message: Tuple[Any, ...]) -> None:
+        self.outbox.put((self.name,) + message)
+
+    def similar(self, sketch: bytes) -> Optional[Tuple[str, float]]:
+        """Ask the supervisor for the closest match to a sketch."""
+        request = next(self._ids)
+        waiter: List[Any] = [threading.Event(), None]
+        self._waiting[request] = waiter
+        self.send(("similar", request, sketch))
+        if not waiter[0].wait(SIMILARITY_TIMEOUT):
+            self._waiting.pop(request, None)
+            logger.warning("No similarity answer from the supervisor within %.0fs", SIMILARITY_TIMEOUT)
+            return None
+        return waiter[1]
+
+    def run(self, metrics: bool) -> None:
+        METRICS.enabled = metrics
+        AUDIT.forward(lambda batch: self.send(("audit", batch)))
+        provenance = None
+        if self.config.check_pastes:
+            similar = self.similar if self.sketcher is not None else None
+            provenance = SharedProvenance(self.table, self.send, similar, self.sketcher)
+        engine = Engine(self.config, provenance=provenance)
+        engine.start()
+        self.send(("ready", engine.startup_seconds))
+
+        next_metrics = time.monotonic()
+        while not engine.stop_requested.is_set():
+            try:
+                message = self.inbox.get(timeout=0.5)
+            except queue.Empty:
+                message = None
+            if message is not None:
+                kind = message[0]
+                if kind == "stop":
+                    break
+                if kind == "table" and provenance is not None:
+                    try:
+                        provenance.attach(message[1])
+                    except FileNotFoundError:
+                        pass  # already replaced; the newer table is announced next
+                elif kind == "similar":
+                    waiter = self._waiting.pop(message[1], None)
+                    if waiter is not None:
+                        waiter[1] = message[2]
+                        waiter[0].set()
+                elif kind == "reload":
+                    engine.reload(message[1])
+                elif kind == "observe" and engine.handler.copies is not None:
+                    engine.handler.copies.observe(message[1])
+            if metrics and time.monotonic() >= next_metrics:
+                self.send(("metrics", METRICS.snapshot()))
+                next_metrics = time.monotonic() + METRICS_INTERVAL
+        if engine.stop_requested.is_set():
+            self.send(("quit",))  # Ctrl+Q in the guarding shard stops every shard
+        engine.stop()
+        AUDIT.stop()
+        if metrics:
+            self.send(("metrics", METRICS.snapshot()))
+        if provenance is not None:
+            provenance.close()
+
+
+def run_shard(name: str, config: EngineConfig, table: Optional[str], sketcher: Optional[Sketcher],
+              inbox: Any, outbox: Any, metrics: bool, log_level: int) -> None:
+    """Entry point of a shard process."""
+    # Ctrl+C reaches every process; the supervisor stops the shards in order
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    logging.basicConfig(level=log_level, format=LOG_FORMAT.replace("%(message)s", f"[{name}] %(message)s"))
+    Shard(name, config, table, sketcher, inbox, outbox).run(metrics)
+
+
+class ShardProcess:
+    """The supervisor side of one shard."""
+
+    def __init__(self, spec: ShardSpec, config: EngineConfig, guard: bool) -> None:
+        self.spec = spec
+        self.config = config
+        self.guard = guard
+        self.process: Any = None
+        self.inbox: Any = None
+        self.ready = threading.Event()
+        self.started_at = 0.0
+        self.crashes = 0
+        self.restart_at: Optional[float] = None
+        self.metrics: Optional[Dict[str, object]] = None
+
+
+class Supervisor:
+    """Runs the engine in shard processes, restarts them, and owns what they share.
+
+    Used like an ``Engine``: ``start``, ``run``, ``stop``, ``reload`` and
+    ``wait_indexed`` behave the same, with ``startup_seconds`` covering the
+    time until every shard is protecting.
+    """
+
+    def __init__(self, config: EngineConfig) -> None:
+        self.config = config
+        self.provenance: Optional[ProvenanceIndex] = None
+        self.startup_seconds: Optional[float] = None
+        self.protected = threading.Event()
+        self.stop_requested = threading.Event()
+        self.shards: Dict[str, ShardProcess] = {}
+        self._context = multiprocessing.get_context("spawn")
+        self._outbox: Any = self._context.Queue()
+        self._publisher: Optional[TablePublisher] = None
+        self._scan: Any = None
+        self._services: List[Any] = []
+        self._threads: List[threading.Thread] = []
+        self._config_watcher: Optional[ConfigWatcher] = None
+        self._lock = threading.RLock()
+        self._stopping = threading.Event()
+
+    def start(self) -> None:
+        began = time.perf_counter()
+        config = self.config
+        if config.config_path:
+            self._config_watcher = ConfigWatcher(config.config_path, config, self.reload,
+                                                 config.config_check_interval)
+            self.config = config = load_config(config.config_path, config)
+        if config.require_privileges:
+            error = load_backend(config.backend or None).check_privileges()
+            if error:
+                raise PermissionError(error)
+
+        self._services = start_metrics(config.metrics_port, config.metrics_json_path,
+                                       config.metrics_json_interval)
+        self._services += start_audit(config.audit_log_path)
+        pending: List[str] = []
+        if config.check_pastes:
+            similarity = None
+            if config.similarity_threshold:
+                similarity = SimilarityIndex(threshold=config.similarity_threshold)
+            self.provenance = ProvenanceIndex(*config.roots, similarity=similarity)
+            pending, services = warm_start(
+                self.provenance, config.snapshot_path or None, config.snapshot_interval,
+                walkers=config.scan_walkers,
+                bytes_per_second=config.scan_mb_per_second * 1024 * 1024,
+            )
+            self._scan = services[0]
+            self._services += services
+            self._publisher = TablePublisher(self.provenance, self._announce)
+            self._publisher.start()
+
+        for target in (self._receive, self._monitor):
+            thread = threading.Thread(target=target, name=f"supervisor{target.__name__}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        specs = plan_shards(config, config.shards)
+        with self._lock:
+            for i, spec in enumerate(specs):
+                self._start_shard(ShardProcess(spec, shard_config(config, spec, i == 0), i == 0))
+        deadline = time.monotonic() + START_TIMEOUT
+        for shard in list(self.shards.values()):
+            if not shard.ready.wait(max(0.0, deadline - time.monotonic())):
+                logger.error("Shard %s did not start within %.0fs", shard.spec.name, START_TIMEOUT)
+        for path in pending:
+            # Pastes that were still being written when the last run stopped
+            if os.path.exists(path):
+                self._shard_for(path, ("observe", path))
+        if self._config_watcher is not None:
+            self._config_watcher.start()
+
+        self.startup_seconds = time.perf_counter() - began
+        METRICS.observe("startup_seconds", self.startup_seconds)
+        self.protected.set()
+        logger.info("Protecting %s with %d shard(s): %s (ready in %.3fs)", ", ".join(config.roots),
+                    len(self.shards), ", ".join(self.shards), self.startup_seconds)
+
+    def _start_shard(self, shard: ShardProcess) -> None:
+        name = shard.spec.name
+        sketcher = None
+        if self.provenance is not None and self.provenance.similarity is not None:
+            sketcher = self.provenance.similarity.sketcher
+        # A fresh inbox, so a restarted shard does not read what its predecessor left
+        shard.inbox = self._context.Queue()
+        shard.ready.clear()
+        shard.process = self._context.Process(
+            target=run_shard, name=f"shard-{name}", daemon=True,
+            args=(name, shard.config, self._publisher.name if self._publisher else None, sketcher,
+                  shard.inbox, self._outbox, METRICS.enabled, logging.getLogger().getEffectiveLevel()),
+        )
+        shard.process.start()
+        shard.started_at = time.monotonic()
+        shard.restart_at = None
+        self.shards[name] = shard
+        METRICS.register_collector(name, lambda: shard.metrics)
+
+    def _stop_shard(self, shard: ShardProcess) -> None:
+        try:
+            shard.inbox.put(("stop",))
+        except (OSError, ValueError):
+            pass
+        shard.process.join(STOP_TIMEOUT)
+        if shard.process.is_alive():
+            logger.warning("Shard %s did not stop; terminating it", shard.spec.name)
+            shard.process.terminate()
+            shard.process.join()
+
+    def _shard_for(self, path: str, message: Tuple[Any, ...]) -> None:
+        for shard in list(self.shards.values()):
+            if PathPolicy(shard.spec.watches).is_protected(path):
+                shard.inbox.put(message)
+                return
+
+    def _announce(self, table: str) -> None:
+        with self._lock:
+            for shard in self.shards.values():
+                if shard.process is not None and shard.process.is_alive():
+                    shard.inbox.put(("table", table))
+
+    def _receive(self) -> None:
+        """Handle everything the shards send, on one thread."""
+        while True:
+            try:
+                message = self._outbox.get()
+            except (EOFError, OSError):
+                return
+            if message is None:
+                return
+            name, kind, *rest = message
+            try:
+                self._handle(name, kind, rest)
+            except Exception as e:
+                logger.error("Error handling %s from shard %s: %s", kind, name, str(e))
+
+    def _handle(self, name: str, kind: str, rest: List[Any]) -> None:
+        provenance = self.provenance
+        shard = self.shards.get(name)
+        if kind == "add" and provenance is not None:
+            provenance.add(rest[0])
+        elif kind == "remove" and provenance is not None:
+            provenance.remove(rest[0])
+        elif kind == "move" and provenance is not None:
+            provenance.move(rest[0], rest[1])
+        elif kind == "similar" and shard is not None:
+            match = None
+            if provenance is not None and provenance.similarity is not None:
+                match = provenance.similarity.query(rest[1])
+            shard.inbox.put(("similar", rest[0], match))
+        elif kind == "audit":
+            AUDIT.add_entries(dict(entry, shard=name) for entry in rest[0])
+        elif kind == "metrics" and shard is not None:
+            shard.metrics = rest[0]
+        elif kind == "ready" and shard is not None:
+            shard.ready.set()
+            if self._publisher is not None and self._publisher.name:
+                # The table it started with may have been replaced meanwhile
+                shard.inbox.put(("table", self._publisher.name))
+            logger.info("Shard %s protecting %s (ready in %.3fs)", name, ", ".join(shard.spec.watches), rest[0])
+        elif kind == "quit":
+            self.stop_requested.set()
+
+    def _monitor(self) -> None:
+        """Restart shards that exited, waiting twice as long after each crash in a row."""
+        while not self._stopping.wait(MONITOR_INTERVAL):
+            now = time.monotonic()
+            with self._lock:
+                for shard in list(self.shards.values()):
+                    if shard.process.is_alive() or self._stopping.is_set():
+                        continue
+                    if shard.restart_at is None:
+                        if now - shard.started_at >= MAX_RESTART_DELAY:
+                            shard.crashes = 0
+                        shard.crashes += 1
+                        delay = min(MAX_RESTART_DELAY, 2.0 ** (shard.crashes - 1))
+                        shard.restart_at = now + delay
+                        METRICS.incr("shard_restarts_total", shard=shard.spec.name)
+                        logger.error("Shard %s exited with code %s; restarting in %.0fs",
+                                     shard.spec.name, shard.process.exitcode, delay)
+                    elif now >= shard.restart_at and not self._stopping.is_set():
+                        self._start_shard(shard)
+
+    def reload(self, config: EngineConfig) -> List[str]:
+        """Apply new settings: update the index and send each shard its new share.
+
+        Shards whose volumes are unchanged reload in place, as an ``Engine``
+        does. Shards for volumes that are new are started and shards for
+        volumes no longer watched are stopped.
+        """
+        with self._lock:
+            config, changed = changed_fields(self.config, config)
+            if not changed:
+                return []
+            self.config = config
+            if self.provenance is not None and "roots" in changed:
+                added, _removed = self.provenance.set_roots(config.roots)
+                if added:
+                    from protection.scanner import BulkScanner
+                    scan = BulkScanner(self.provenance, walkers=config.scan_walkers,
+                                       bytes_per_second=config.scan_mb_per_second * 1024 * 1024,
+                                       roots=added)
+                    scan.start()
+                    self._services.append(scan)
+
+            specs = {spec.name: spec for spec in plan_shards(config, config.shards)}
+            # The clipboard stays with the shard guarding it, if that shard stays
+            guard = next((name for name, shard in self.shards.items() if shard.guard and name in specs),
+                         next(iter(specs), None))
+            for name in [name for name in self.shards if name not in specs]:
+                shard = self.shards.pop(name)
+                METRICS.unregister_collector(name)
+                self._stop_shard(shard)
+            for name, spec in specs.items():
+                shard = self.shards.get(name)
+                new = shard_config(config, spec, name == guard)
+                if shard is None:
+                    self._start_shard(ShardProcess(spec, new, name == guard))
+                elif shard.guard != (name == guard):
+                    # Clipboard triggers only start with the engine
+                    self._stop_shard(shard)
+                    shard.spec, shard.config, shard.guard = spec, new, name == guard
+                    self._start_shard(shard)
+                else:
+                    shard.spec, shard.config = spec, new
+                    shard.inbox.put(("reload", new))
+            logger.info("Configuration reloaded: %s; shards: %s", ", ".join(changed), ", ".join(self.shards))
+            return changed
+
+    def wait_indexed(self, timeout: Optional[float] = None) -> bool:
+        """Wait for the startup scan of the roots; True once it has finished."""
+        if self._scan is None:
+            return True
+        return self._scan.wait(timeout) is not None
+
+    def run(self) -> None:
+        """Start, then protect until Ctrl+Q or Ctrl+C."""
+        self.start()
+        try:
+            while not self.stop_requested.wait(1.0):
+                pass
+            logger.info("Exiting...")
+        except KeyboardInterrupt:
+            pass
+        self.stop()
+
+    def stop(self) -> None:
+        self._stopping.set()
+        if self._config_watcher is not None:
+            self._config_watcher.stop()
+        with self._lock:
+            shards = list(self.shards.values())
+        for shard in shards:
+            if shard.process is not None and shard.process.is_alive():
+                shard.inbox.put(("stop",))
+        for shard in shards:
+            if shard.process is not None:
+                self._stop_shard(shard)
+        # Shards have flushed their audit records; handle them, then stop
+        self._outbox.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._threads.clear()
+        if self._publisher is not None:
+            self._publisher.stop()
+        for service in self._services:
+            service.stop()
+        self._services.clear()
+        for shard in shards:
+            METRICS.unregister_collector(shard.spec.name)
+        self.protected.clear()
+        logger.info("Protection system stopped.")
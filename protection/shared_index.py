@@ -0,0 +1,344 @@
+"""The provenance index, published read-only to other processes.
+
+A supervisor that owns a ``ProvenanceIndex`` writes its lookup keys into a
+block of shared memory as sorted arrays of 64-bit hashes, one array per
+kind of key. Shard processes map the block and answer ``contains`` and
+``match_head`` with a binary search, so no process holds a copy of the
+index and none has to scan the roots. Whenever the index changes, a new
+block is published and the old one is released once shards have moved on.
+
+Changes a shard sees under a root, and similarity lookups that need the
+whole sketch index, are sent to the supervisor instead.
+"""
+from __future__ import annotations
+
+import os
+import time
+import array
+import bisect
+import struct
+import hashlib
+import logging
+import threading
+from multiprocessing import shared_memory
+from typing import Any, Callable, Iterable, List, Optional, Sequence, Tuple
+
+from protection.metrics import METRICS
+from protection.provenance import ProvenanceIndex, fingerprint_file
+from protection.similarity import Sketcher
+
+logger = logging.getLogger(__name__)
+
+MAGIC: bytes = b"PRVTAB\x00\x01"
+# Flags, then the length of each array: (name, size), (name, size, digest),
+# (size, digest), size and (name, head digest)
+_HEADER = struct.Struct("<8s6Q")
+FLAG_RENAMED: int = 1
+# Shortest time between two publications while the index keeps changing
+DEFAULT_PUBLISH_INTERVAL: float = 0.5
+# Seconds between checks of the index for changes
+CHECK_INTERVAL: float = 0.1
+# Publications are spaced at least this many times as long as the last one took
+PUBLISH_COST_FACTOR: float = 4.0
+
+
+def key_hash(*parts: Any) -> int:
+    """Return the 64-bit hash a key is stored under; the same in every process."""
+    text = "\x1f".join(str(part) for part in parts)
+    return int.from_bytes(
+        hashlib.blake2b(text.encode("utf-8", "surrogatepass"), digest_size=8).digest(), "little"
+    )
+
+
+def encode_table(index: ProvenanceIndex, cache: Optional[dict] = None) -> bytes:
+    """Pack an index's lookup keys into the shared table layout.
+
+    cache maps keys to their hashes between calls, so republishing a large
+    index only hashes the keys that are new.
+    """
+    cache = {} if cache is None else cache
+    kept = {}
+    arrays: List[array.array] = []
+    for keys in index.lookup_keys():
+        values = array.array("Q")
+        for key in keys:
+            value = cache.get(key)
+            if value is None:
+                value = key if isinstance(key, int) else key_hash(*key)
+            kept[key] = value
+            values.append(value)
+        arrays.append(array.array("Q", sorted(values)))
+    cache.clear()
+    cache.update(kept)
+    flags = FLAG_RENAMED if index.similarity is not None else 0
+    header = _HEADER.pack(MAGIC, flags, *(len(values) for values in arrays))
+    return header + b"".join(values.tobytes() for values in arrays)
+
+
+def _has(values: Sequence[int], value: int) -> bool:
+    position = bisect.bisect_left(values, value)
+    return position < len(values) and values[position] == value
+
+
+class SharedTable:
+    """One published table, mapped from shared memory.
+
+    The table stays mapped while anyone holds it: whoever opened it holds it
+    until ``release``, and each lookup in progress holds it too
+    (``acquire``), so replacing a table never pulls it from under a lookup.
+    """
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self._holds = 1
+        self._holds_lock = threading.Lock()
+        self._memory = shared_memory.SharedMemory(name=name)
+        view = self._memory.buf
+        magic, self.flags, *counts = _HEADER.unpack_from(view)
+        if magic != MAGIC:
+            self._memory.close()
+            raise ValueError(f"{name} is not a provenance table")
+        self._views: List[memoryview] = []
+        offset = _HEADER.size
+        for count in counts:
+            self._views.append(view[offset:offset + count * 8].cast("Q"))
+            offset += count * 8
+        self.name_sizes, self.keys, self.contents, self.sizes, self.heads = self._views
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def has_name_size(self, name: str, size: int) -> bool:
+        return _has(self.name_sizes, key_hash(name, size))
+
+    def has_key(self, name: str, size: int, digest: str) -> bool:
+        return _has(self.keys, key_hash(name, size, digest))
+
+    def has_content(self, size: int, digest: str) -> bool:
+        return bool(self.flags & FLAG_RENAMED) and _has(self.contents, key_hash(size, digest))
+
+    def has_size(self, size: int) -> bool:
+        return bool(self.flags & FLAG_RENAMED) and _has(self.sizes, size)
+
+    def has_head(self, name: str, head: str) -> bool:
+        return _has(self.heads, key_hash(name, head))
+
+    def acquire(self) -> bool:
+        """Hold the table open for a lookup; False if it has already been closed."""
+        with self._holds_lock:
+            if not self._holds:
+                return False
+            self._holds += 1
+            return True
+
+    def release(self) -> None:
+        """Drop a hold; the table is closed when the last one is dropped."""
+        with self._holds_lock:
+            self._holds -= 1
+            if self._holds:
+                return
+        for view in self._views:
+            view.release()
+        self._views = []
+        try:
+            self._memory.close()
+        except BufferError:
+            pass  # still exported somewhere; it is freed with the process
+
+
+class TablePublisher:
+    """Publishes an index to shared memory whenever it has changed.
+
+    A change is published within a tenth of a second, unless the last
+    publication was less than interval ago, or, for a large index, less than
+    a few times as long ago as encoding it took. Each publication is a new
+    block; the block before it stays mapped until the next publication, so
+    shards always have time to switch over.
+    """
+
+    def __init__(self, index: ProvenanceIndex, announce: Callable[[str], Any],
+                 interval: float = DEFAULT_PUBLISH_INTERVAL) -> None:
+        self.index = index
+        self.announce = announce
+        self.interval = interval
+        self.name: Optional[str] = None
+        self._blocks: List[shared_memory.SharedMemory] = []
+        self._cache: dict = {}
+        self._version = -1
+        self._next = 0.0
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="table-publisher", daemon=True)
+
+    def start(self) -> None:
+        self.publish()
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        if self._thread.is_alive():
+            self._thread.join()
+        with self._lock:
+            for block in self._blocks:
+                self._release(block)
+            self._blocks = []
+
+    def publish(self, force: bool = False) -> Optional[str]:
+        """Publish the index if it changed; return the name of the current table."""
+        with self._lock:
+            version = self.index.version
+            if version == self._version and not force:
+                return self.name
+            began = time.perf_counter()
+            data = encode_table(self.index, self._cache)
+            block = shared_memory.SharedMemory(create=True, size=len(data))
+            block.buf[:len(data)] = data
+            took = time.perf_counter() - began
+            METRICS.observe("table_publish_seconds", took)
+            self._next = time.monotonic() + max(self.interval, took * PUBLISH_COST_FACTOR)
+            self._version = version
+            self._blocks.append(block)
+            while len(self._blocks) > 2:
+                self._release(self._blocks.pop(0))
+            self.name = block.name
+        METRICS.incr("table_publications_total")
+        self.announce(block.name)
+        return block.name
+
+    @staticmethod
+    def _release(block: shared_memory.SharedMemory) -> None:
+        block.close()
+        try:
+            block.unlink()
+        except FileNotFoundError:
+            pass
+
+    def _run(self) -> None:
+        while not self._stopped.wait(CHECK_INTERVAL):
+            if self.index.version == self._version or time.monotonic() < self._next:
+                continue
+            try:
+                self.publish()
+            except Exception as e:
+                logger.error("Error publishing provenance table: %s", str(e))
+
+
+class SharedProvenance:
+    """Stands in for a ProvenanceIndex inside a shard process.
+
+    Lookups are answered from the latest published table. Writes, removals
+    and moves under a root are sent to the supervisor through send, and
+    similarity lookups through similar, which returns (path, score) or None.
+    """
+
+    def __init__(
+        self,
+        table: Optional[str],
+        send: Callable[[Tuple[Any, ...]], Any],
+        similar: Optional[Callable[[bytes], Optional[Tuple[str, float]]]] = None,
+        sketcher: Optional[Sketcher] = None,
+    ) -> None:
+        self.send = send
+        self.similar = similar
+        self.sketcher = sketcher
+        self._table: Optional[SharedTable] = None
+        if table:
+            try:
+                self.attach(table)
+            except FileNotFoundError:
+                pass  # replaced before this process started; the owner sends the newer one
+
+    def __len__(self) -> int:
+        table = self._hold()
+        if table is None:
+            return 0
+        try:
+            return len(table)
+        finally:
+            table.release()
+
+    def attach(self, name: str) -> None:
+        """Switch to a newly published table."""
+        table = SharedTable(name)
+        previous, self._table = self._table, table
+        # Lookups still reading the table before keep it open until they finish
+        if previous is not None:
+            previous.release()
+
+    def close(self) -> None:
+        table, self._table = self._table, None
+        if table is not None:
+            table.release()
+
+    def _hold(self) -> Optional[SharedTable]:
+        """Return the current table, held for a lookup, or None if there is none."""
+        while True:
+            table = self._table
+            if table is None or table.acquire():
+                return table
+            # Replaced and closed between reading and holding it; try the newer one
+
+    def contains(self, file_path: str) -> bool:
+        """Check a file against the table the way ``ProvenanceIndex.contains`` does."""
+        table = self._hold()
+        if table is None:
+            return False
+        try:
+            return self._contains(table, file_path)
+        finally:
+            table.release()
+
+    def _contains(self, table: SharedTable, file_path: str) -> bool:
+        try:
+            size = os.path.getsize(file_path)
+        except OSError:
+            return False
+        name = os.path.normcase(os.path.basename(file_path))
+        named = table.has_name_size(name, size)
+        sized = table.has_size(size)
+        similar = self.similar is not None and self.sketcher is not None and size >= self.sketcher.min_size
+        if not (named or sized or similar):
+            return False
+        if named or sized:
+            try:
+                size, digest = fingerprint_file(file_path)
+            except OSError:
+                return False
+            if named and table.has_key(name, size, digest):
+                return True
+            if sized and table.has_content(size, digest):
+                METRICS.incr("provenance_matches_total", kind="renamed")
+                return True
+        if similar:
+            try:
+                sketch = self.sketcher.sketch(file_path)
+            except OSError:
+                return False
+            match = self.similar(sketch) if sketch is not None else None
+            if match is not None:
+                logger.info("%s is %.0f%% similar to %s", file_path, match[1] * 100, match[0])
+                METRICS.incr("provenance_matches_total", kind="similar")
+                return True
+        return False
+
+    def match_head(self, name: str, head: str) -> bool:
+        table = self._hold()
+        if table is None:
+            return False
+        try:
+            return table.has_head(os.path.normcase(name), head)
+        finally:
+            table.release()
+
+    def add(self, path: str) -> None:
+        self.send(("add", path))
+
+    def remove(self, path: str) -> None:
+        self.send(("remove", path))
+
+    def move(self, src_path: str, dest_path: str) -> None:
+        self.send(("move", src_path, dest_path))
+
+    def discard(self, paths: Iterable[str]) -> None:
+        for path in paths:
+            self.send(("remove", path))
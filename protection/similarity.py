@@ -0,0 +1,262 @@
+from __future__ import annotations
+
+import os
+import re
+import struct
+import hashlib
+import logging
+import threading
+from typing import BinaryIO, Dict, Iterator, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_NUM_HASHES: int = 32
+DEFAULT_BANDS: int = 8
+# Estimated share of chunks two files must have in common to count as copies
+DEFAULT_THRESHOLD: float = 0.5
+# Smaller files have too few chunks to compare; they are matched by exact content only
+DEFAULT_MIN_SIZE: int = 4 * 1024
+# Only the start of very large files is sketched
+DEFAULT_MAX_BYTES: int = 8 * 1024 * 1024
+# Candidates compared per query, however many files share a band
+DEFAULT_MAX_CANDIDATES: int = 100
+
+MIN_CHUNK: int = 1024
+MAX_CHUNK: int = 16 * 1024
+READ_SIZE: int = 1024 * 1024
+
+_PRIME = (1 << 61) - 1
+
+
+def _anchor_pattern(classes: int = 4, per_row: int = 4) -> "re.Pattern[bytes]":
+    """Build the byte pattern that marks chunk boundaries.
+
+    Each position of the pattern is a class of 64 bytes, a fixed pseudo-random
+    quarter of every row of 16 byte values, so both text and binary data hit
+    it often enough. It is derived from hashes, not a seeded generator, so it
+    is the same in every process and Python version.
+    """
+    parts = []
+    for i in range(classes):
+        picked: List[int] = []
+        for row in range(0, 256, 16):
+            ranked = sorted(
+                range(row, row + 16),
+                key=lambda b: hashlib.blake2b(bytes((i, b)), digest_size=8).digest(),
+            )
+            picked.extend(ranked[:per_row])
+        parts.append(b"[" + b"".join(re.escape(bytes((b,))) for b in sorted(picked)) + b"]")
+    return re.compile(b"".join(parts))
+
+
+_ANCHOR = _anchor_pattern()
+
+
+def _permutations(count: int) -> List[Tuple[int, int]]:
+    params = []
+    for i in range(count):
+        seed = hashlib.blake2b(f"minhash-{i}".encode(), digest_size=16).digest()
+        a = int.from_bytes(seed[:8], "little") % (_PRIME - 1) + 1
+        b = int.from_bytes(seed[8:], "little") % _PRIME
+        params.append((a, b))
+    return params
+
+
+def iter_chunks(handle: BinaryIO, max_bytes: int = DEFAULT_MAX_BYTES,
+                min_chunk: int = MIN_CHUNK, max_chunk: int = MAX_CHUNK) -> Iterator[bytes]:
+    """Yield the content-defined chunks of a binary stream, read in blocks.
+
+    A chunk ends after the first anchor found at least min_chunk bytes past
+    its start, or after max_chunk bytes if there is none. Boundaries depend
+    only on nearby content, so inserting or deleting bytes changes the chunks
+    around the edit and leaves the rest of the file's chunks as they were.
+    Anchors are found by the regular expression engine, not a Python loop
+    over bytes. At most max_bytes of the stream are read.
+    """
+    data = b""
+    remaining = max_bytes
+    while remaining > 0:
+        block = handle.read(min(READ_SIZE, remaining))
+        if not block:
+            break
+        remaining -= len(block)
+        data += block
+        start = 0
+        while True:
+            end = min(len(data), start + max_chunk)
+            match = _ANCHOR.search(data, start + min_chunk, end)
+            if match is not None:
+                cut = match.end()
+            elif end == start + max_chunk:
+                cut = end
+            else:
+                break
+            yield data[start:cut]
+            start = cut
+        data = data[start:]
+    if data:
+        yield data
+
+
+class Sketcher:
+    """Computes fixed-size MinHash sketches of files from their chunks.
+
+    The sketch of a file is the minimum, under each of num_hashes hash
+    permutations, of the hashes of its distinct chunks, kept to 32 bits.
+    The share of equal positions in two sketches estimates the share of
+    chunks the two files have in common. A file is read once, block by
+    block, and the sketch is updated as chunks arrive, so memory does not
+    grow with file size. Sketchers are picklable, for use in pool workers.
+    """
+
+    def __init__(self, num_hashes: int = DEFAULT_NUM_HASHES, min_size: int = DEFAULT_MIN_SIZE,
+                 max_bytes: int = DEFAULT_MAX_BYTES) -> None:
+        self.num_hashes = num_hashes
+        self.min_size = min_size
+        self.max_bytes = max_bytes
+        self._params = _permutations(num_hashes)
+        self._format = struct.Struct(f"<{num_hashes}I")
+
+    def __reduce__(self):
+        # Struct objects do not pickle; the permutations are rebuilt the same
+        return (Sketcher, (self.num_hashes, self.min_size, self.max_bytes))
+
+    @property
+    def sketch_size(self) -> int:
+        return self._format.size
+
+    def sketch(self, path: str) -> Optional[bytes]:
+        """Return the sketch of a file, or None if it is smaller than min_size."""
+        if os.path.getsize(path) < self.min_size:
+            return None
+        with open(path, "rb") as handle:
+            return self.sketch_stream(handle)
+
+    def sketch_stream(self, handle: BinaryIO) -> bytes:
+        minimums = [_PRIME] * self.num_hashes
+        hashes: Set[int] = set()
+        for chunk in iter_chunks(handle, self.max_bytes):
+            hashes.add(int.from_bytes(hashlib.blake2b(chunk, digest_size=8).digest(), "little"))
+            if len(hashes) >= 256:
+                self._update(minimums, hashes)
+                hashes.clear()
+        self._update(minimums, hashes)
+        return self._format.pack(*(m & 0xFFFFFFFF for m in minimums))
+
+    def _update(self, minimums: List[int], hashes: Set[int]) -> None:
+        if not hashes:
+            return
+        for i, (a, b) in enumerate(self._params):
+            lowest = min((a * x + b) % _PRIME for x in hashes)
+            if lowest < minimums[i]:
+                minimums[i] = lowest
+
+    def similarity(self, first: bytes, second: bytes) -> float:
+        """Estimate the share of chunks two sketched files have in common."""
+        pairs = zip(self._format.unpack(first), self._format.unpack(second))
+        return sum(x == y for x, y in pairs) / self.num_hashes
+
+
+class SimilarityIndex:
+    """Sketches of the files under the roots, searchable for near-duplicates.
+
+    Sketches are split into bands, and each band is a key into a table of
+    files, so a query only compares the files sharing at least one band with
+    it instead of every indexed file (locality-sensitive hashing). With the
+    defaults, files sharing half their chunks are found almost always and
+    files sharing a fifth almost never. Each file costs one sketch and one
+    table entry per band, whatever its size.
+    """
+
+    def __init__(
+        self,
+        num_hashes: int = DEFAULT_NUM_HASHES,
+        bands: int = DEFAULT_BANDS,
+        threshold: float = DEFAULT_THRESHOLD,
+        min_size: int = DEFAULT_MIN_SIZE,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        max_candidates: int = DEFAULT_MAX_CANDIDATES,
+    ) -> None:
+        if num_hashes % bands:
+            raise ValueError("num_hashes must be a multiple of bands")
+        self.sketcher = Sketcher(num_hashes, min_size, max_bytes)
+        self.bands = bands
+        self.threshold = threshold
+        self.max_candidates = max_candidates
+        self._band_size = self.sketcher.sketch_size // bands
+        self._lock = threading.Lock()
+        self._sketches: Dict[str, bytes] = {}
+        self._buckets: Dict[bytes, Set[str]] = {}
+
+    def __len__(self) -> int:
+        return len(self._sketches)
+
+    @property
+    def min_size(self) -> int:
+        return self.sketcher.min_size
+
+    def _keys(self, sketch: bytes) -> Iterator[bytes]:
+        size = self._band_size
+        for i in range(self.bands):
+            yield bytes((i,)) + sketch[i * size:(i + 1) * size]
+
+    def get(self, normalized: str) -> Optional[bytes]:
+        return self._sketches.get(normalized)
+
+    def add(self, normalized: str, sketch: bytes) -> None:
+        if len(sketch) != self.sketcher.sketch_size:
+            return
+        with self._lock:
+            self._discard(normalized)
+            self._sketches[normalized] = sketch
+            for key in self._keys(sketch):
+                self._buckets.setdefault(key, set()).add(normalized)
+
+    def discard(self, normalized: str) -> None:
+        with self._lock:
+            self._discard(normalized)
+
+    def move(self, old: str, new: str) -> None:
+        with self._lock:
+            sketch = self._sketches.get(old)
+        if sketch is not None:
+            self.discard(old)
+            self.add(new, sketch)
+
+    def _discard(self, normalized: str) -> None:
+        sketch = self._sketches.pop(normalized, None)
+        if sketch is None:
+            return
+        for key in self._keys(sketch):
+            members = self._buckets.get(key)
+            if members is not None:
+                members.discard(normalized)
+                if not members:
+                    del self._buckets[key]
+
+    def query(self, sketch: bytes) -> Optional[Tuple[str, float]]:
+        """Return (indexed path, similarity) of the closest match above the threshold."""
+        candidates: Set[str] = set()
+        with self._lock:
+            for key in self._keys(sketch):
+                members = self._buckets.get(key)
+                if members:
+                    candidates.update(members)
+                    if len(candidates) >= self.max_candidates:
+                        break
+            scored = [(path, self._sketches[path]) for path in candidates if path in self._sketches]
+        best: Optional[Tuple[str, float]] = None
+        for path, other in scored[:self.max_candidates]:
+            score = self.sketcher.similarity(sketch, other)
+            if score >= self.threshold and (best is None or score > best[1]):
+                best = (path, score)
+                if score == 1.0:
+                    break
+        return best
+
+    def match(self, path: str) -> Optional[Tuple[str, float]]:
+        """Sketch a file and return its closest indexed match, if any."""
+        sketch = self.sketcher.sketch(path)
+        if sketch is None:
+            return None
+        return self.query(sketch)
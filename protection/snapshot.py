@@ -0,0 +1,230 @@
+from __future__ import annotations
+
+import os
+import mmap
+import time
+import struct
+import logging
+import threading
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple
+
+from protection.metrics import METRICS
+from protection.provenance import ProvenanceIndex
+from protection.quarantine import default_data_dir
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SNAPSHOT_INTERVAL: float = 300.0
+
+MAGIC: bytes = b"PRVSNAP\x02"
+# magic, saved at, number of roots, files, pending paths
+_HEADER = struct.Struct("<8sdIQI")
+# path length, size, mtime in ns, has head, digest, head digest, sketch length
+_RECORD = struct.Struct("<IqqB16s16sH")
+_LENGTH = struct.Struct("<I")
+_NO_HEAD = bytes(16)
+
+
+def default_snapshot_path(name: str) -> str:
+    return os.path.join(default_data_dir(), f"{name}.snapshot")
+
+
+def _pack_string(text: str) -> bytes:
+    data = text.encode("utf-8", "surrogatepass")
+    return _LENGTH.pack(len(data)) + data
+
+
+def _fsync_directory(directory: str) -> None:
+    """Make a rename inside a directory durable; Windows has no directory handles for this."""
+    if os.name == "nt":
+        return
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def save_snapshot(index: ProvenanceIndex, path: str, pending: Iterable[str] = ()) -> int:
+    """Write the index and any pending paths to a snapshot file; return the file count.
+
+    The snapshot is a flat binary file: a header, the roots, one fixed-size
+    record plus path and similarity sketch per indexed file, then the
+    pending paths. It is written to a temporary name, synced to disk and
+    renamed into place, and the rename is synced too, so neither a crash
+    nor a power loss leaves a torn snapshot behind.
+    """
+    pending = list(pending)
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    temporary = f"{path}.tmp"
+    count = 0
+    with METRICS.timer("snapshot_save_seconds"):
+        with open(temporary, "wb") as handle:
+            handle.write(_HEADER.pack(MAGIC, time.time(), len(index.roots), 0, len(pending)))
+            for root in index.roots:
+                handle.write(_pack_string(os.path.normcase(root)))
+            chunk = []
+            for normalized, size, digest, head, mtime_ns, sketch in index.entries():
+                data = normalized.encode("utf-8", "surrogatepass")
+                sketch = sketch or b""
+                chunk.append(_RECORD.pack(
+                    len(data), size, mtime_ns, head is not None,
+                    bytes.fromhex(digest), bytes.fromhex(head) if head else _NO_HEAD, len(sketch),
+                ))
+                chunk.append(data)
+                chunk.append(sketch)
+                count += 1
+                if len(chunk) >= 8192:
+                    handle.write(b"".join(chunk))
+                    chunk.clear()
+            handle.write(b"".join(chunk))
+            for item in pending:
+                handle.write(_pack_string(item))
+            # The file count is only known now
+            handle.seek(0)
+            handle.write(_HEADER.pack(MAGIC, time.time(), len(index.roots), count, len(pending)))
+            handle.flush()
+            os.fsync(handle.fileno())
+        os.replace(temporary, path)
+        _fsync_directory(directory)
+    logger.info("Saved snapshot of %d files to %s", count, path)
+    return count
+
+
+def load_snapshot(index: ProvenanceIndex, path: str) -> Optional[List[str]]:
+    """Fill an empty index from a snapshot; return its pending paths.
+
+    Returns None, leaving the index empty, if there is no usable snapshot
+    or it was taken for different roots. The file is mapped rather than
+    read, and each record is decoded from the mapping as the index takes
+    it in, so no list of the whole snapshot is built first.
+    """
+    try:
+        handle = open(path, "rb")
+    except OSError:
+        return None
+    with handle:
+        try:
+            mapped = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return None
+        with mapped:
+            began = time.perf_counter()
+            try:
+                header = _decode_header(mapped, index)
+                if header is None:
+                    logger.info("Snapshot %s was taken for other roots, ignoring it", path)
+                    return None
+                offset, count, pending_count = header
+                end: List[int] = []
+                index.add_entries(_decode_records(mapped, offset, count, end))
+                pending, _end = _decode_strings(mapped, end[0], pending_count)
+            except (struct.error, ValueError, UnicodeDecodeError) as e:
+                logger.warning("Ignoring unreadable snapshot %s: %s", path, str(e))
+                index.discard([entry[0] for entry in index.entries()])
+                return None
+            METRICS.observe("snapshot_load_seconds", time.perf_counter() - began)
+    logger.info("Loaded snapshot of %d files from %s", len(index), path)
+    return pending
+
+
+def _decode_header(mapped: mmap.mmap, index: ProvenanceIndex) -> Optional[Tuple[int, int, int]]:
+    """Return (offset of the first record, files, pending paths), or None for other roots."""
+    magic, _saved_at, root_count, count, pending_count = _HEADER.unpack_from(mapped, 0)
+    if magic != MAGIC:
+        raise ValueError("not a snapshot file")
+    roots, offset = _decode_strings(mapped, _HEADER.size, root_count)
+    if roots != [os.path.normcase(root) for root in index.roots]:
+        return None
+    return offset, count, pending_count
+
+
+def _decode_records(mapped: mmap.mmap, offset: int, count: int, end: List[int]) -> Iterator[Tuple]:
+    """Yield index entries one record at a time; append the offset after the last to end."""
+    unpack, record_size = _RECORD.unpack_from, _RECORD.size
+    for _ in range(count):
+        length, size, mtime_ns, has_head, digest, head, sketch_length = unpack(mapped, offset)
+        offset += record_size
+        normalized = mapped[offset:offset + length].decode("utf-8", "surrogatepass")
+        offset += length
+        sketch = mapped[offset:offset + sketch_length] if sketch_length else None
+        offset += sketch_length
+        yield normalized, size, digest.hex(), head.hex() if has_head else None, mtime_ns, sketch
+    end.append(offset)
+
+
+def _decode_strings(mapped: mmap.mmap, offset: int, count: int) -> Tuple[List[str], int]:
+    strings = []
+    for _ in range(count):
+        (length,) = _LENGTH.unpack_from(mapped, offset)
+        offset += _LENGTH.size
+        strings.append(mapped[offset:offset + length].decode("utf-8", "surrogatepass"))
+        offset += length
+    return strings, offset
+
+
+class SnapshotWriter:
+    """Saves a snapshot periodically while the index changes, and once on stop."""
+
+    def __init__(
+        self,
+        index: ProvenanceIndex,
+        path: str,
+        interval: float = DEFAULT_SNAPSHOT_INTERVAL,
+        pending: Callable[[], Iterable[str]] = tuple,
+    ) -> None:
+        self.index = index
+        self.path = path
+        self.interval = interval
+        self.pending = pending
+        self._saved_version = -1
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="snapshot-writer", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self._thread.join()
+        self.write(force=True)
+
+    def write(self, force: bool = False) -> None:
+        version = self.index.version
+        if version == self._saved_version and not force:
+            return
+        try:
+            save_snapshot(self.index, self.path, self.pending())
+            self._saved_version = version
+        except OSError as e:
+            logger.error("Error writing snapshot %s: %s", self.path, str(e))
+
+    def _run(self) -> None:
+        while not self._stopped.wait(self.interval):
+            self.write()
+
+
+def warm_start(index: ProvenanceIndex, path: Optional[str],
+               interval: float = DEFAULT_SNAPSHOT_INTERVAL,
+               pending: Callable[[], Iterable[str]] = tuple,
+               **scan_options) -> Tuple[List[str], List[object]]:
+    """Load an index from its snapshot, or scan the roots if there is none.
+
+    Either way the roots are scanned on a background thread (see
+    ``protection.scanner.BulkScanner``, which takes scan_options) and the
+    index is usable at once. After a snapshot only files changed while
+    nothing was running are read; without one, lookups see each batch of
+    files as soon as it is fingerprinted. Returns (pending paths from the
+    snapshot, the scan and snapshot writer, to stop on shutdown).
+    """
+    from protection.scanner import BulkScanner
+    restored = load_snapshot(index, path) if path else None
+    scan = BulkScanner(index, changed_only=restored is not None, **scan_options)
+    scan.start()
+    services: List[object] = [scan]
+    if path:
+        writer = SnapshotWriter(index, path, interval, pending)
+        writer.start()
+        services.append(writer)
+    return restored or [], services
@@ -0,0 +1,841 @@
+"""Recording of what the engine sees, and replay of recordings offline.
+
+With ``EngineConfig.trace_path`` (``--record`` on the command line) the
+engine runs on a ``RecordingBackend``. It passes every call through to the
+real backend and writes what the engine saw to a trace file: each raw
+filesystem event, each clipboard notification, hotkey and clipboard poll
+that found a change, the clipboard contents the engine read, and the
+foreground windows and processes it looked at.
+
+A trace is gzip-compressed JSON lines. The first line is an object holding
+the engine settings; every other line is one short array,
+``[seconds since start, kind, ...]``. Before each event or trigger, the
+clipboard sequence number and the foreground window current at that moment
+are recorded if they changed, so replay can restore the state each input
+saw.
+
+``python -m protection.trace replay TRACE`` feeds a trace back through an
+engine on the ``ReplayBackend``, in recorded order, at recorded speed or
+faster. Each input is handled on the replay thread before the next one is
+applied. Replay is a dry run: what would be blocked is logged and audited,
+and nothing is moved, deleted or cleared. Files are checked as they are on
+disk at replay time. Replay can profile itself with cProfile, tracemalloc
+and per-stage timings, for the whole run or between two signals.
+"""
+from __future__ import annotations
+
+import io
+import os
+import sys
+import gzip
+import json
+import time
+import signal
+import logging
+import argparse
+import threading
+from collections import Counter, deque
+from typing import Any, Deque, Dict, Iterator, List, NamedTuple, Optional, Set, Tuple
+
+from protection.audit import start_audit
+from protection.backends import Backend
+from protection.backends.fake import FakeClipboardListener, FakeObserver
+from protection.clipboard import ClipboardBackend
+from protection.config import parse_config
+from protection.engine import (
+    CLIPBOARD_POLL_THREAD,
+    LOG_FORMAT,
+    TRIGGERS_HOOKS,
+    Engine,
+    EngineConfig,
+)
+from protection.foreground import FakeForegroundBackend, ForegroundBackend
+from protection.metrics import METRICS
+from protection.processes import FakeProcessProvider, ProcessInfo, ProcessProvider
+from protection.triggers import TRIGGER_CLIPBOARD, TRIGGER_QUIT, TriggerDispatcher
+
+logger = logging.getLogger(__name__)
+
+TRACE_VERSION: int = 1
+# Record kinds: inputs the engine reacts to, then the state those inputs saw
+REC_EVENT: str = "event"  # event type, source path, destination path, is directory
+REC_TRIGGER: str = "trigger"  # trigger name
+REC_SEQUENCE: str = "sequence"  # clipboard sequence number
+REC_CLIPBOARD: str = "clipboard"  # sequence number, file list, text
+REC_TITLE: str = "title"  # foreground window title
+REC_FOREGROUND: str = "foreground"  # PID of the foreground window's process
+REC_PROCESS: str = "process"  # PID, parent PID, name, executable, start time
+REC_WRITER: str = "writer"  # path, PID of the process that wrote it
+INPUT_KINDS: Tuple[str, ...] = (REC_EVENT, REC_TRIGGER)
+
+DEFAULT_BUFFER_SIZE: int = 100_000
+DEFAULT_FLUSH_INTERVAL: float = 1.0
+# zlib's default level; higher levels cost much more CPU for little gain
+COMPRESS_LEVEL: int = 6
+# Clipboard text is cut to this many characters; a file list is never cut
+MAX_TEXT_CHARS: int = 64 * 1024
+# Signal that starts and stops profiling during a replay
+PROFILE_SIGNAL: Optional[int] = getattr(signal, "SIGUSR1", None) or getattr(signal, "SIGBREAK", None)
+# Stages and functions listed in the log when profiling stops
+REPORT_LINES: int = 20
+
+
+class TraceWriter:
+    """Buffered, compressed writer for trace records.
+
+    ``add`` stamps a record and appends it to a bounded buffer; a writer
+    thread compresses and writes batches, and flushes after each one, so a
+    trace cut short by a crash is readable up to the last batch. Records
+    that arrive while the buffer is full are dropped and counted.
+    """
+
+    def __init__(self, path: str, header: Dict[str, Any], buffer_size: int = DEFAULT_BUFFER_SIZE,
+                 flush_interval: float = DEFAULT_FLUSH_INTERVAL) -> None:
+        self.path = os.path.abspath(path)
+        self.header = header
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        self.written: int = 0
+        self.dropped: int = 0
+        self._began = time.perf_counter()
+        self._buffer: Deque[List[Any]] = deque()
+        self._ready = threading.Condition()
+        self._stopping = False
+        self._file: Any = None
+        self._thread = threading.Thread(target=self._run, name="trace-writer", daemon=True)
+
+    def start(self) -> None:
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._file = gzip.open(self.path, "wt", encoding="utf-8", compresslevel=COMPRESS_LEVEL)
+        self._file.write(json.dumps(self.header, separators=(",", ":")) + "\n")
+        self._thread.start()
+        logger.info("Recording trace to %s", self.path)
+
+    def add(self, kind: str, *fields: Any) -> None:
+        record = [round(time.perf_counter() - self._began, 6), kind, *fields]
+        with self._ready:
+            if len(self._buffer) >= self.buffer_size:
+                self.dropped += 1
+                METRICS.incr("trace_records_dropped_total")
+                return
+            self._buffer.append(record)
+
+    def stop(self) -> None:
+        if not self._thread.is_alive():
+            return
+        with self._ready:
+            self._stopping = True
+            self._ready.notify()
+        self._thread.join()
+        self._file.close()
+        logger.info("Trace %s: %d records written, %d dropped", self.path, self.written, self.dropped)
+
+    def _run(self) -> None:
+        while True:
+            with self._ready:
+                if not self._stopping:
+                    self._ready.wait(self.flush_interval)
+                batch, self._buffer = self._buffer, deque()
+                stopping = self._stopping
+            if batch:
+                try:
+                    self._file.write("".join(
+                        json.dumps(record, separators=(",", ":")) + "\n" for record in batch
+                    ))
+                    self._file.flush()
+                    self.written += len(batch)
+                except (OSError, ValueError) as e:
+                    logger.error("Error writing trace: %s", str(e))
+            if stopping:
+                return
+
+
+class _RecordingClipboard(ClipboardBackend):
+    def __init__(self, backend: ClipboardBackend, recorder: RecordingBackend) -> None:
+        self.backend = backend
+        self.recorder = recorder
+        self._local = threading.local()
+
+    def sequence_number(self) -> int:
+        number = self.backend.sequence_number()
+        self._local.sequence = number
+        self.recorder.saw_sequence(number)
+        return number
+
+    def read(self) -> Tuple[Optional[List[str]], Optional[str]]:
+        files, text = self.backend.read()
+        self.recorder.saw_contents(getattr(self._local, "sequence", None), files, text)
+        return files, text
+
+    def clear(self) -> None:
+        self.backend.clear()
+
+
+class _RecordingForeground(ForegroundBackend):
+    def __init__(self, backend: ForegroundBackend, recorder: RecordingBackend) -> None:
+        self.backend = backend
+        self.recorder = recorder
+
+    def window_title(self) -> str:
+        title = self.backend.window_title()
+        self.recorder.saw_title(title)
+        return title
+
+    def process_id(self) -> Optional[int]:
+        pid = self.backend.process_id()
+        self.recorder.saw_foreground(pid)
+        return pid
+
+
+class _RecordingProcesses(ProcessProvider):
+    def __init__(self, provider: ProcessProvider, recorder: RecordingBackend) -> None:
+        self.provider = provider
+        self.recorder = recorder
+
+    def info(self, pid: int) -> Optional[ProcessInfo]:
+        info = self.provider.info(pid)
+        if info is not None:
+            self.recorder.saw_process(info)
+        return info
+
+    def watch_exit(self, pid: int, callback) -> bool:
+        return self.provider.watch_exit(pid, callback)
+
+    def unwatch_exit(self, pid: int) -> None:
+        self.provider.unwatch_exit(pid)
+
+    def watch_writes(self, paths, callback) -> bool:
+        def wrote(path: str, pid: int) -> None:
+            self.recorder.saw_writer(path, pid)
+            callback(path, pid)
+        return self.provider.watch_writes(paths, wrote)
+
+    def stop(self) -> None:
+        self.provider.stop()
+
+
+class _RecordingDispatcher:
+    """Stands in for the trigger dispatcher a hotkey backend is given."""
+
+    def __init__(self, dispatcher: TriggerDispatcher, recorder: RecordingBackend) -> None:
+        self.dispatcher = dispatcher
+        self.recorder = recorder
+
+    def dispatch(self, name: str) -> None:
+        self.recorder.trigger(name)
+        self.dispatcher.dispatch(name)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.dispatcher, name)
+
+
+class _RecordingHandler:
+    def __init__(self, handler: Any, recorder: RecordingBackend) -> None:
+        self.handler = handler
+        self.recorder = recorder
+
+    def dispatch(self, event) -> None:
+        self.recorder.event(event)
+        self.handler.dispatch(event)
+
+
+class _RecordingObserver:
+    def __init__(self, observer: Any, recorder: RecordingBackend) -> None:
+        self.observer = observer
+        self.recorder = recorder
+
+    def schedule(self, handler: Any, path: str, recursive: bool = False) -> Any:
+        return self.observer.schedule(self.recorder.handler_for(handler), path, recursive=recursive)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.observer, name)
+
+
+class RecordingBackend(Backend):
+    """A backend that records what the engine gets from another one.
+
+    Inputs (filesystem events and triggers) are recorded as they arrive,
+    each preceded by the clipboard sequence number and, for triggers, the
+    foreground window's title and process at that moment if they changed.
+    Clipboard contents are recorded once per sequence number, and process
+    details and the writers of files when the engine looks them up.
+    """
+
+    def __init__(self, backend: Backend, writer: TraceWriter) -> None:
+        self.backend = backend
+        self.writer = writer
+        self.name = backend.name
+        self._lock = threading.Lock()
+        self._clipboard: Optional[_RecordingClipboard] = None
+        self._foreground: Optional[_RecordingForeground] = None
+        self._handlers: Dict[int, _RecordingHandler] = {}
+        self._sequence: Optional[int] = None
+        self._title: Optional[str] = None
+        self._foreground_pid: Optional[int] = None
+        self._contents: Set[Optional[int]] = set()
+        self._processes: Dict[int, ProcessInfo] = {}
+
+    def start(self) -> None:
+        self.writer.start()
+
+    def stop(self) -> None:
+        self.writer.stop()
+
+    def clipboard(self) -> ClipboardBackend:
+        if self._clipboard is None:
+            self._clipboard = _RecordingClipboard(self.backend.clipboard(), self)
+        return self._clipboard
+
+    def foreground(self) -> ForegroundBackend:
+        if self._foreground is None:
+            self._foreground = _RecordingForeground(self.backend.foreground(), self)
+        return self._foreground
+
+    def processes(self) -> Optional[ProcessProvider]:
+        provider = self.backend.processes()
+        return _RecordingProcesses(provider, self) if provider is not None else None
+
+    def hotkeys(self, dispatcher: TriggerDispatcher) -> Optional[Any]:
+        return self.backend.hotkeys(_RecordingDispatcher(dispatcher, self))
+
+    def clipboard_listener(self, callback) -> Optional[Any]:
+        def notified() -> None:
+            self.trigger(TRIGGER_CLIPBOARD)
+            callback()
+        return self.backend.clipboard_listener(notified)
+
+    def check_privileges(self) -> Optional[str]:
+        return self.backend.check_privileges()
+
+    def warn(self, title: str, message: str) -> None:
+        self.backend.warn(title, message)
+
+    def observer(self) -> Any:
+        return _RecordingObserver(self.backend.observer(), self)
+
+    def handler_for(self, handler: Any) -> _RecordingHandler:
+        """Return one wrapper per handler, so observers still see a single handler."""
+        with self._lock:
+            wrapper = self._handlers.get(id(handler))
+            if wrapper is None:
+                wrapper = self._handlers[id(handler)] = _RecordingHandler(handler, self)
+            return wrapper
+
+    def event(self, event) -> None:
+        with self._lock:
+            self._capture(title=False)
+            self.writer.add(REC_EVENT, event.event_type, event.src_path,
+                            getattr(event, "dest_path", "") or "", bool(event.is_directory))
+
+    def trigger(self, name: str) -> None:
+        with self._lock:
+            self._capture(title=True)
+            self.writer.add(REC_TRIGGER, name)
+
+    def saw_sequence(self, number: int) -> None:
+        if number == self._sequence:
+            return
+        if threading.current_thread().name == CLIPBOARD_POLL_THREAD:
+            # A poll that found a change is what a notification is elsewhere
+            self.trigger(TRIGGER_CLIPBOARD)
+            return
+        with self._lock:
+            self._note_sequence(number)
+
+    def saw_contents(self, sequence: Optional[int], files: Optional[List[str]], text: Optional[str]) -> None:
+        with self._lock:
+            if sequence in self._contents:
+                return
+            self._contents.add(sequence)
+            self.writer.add(REC_CLIPBOARD, sequence, files, text[:MAX_TEXT_CHARS] if text else text)
+
+    def saw_title(self, title: str) -> None:
+        if title == self._title:
+            return
+        with self._lock:
+            self._note_title(title)
+
+    def saw_foreground(self, pid: Optional[int]) -> None:
+        if pid == self._foreground_pid:
+            return
+        with self._lock:
+            self._note_foreground(pid)
+
+    def saw_process(self, info: ProcessInfo) -> None:
+        with self._lock:
+            if self._processes.get(info.pid) != info:
+                self._processes[info.pid] = info
+                self.writer.add(REC_PROCESS, *info)
+
+    def saw_writer(self, path: str, pid: int) -> None:
+        with self._lock:
+            self.writer.add(REC_WRITER, path, pid)
+
+    def _capture(self, title: bool) -> None:
+        """Record the state the engine is about to see for an input, where it changed."""
+        if self._clipboard is not None:
+            try:
+                self._note_sequence(self._clipboard.backend.sequence_number())
+            except Exception:
+                pass
+        if title and self._foreground is not None:
+            try:
+                self._note_title(self._foreground.backend.window_title())
+                self._note_foreground(self._foreground.backend.process_id())
+            except Exception:
+                pass
+
+    def _note_sequence(self, number: int) -> None:
+        if number != self._sequence:
+            self._sequence = number
+            self.writer.add(REC_SEQUENCE, number)
+
+    def _note_title(self, title: str) -> None:
+        if title != self._title:
+            self._title = title
+            self.writer.add(REC_TITLE, title)
+
+    def _note_foreground(self, pid: Optional[int]) -> None:
+        if pid != self._foreground_pid:
+            self._foreground_pid = pid
+            self.writer.add(REC_FOREGROUND, pid)
+
+
+def record(backend: Backend, path: str, config: EngineConfig) -> RecordingBackend:
+    """Start recording what an engine with config gets from backend to path."""
+    header = {
+        "trace": TRACE_VERSION,
+        "started": time.time(),
+        "backend": backend.name,
+        "config": config._asdict(),
+    }
+    recorder = RecordingBackend(backend, TraceWriter(path, header))
+    recorder.start()
+    return recorder
+
+
+def read_trace(path: str) -> Tuple[Dict[str, Any], Iterator[List[Any]]]:
+    """Return a trace's header and an iterator over its records.
+
+    A trace that was cut short ends at the last complete record.
+    """
+    handle = gzip.open(path, "rt", encoding="utf-8")
+    try:
+        header = json.loads(handle.readline() or "null")
+    except (OSError, EOFError, ValueError) as e:
+        handle.close()
+        raise ValueError(f"{path} is not a trace: {e}") from None
+    if not isinstance(header, dict) or header.get("trace") != TRACE_VERSION:
+        handle.close()
+        raise ValueError(f"{path} is not a version {TRACE_VERSION} trace")
+
+    def records() -> Iterator[List[Any]]:
+        with handle:
+            try:
+                for line in handle:
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        logger.warning("Trace %s ends with a partial record", path)
+                        return
+            except (OSError, EOFError) as e:
+                logger.warning("Trace %s ends early: %s", path, str(e))
+
+    return header, records()
+
+
+class TraceEvent(NamedTuple):
+    """A recorded filesystem event, with the fields handlers use."""
+    event_type: str
+    src_path: str
+    dest_path: str = ""
+    is_directory: bool = False
+
+
+class ReplayClipboard(ClipboardBackend):
+    """Clipboard that holds whatever sequence number the trace says it had."""
+
+    def __init__(self, contents: Dict[int, Tuple[Optional[List[str]], Optional[str]]]) -> None:
+        self.contents = contents
+        self.sequence: int = 0
+        self._cleared: int = -1
+
+    def sequence_number(self) -> int:
+        return self.sequence
+
+    def read(self) -> Tuple[Optional[List[str]], Optional[str]]:
+        files, text = self.contents.get(self.sequence, (None, None))
+        return (list(files) if files is not None else None), text
+
+    def clear(self) -> None:
+        # Numbers below -1 were never recorded, so a cleared clipboard reads as empty
+        self._cleared -= 1
+        self.sequence = self._cleared
+
+
+class ReplayObserver(FakeObserver):
+    """Observer that delivers every replayed event, since each was watched when recorded."""
+
+    def emit(self, event: Any) -> None:
+        with self._lock:
+            watches = list(self._watches)
+        delivered: List[Any] = []
+        for handler, _path, _recursive in watches:
+            if not any(handler is done for done in delivered):
+                delivered.append(handler)
+                handler.dispatch(event)
+
+
+class ReplayBackend(Backend):
+    """The platform as a trace recorded it; inputs are fed in by a ``Replayer``.
+
+    Processes are known as they were when the engine first looked them up;
+    writes are reported to the engine in the order they were recorded.
+    """
+
+    name = "replay"
+
+    def __init__(self, contents: Dict[int, Tuple[Optional[List[str]], Optional[str]]],
+                 processes: Optional[Dict[int, ProcessInfo]] = None) -> None:
+        self.clipboard_backend = ReplayClipboard(contents)
+        self.foreground_backend = FakeForegroundBackend()
+        self.process_provider = FakeProcessProvider()
+        self.process_provider.processes.update(processes or {})
+        self.dispatcher: Optional[TriggerDispatcher] = None
+        self.observers: List[ReplayObserver] = []
+
+    def clipboard(self) -> ReplayClipboard:
+        return self.clipboard_backend
+
+    def foreground(self) -> FakeForegroundBackend:
+        return self.foreground_backend
+
+    def processes(self) -> FakeProcessProvider:
+        return self.process_provider
+
+    def hotkeys(self, dispatcher: TriggerDispatcher) -> Optional[Any]:
+        self.dispatcher = dispatcher
+        return None
+
+    def clipboard_listener(self, callback) -> Optional[Any]:
+        # Keeps the engine from polling; recorded triggers are replayed instead
+        return FakeClipboardListener(callback)
+
+    def observer(self) -> ReplayObserver:
+        observer = ReplayObserver()
+        self.observers.append(observer)
+        return observer
+
+    def apply(self, record: List[Any]) -> None:
+        """Feed one record to the engine, on the calling thread."""
+        kind = record[1]
+        if kind == REC_EVENT:
+            event = TraceEvent(*record[2:6])
+            for observer in self.observers:
+                observer.emit(event)
+        elif kind == REC_TRIGGER:
+            if record[2] != TRIGGER_QUIT and self.dispatcher is not None:
+                self.dispatcher.handle(record[2])
+        elif kind == REC_SEQUENCE:
+            self.clipboard_backend.sequence = record[2]
+        elif kind == REC_TITLE:
+            self.foreground_backend.title = record[2]
+        elif kind == REC_FOREGROUND:
+            self.foreground_backend.pid = record[2]
+        elif kind == REC_WRITER:
+            self.process_provider.set_writer(record[2], record[3])
+
+
+def replay_config(header: Dict[str, Any], speed: float = 1.0) -> EngineConfig:
+    """Return the settings a trace was recorded with, made safe to replay.
+
+    Replay is a dry run on one process with no triggers of its own and no
+    services, and handles each event on the replay thread. Time windows are
+    shortened by speed, so they span the same stretch of the trace.
+    """
+    recorded = {name: value for name, value in header.get("config", {}).items()
+                if name in EngineConfig._fields}
+    config = parse_config(recorded, EngineConfig(roots=tuple(recorded.get("roots") or ("",))))
+    config = config._replace(
+        dry_run=True, trace_path="", require_privileges=False, trigger_mode=TRIGGERS_HOOKS,
+        workers=0, shards=0, snapshot_path="", config_path="", metrics_port=None,
+        metrics_json_path="", audit_log_path="",
+    )
+    if speed > 0:
+        config = config._replace(
+            copy_settle_time=config.copy_settle_time / speed,
+            dedup_ttl=config.dedup_ttl / speed,
+            move_batch_ttl=config.move_batch_ttl / speed,
+        )
+    return config
+
+
+class Profiler:
+    """cProfile, tracemalloc and per-stage timings around part of a run.
+
+    Results are written next to prefix when profiling stops: ``.prof`` for
+    cProfile (read it with ``python -m pstats``), ``.memory.txt`` for the
+    largest allocations and ``.timings.json`` for every metric, which holds
+    a histogram per stage. A summary of each goes to the log. Starting
+    again overwrites the files.
+
+    cProfile only sees the thread that starts it, which during a replay is
+    the one handling the inputs.
+    """
+
+    def __init__(self, prefix: str, cprofile: bool = False, tracemalloc_top: int = 0,
+                 timings: bool = False) -> None:
+        self.prefix = prefix
+        self.cprofile = cprofile
+        self.tracemalloc_top = tracemalloc_top
+        self.timings = timings
+        self.running = False
+        self._profile: Any = None
+        self._metrics_enabled = False
+
+    def start(self) -> None:
+        if self.running:
+            return
+        if self.timings:
+            self._metrics_enabled = METRICS.enabled
+            METRICS.reset()
+            METRICS.enabled = True
+        if self.tracemalloc_top:
+            import tracemalloc
+            tracemalloc.start()
+        if self.cprofile:
+            import cProfile
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        self.running = True
+        logger.info("Profiling started")
+
+    def stop(self) -> None:
+        if not self.running:
+            return
+        self.running = False
+        if self._profile is not None:
+            self._profile.disable()
+            self._report_profile()
+            self._profile = None
+        if self.tracemalloc_top:
+            self._report_memory()
+        if self.timings:
+            self._report_timings()
+            METRICS.enabled = self._metrics_enabled
+        logger.info("Profiling stopped; results in %s.*", self.prefix)
+
+    def toggle(self) -> None:
+        if self.running:
+            self.stop()
+        else:
+            self.start()
+
+    def _report_profile(self) -> None:
+        import pstats
+        self._profile.dump_stats(f"{self.prefix}.prof")
+        text = io.StringIO()
+        pstats.Stats(self._profile, stream=text).sort_stats("cumulative").print_stats(REPORT_LINES)
+        logger.info("Profile by cumulative time:\n%s", text.getvalue().strip())
+
+    def _report_memory(self) -> None:
+        import tracemalloc
+        snapshot = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        lines = [str(stat) for stat in snapshot.statistics("lineno")[:self.tracemalloc_top]]
+        with open(f"{self.prefix}.memory.txt", "w", encoding="utf-8") as handle:
+            handle.write(f"current {current} bytes, peak {peak} bytes\n" + "\n".join(lines) + "\n")
+        logger.info("Memory: %.1f MiB now, %.1f MiB peak; largest allocations:\n%s",
+                    current / 1024 / 1024, peak / 1024 / 1024, "\n".join(lines[:REPORT_LINES]))
+
+    def _report_timings(self) -> None:
+        data = METRICS.snapshot()
+        with open(f"{self.prefix}.timings.json", "w", encoding="utf-8") as handle:
+            json.dump(data, handle, indent=2)
+        stages = sorted(data["histograms"], key=lambda histogram: histogram["sum"], reverse=True)
+        lines = []
+        for histogram in stages[:REPORT_LINES]:
+            labels = ",".join(f"{key}={value}" for key, value in sorted(histogram["labels"].items()))
+            name = f"{histogram['name']}{{{labels}}}" if labels else histogram["name"]
+            mean = histogram["sum"] / histogram["count"] if histogram["count"] else 0.0
+            lines.append(f"{name:<60} {histogram['count']:>9} {histogram['sum'] * 1000:>11.1f} ms"
+                         f" {mean * 1000:>9.3f} ms")
+        logger.info("Time per stage (count, total, mean):\n%s", "\n".join(lines) or "none")
+
+
+class ReplayResult(NamedTuple):
+    records: int
+    inputs: Dict[str, int]
+    recorded_seconds: float
+    replay_seconds: float
+
+
+class Replayer:
+    """Feeds a trace through an engine on the ``ReplayBackend``.
+
+    speed 1 keeps the recorded timing from the first input on, 10 replays
+    ten times faster and 0 as fast as inputs can be handled. Each input is
+    handled completely before the next record is applied, except for copies
+    still settling, which the copy tracker decides as usual and which are
+    waited for at the end.
+
+    A profiler is started once the engine is ready, unless profile_all is
+    False, e.g. because a signal starts it.
+    """
+
+    def __init__(self, path: str, speed: float = 1.0, profiler: Optional[Profiler] = None,
+                 profile_all: bool = True) -> None:
+        self.path = path
+        self.speed = speed
+        self.profiler = profiler
+        self.profile_all = profile_all
+        self.engine: Optional[Engine] = None
+
+    def run(self) -> ReplayResult:
+        # Clipboard contents and processes are recorded after the inputs
+        # that needed them, so they are collected in a first pass
+        header, records = read_trace(self.path)
+        contents: Dict[int, Tuple[Optional[List[str]], Optional[str]]] = {}
+        processes: Dict[int, ProcessInfo] = {}
+        for record in records:
+            if record[1] == REC_CLIPBOARD:
+                contents[record[2]] = (record[3], record[4])
+            elif record[1] == REC_PROCESS:
+                processes.setdefault(record[2], ProcessInfo(*record[2:7]))
+
+        config = replay_config(header, self.speed)
+        backend = ReplayBackend(contents, processes)
+        _header, records = read_trace(self.path)
+        first: Optional[List[Any]] = None
+        # The state at the start of the recording is seen by the engine's first check
+        for record in records:
+            if record[1] in INPUT_KINDS:
+                first = record
+                break
+            backend.apply(record)
+
+        self.engine = engine = Engine(config, backend)
+        engine.start()
+        engine.wait_indexed()
+        if self.profiler is not None and self.profile_all:
+            self.profiler.start()
+        inputs: Counter = Counter()
+        count, recorded = 0, 0.0
+        offset = first[0] if first is not None else 0.0
+        began = time.monotonic()
+        try:
+            pending = [first] if first is not None else []
+            for record in _chain(pending, records):
+                count += 1
+                recorded = record[0] - offset
+                if self.speed > 0:
+                    delay = began + recorded / self.speed - time.monotonic()
+                    if delay > 0:
+                        time.sleep(delay)
+                kind = record[1]
+                if kind not in INPUT_KINDS:
+                    backend.apply(record)
+                    continue
+                name = f"{kind}:{record[2]}"
+                inputs[name] += 1
+                with METRICS.timer("replay_input_seconds", input=name):
+                    backend.apply(record)
+            copies = engine.handler.copies
+            if copies is not None:
+                copies.drain(config.copy_settle_time * 10 + 5)
+        finally:
+            if self.profiler is not None:
+                self.profiler.stop()
+            engine.stop()
+        return ReplayResult(count, dict(inputs), recorded, time.monotonic() - began)
+
+
+def _chain(first: List[List[Any]], rest: Iterator[List[Any]]) -> Iterator[List[Any]]:
+    yield from first
+    yield from rest
+
+
+def summarize(path: str) -> Dict[str, Any]:
+    """Return what a trace holds: settings, duration and record counts."""
+    header, records = read_trace(path)
+    kinds: Counter = Counter()
+    inputs: Counter = Counter()
+    last = 0.0
+    for record in records:
+        last = record[0]
+        kinds[record[1]] += 1
+        if record[1] in INPUT_KINDS:
+            inputs[f"{record[1]}:{record[2]}"] += 1
+    config = header.get("config", {})
+    return {
+        "started": header.get("started"),
+        "backend": header.get("backend"),
+        "roots": config.get("roots"),
+        "seconds": last,
+        "records": dict(kinds),
+        "inputs": dict(inputs),
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m protection.trace",
+                                     description="Inspect and replay engine traces.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    info = commands.add_parser("info", help="show what a trace holds")
+    info.add_argument("trace")
+    replay = commands.add_parser("replay", help="feed a trace through the engine as a dry run")
+    replay.add_argument("trace")
+    replay.add_argument("--speed", type=float, default=1.0,
+                        help="1 replays at recorded speed, 10 ten times faster, 0 as fast as possible")
+    replay.add_argument("--profile", action="store_true", help="profile the replay with cProfile")
+    replay.add_argument("--tracemalloc", type=int, default=0, metavar="N",
+                        help="trace memory allocations and report the N largest")
+    replay.add_argument("--timings", action="store_true", help="time each stage and input kind")
+    replay.add_argument("--on-signal", action="store_true",
+                        help="profile only between signals (SIGUSR1; SIGBREAK on Windows) "
+                             "instead of for the whole replay")
+    replay.add_argument("--output", metavar="PREFIX",
+                        help="where profiling results are written (default: next to the trace)")
+    replay.add_argument("--audit-log", default="", metavar="PATH",
+                        help="JSONL file of what would have been blocked")
+    replay.add_argument("-v", "--verbose", action="store_true", help="log every file event")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.DEBUG if getattr(args, "verbose", False) else logging.INFO,
+                        format=LOG_FORMAT)
+    try:
+        if args.command == "info":
+            print(json.dumps(summarize(args.trace), indent=2))
+            return
+
+        profiler = None
+        if args.profile or args.tracemalloc or args.timings or args.on_signal:
+            default = not (args.profile or args.tracemalloc or args.timings)
+            prefix = args.output or os.path.splitext(os.path.abspath(args.trace))[0]
+            profiler = Profiler(prefix, cprofile=args.profile or default,
+                                tracemalloc_top=args.tracemalloc, timings=args.timings or default)
+            if args.on_signal:
+                if PROFILE_SIGNAL is None:
+                    parser.error("no profiling signal on this platform")
+                signal.signal(PROFILE_SIGNAL, lambda signum, frame: profiler.toggle())
+                logger.info("Send signal %d to process %d to start and stop profiling",
+                            PROFILE_SIGNAL, os.getpid())
+        services = start_audit(args.audit_log)
+        try:
+            result = Replayer(args.trace, args.speed, profiler, profile_all=not args.on_signal).run()
+        finally:
+            for service in services:
+                service.stop()
+    except ValueError as e:
+        logger.error("%s", str(e))
+        sys.exit(1)
+    logger.info("Replayed %d records (%.1fs recorded) in %.1fs: %s", result.records,
+                result.recorded_seconds, result.replay_seconds,
+                ", ".join(f"{count} {name}" for name, count in sorted(result.inputs.items())) or "no inputs")
+
+
+if __name__ == "__main__":
+    main()
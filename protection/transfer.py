@@ -0,0 +1,143 @@
+from __future__ import annotations
+
+import os
+import errno
+import shutil
+import logging
+
+from protection.metrics import METRICS
+from protection.provenance import fingerprint_file
+
+logger = logging.getLogger(__name__)
+
+# Largest single request handed to the kernel when copying between volumes
+COPY_CHUNK_SIZE: int = 8 * 1024 * 1024
+
+# Suffix of a copy that has not been verified yet
+PARTIAL_SUFFIX: str = ".part"
+
+# errno values meaning "this kernel copy call does not work for these files"
+_UNSUPPORTED = {errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EBADF, errno.ENOTSUP}
+if hasattr(errno, "EOPNOTSUPP"):
+    _UNSUPPORTED.add(errno.EOPNOTSUPP)
+
+
+def _copy_range(src_fd: int, dest_fd: int, size: int, chunk_size: int) -> bool:
+    """Copy with copy_file_range, then sendfile; False if neither applies."""
+    for name in ("copy_file_range", "sendfile"):
+        call = getattr(os, name, None)
+        if call is None:
+            continue
+        offset = 0
+        try:
+            while offset < size:
+                if name == "copy_file_range":
+                    sent = call(src_fd, dest_fd, min(chunk_size, size - offset))
+                else:
+                    sent = call(dest_fd, src_fd, offset, min(chunk_size, size - offset))
+                if sent == 0:
+                    break
+                offset += sent
+        except OSError as e:
+            if offset or e.errno not in _UNSUPPORTED:
+                raise
+            continue
+        if offset == size:
+            return True
+        raise OSError(errno.EIO, f"Short copy: {offset} of {size} bytes")
+    return False
+
+
+def _os_copy(src_path: str, dest_path: str) -> bool:
+    """Let Windows copy the file itself; False if pywin32 is not available."""
+    try:
+        import win32file
+    except ImportError:
+        return False
+    win32file.CopyFile(src_path, dest_path, True)
+    return True
+
+
+def verify_copy(src_path: str, dest_path: str) -> bool:
+    """Check that a copy has the same size and sampled content as its source."""
+    try:
+        return fingerprint_file(src_path) == fingerprint_file(dest_path)
+    except OSError:
+        return False
+
+
+def copy_file(src_path: str, dest_path: str, chunk_size: int = COPY_CHUNK_SIZE,
+              verify: bool = True) -> str:
+    """Copy a file without passing its content through Python buffers.
+
+    On Windows the copy is done by CopyFile. Elsewhere the kernel copies
+    between the two descriptors with copy_file_range, or sendfile where
+    that is not supported, at most chunk_size bytes per call. Only if both
+    are unavailable does shutil.copyfile pick the platform's own fast path.
+    Returns the method used. With verify, a copy that does not match its
+    source is removed and OSError is raised.
+    """
+    method = "os_copy" if os.name == "nt" and _os_copy(src_path, dest_path) else ""
+    if not method:
+        with open(src_path, "rb") as src, open(dest_path, "xb") as dest:
+            size = os.fstat(src.fileno()).st_size
+            if _copy_range(src.fileno(), dest.fileno(), size, chunk_size):
+                method = "kernel"
+        if not method:
+            shutil.copyfile(src_path, dest_path)
+            method = "copyfile"
+    shutil.copystat(src_path, dest_path)
+    if verify and not verify_copy(src_path, dest_path):
+        os.remove(dest_path)
+        raise OSError(errno.EIO, f"Copy of {src_path} does not match its source")
+    return method
+
+
+def move_path(src_path: str, dest_path: str, verify: bool = True) -> str:
+    """Move a file or directory; return "rename" or the copy method used.
+
+    A move within one filesystem is a single rename. Across filesystems each
+    file is copied to a temporary name, verified, renamed into place, and
+    only then is the source removed, so an interrupted move never loses the
+    only copy. An existing destination is never overwritten.
+    """
+    if os.path.lexists(dest_path):
+        raise FileExistsError(errno.EEXIST, "Destination exists", dest_path)
+    try:
+        os.rename(src_path, dest_path)
+        METRICS.incr("transfers_total", method="rename")
+        return "rename"
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+
+    with METRICS.timer("transfer_copy_seconds"):
+        if os.path.isdir(src_path):
+            method = "copyfile"
+            for dirpath, _dirs, files in os.walk(src_path):
+                target_dir = os.path.join(dest_path, os.path.relpath(dirpath, src_path))
+                os.makedirs(target_dir, exist_ok=True)
+                for name in files:
+                    method = _copy_into(
+                        os.path.join(dirpath, name), os.path.join(target_dir, name), verify
+                    )
+            shutil.rmtree(src_path)
+        else:
+            method = _copy_into(src_path, dest_path, verify)
+            os.remove(src_path)
+    METRICS.incr("transfers_total", method=method)
+    return method
+
+
+def _copy_into(src_path: str, dest_path: str, verify: bool) -> str:
+    partial = dest_path + PARTIAL_SUFFIX
+    try:
+        method = copy_file(src_path, partial, verify=verify)
+        os.replace(partial, dest_path)
+    except BaseException:
+        try:
+            os.remove(partial)
+        except OSError:
+            pass
+        raise
+    return method
@@ -0,0 +1,105 @@
+from __future__ import annotations
+
+import os
+import time
+import logging
+import threading
+from typing import Callable, Dict, Tuple
+
+from protection.dedup import normalize_path
+from protection.metrics import METRICS
+from protection.transfer import move_path
+
+logger = logging.getLogger(__name__)
+
+# Seconds a moved tree keeps swallowing events for its children after the last one
+DEFAULT_BATCH_TTL: float = 10.0
+
+
+def restore_move(src_path: str, dest_path: str) -> bool:
+    """Put a moved file or directory back where it came from.
+
+    A rename back is a single metadata operation however large the tree is.
+    If the move crossed filesystems, the content is copied back by the
+    kernel and verified before the moved copy is removed (see
+    ``protection.transfer``). Nothing is restored over a path that has been
+    reused since the move.
+    """
+    if os.path.lexists(src_path) or not os.path.lexists(dest_path):
+        return False
+    try:
+        move_path(dest_path, src_path)
+        return True
+    except OSError as e:
+        logger.error("Error restoring %s to %s: %s", dest_path, src_path, str(e))
+        return False
+
+
+class MoveBatcher:
+    """Treats a moved directory as one operation instead of one per child.
+
+    When a directory moves, the watcher reports the directory and then a
+    moved event for every file and folder inside it. Once the directory event
+    has been handled, ``claim`` records the source and destination trees, and
+    ``covers`` reports each later event that moves a path from one claimed
+    tree to the same place in the other, so the handler can drop it. Each
+    covered event extends the window, so a tree of any size is swallowed in
+    one batch, including the events caused by moving it back.
+    """
+
+    def __init__(
+        self,
+        ttl: float = DEFAULT_BATCH_TTL,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.ttl: float = ttl
+        self._clock = clock
+        self._lock = threading.Lock()
+        # tree -> (the tree it was moved to or from, expiry)
+        self._trees: Dict[str, Tuple[str, float]] = {}
+
+    def __len__(self) -> int:
+        return len(self._trees)
+
+    def claim(self, src_tree: str, dest_tree: str) -> None:
+        """Start swallowing child events of a directory move, in both directions."""
+        src, dest = normalize_path(src_tree), normalize_path(dest_tree)
+        expires = self._clock() + self.ttl
+        with self._lock:
+            self._trees[src] = (dest, expires)
+            self._trees[dest] = (src, expires)
+
+    def covers(self, src_path: str, dest_path: str) -> bool:
+        """Check whether a move event belongs to a claimed directory move."""
+        if not self._trees:
+            return False
+        now = self._clock()
+        src, dest = normalize_path(src_path), normalize_path(dest_path)
+        with self._lock:
+            current = src
+            while True:
+                parent = os.path.dirname(current)
+                if parent == current:
+                    return False
+                current = parent
+                entry = self._trees.get(current)
+                if entry is None:
+                    continue
+                partner, expires = entry
+                if expires <= now:
+                    self._trees.pop(current, None)
+                    self._trees.pop(partner, None)
+                    return False
+                if dest != partner + src[len(current):]:
+                    return False
+                self._trees[current] = (partner, now + self.ttl)
+                self._trees[partner] = (current, now + self.ttl)
+                METRICS.incr("events_batched_total")
+                return True
+
+    def release(self, tree: str) -> None:
+        """Stop swallowing events for a tree and the tree it was paired with."""
+        with self._lock:
+            entry = self._trees.pop(normalize_path(tree), None)
+            if entry is not None:
+                self._trees.pop(entry[0], None)
@@ -0,0 +1,169 @@
+from __future__ import annotations
+
+import queue
+import logging
+import threading
+from typing import Any, Callable, Dict, List
+
+logger = logging.getLogger(__name__)
+
+# Trigger names understood by TriggerDispatcher
+TRIGGER_CLIPBOARD: str = "clipboard"
+TRIGGER_COPY: str = "copy"
+TRIGGER_QUIT: str = "quit"
+
+DEFAULT_HOTKEYS: Dict[str, str] = {
+    "ctrl+c": TRIGGER_COPY,
+    "ctrl+x": TRIGGER_COPY,
+    "ctrl+v": TRIGGER_CLIPBOARD,
+    "ctrl+q": TRIGGER_QUIT,
+}
+
+WM_CLIPBOARDUPDATE: int = 0x031D
+
+
+class TriggerDispatcher:
+    """Runs trigger callbacks on one thread, in the order triggers arrive.
+
+    Hooks and listeners call dispatch() from their own threads and return at
+    once; the dispatcher thread sleeps until there is something to do.
+    """
+
+    def __init__(self) -> None:
+        self._handlers: Dict[str, List[Callable[[], Any]]] = {}
+        self._queue: "queue.Queue[str | None]" = queue.Queue()
+        self._thread = threading.Thread(target=self.run, name="triggers", daemon=True)
+
+    def on(self, name: str, callback: Callable[[], Any]) -> None:
+        self._handlers.setdefault(name, []).append(callback)
+
+    def dispatch(self, name: str) -> None:
+        self._queue.put(name)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._queue.put(None)
+
+    def run(self) -> None:
+        while True:
+            name = self._queue.get()
+            if name is None:
+                return
+            self.handle(name)
+
+    def handle(self, name: str) -> None:
+        """Run the callbacks for a trigger on the calling thread."""
+        for callback in self._handlers.get(name, ()):
+            try:
+                callback()
+            except Exception as e:
+                logger.error("Error handling %s trigger: %s", name, str(e))
+
+
+class AdaptiveInterval:
+    """Polling interval that backs off while idle and snaps back on activity."""
+
+    def __init__(self, minimum: float, maximum: float, backoff: float = 2.0) -> None:
+        self.minimum = minimum
+        self.maximum = maximum
+        self.backoff = backoff
+        self.current = minimum
+
+    def next(self, active: bool) -> float:
+        """Return the time to wait before the next poll."""
+        if active:
+            self.current = self.minimum
+        else:
+            self.current = min(self.current * self.backoff, self.maximum)
+        return self.current
+
+
+class HotkeyTrigger:
+    """Global hotkey hooks that feed a dispatcher."""
+
+    def __init__(self, dispatcher: TriggerDispatcher, hotkeys: Dict[str, str] = DEFAULT_HOTKEYS) -> None:
+        self.dispatcher = dispatcher
+        self.hotkeys = dict(hotkeys)
+        self._handles: List[Any] = []
+
+    def start(self) -> None:
+        import keyboard
+        for hotkey, name in self.hotkeys.items():
+            self._handles.append(
+                keyboard.add_hotkey(hotkey, self.dispatcher.dispatch, args=(name,))
+            )
+
+    def stop(self) -> None:
+        if not self._handles:
+            return
+        import keyboard
+        for handle in self._handles:
+            try:
+                keyboard.remove_hotkey(handle)
+            except (KeyError, ValueError):
+                pass
+        self._handles.clear()
+
+
+class Win32ClipboardListener:
+    """Clipboard change notifications from a hidden message-only window."""
+
+    def __init__(self, callback: Callable[[], Any]) -> None:
+        self.callback = callback
+        self._hwnd = None
+        self._ready = threading.Event()
+        self._error: Exception | None = None
+        self._thread = threading.Thread(target=self._run, name="clipboard-listener", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+        self._ready.wait()
+        if self._error is not None:
+            raise self._error
+
+    def stop(self) -> None:
+        if self._hwnd is not None:
+            import win32con
+            import win32gui
+            win32gui.PostMessage(self._hwnd, win32con.WM_CLOSE, 0, 0)
+
+    def _run(self) -> None:
+        try:
+            import ctypes
+            import win32api
+            import win32con
+            import win32gui
+
+            window_class = win32gui.WNDCLASS()
+            window_class.lpfnWndProc = self._window_proc
+            window_class.lpszClassName = "FileProtectionClipboardListener"
+            window_class.hInstance = win32api.GetModuleHandle(None)
+            atom = win32gui.RegisterClass(window_class)
+            self._hwnd = win32gui.CreateWindow(
+                atom, window_class.lpszClassName, 0, 0, 0, 0, 0,
+                win32con.HWND_MESSAGE, 0, window_class.hInstance, None,
+            )
+            if not ctypes.windll.user32.AddClipboardFormatListener(self._hwnd):
+                raise OSError("AddClipboardFormatListener failed")
+        except Exception as e:
+            self._error = e
+            self._ready.set()
+            return
+        self._ready.set()
+        win32gui.PumpMessages()
+
+    def _window_proc(self, hwnd, message, wparam, lparam):
+        import ctypes
+        import win32con
+        import win32gui
+
+        if message == WM_CLIPBOARDUPDATE:
+            self.callback()
+            return 0
+        if message == win32con.WM_DESTROY:
+            ctypes.windll.user32.RemoveClipboardFormatListener(hwnd)
+            win32gui.PostQuitMessage(0)
+            return 0
+        return win32gui.DefWindowProc(hwnd, message, wparam, lparam)
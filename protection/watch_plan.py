@@ -0,0 +1,272 @@
+from __future__ import annotations
+
+import os
+import sys
+import time
+import logging
+import threading
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Sequence
+
+from protection.metrics import METRICS
+from protection.policy import PathPolicy, PROTECTED, split_path
+
+logger = logging.getLogger(__name__)
+
+# Directory names the operating system keeps for itself, which nothing is pasted into.
+# Names users can paste into (caches, .git, node_modules) are not ignored, since a
+# protected file pasted there must still be checked
+DEFAULT_IGNORED_DIRS: Sequence[str] = ("$recycle.bin", "system volume information")
+# No extension is ignored by default: a paste renamed to report.tmp is still a paste
+DEFAULT_IGNORED_EXTENSIONS: Sequence[str] = ()
+INOTIFY_MAX_WATCHES_PATH: str = "/proc/sys/fs/inotify/max_user_watches"
+# Directories walked per root when estimating the watch count
+DEFAULT_SCAN_LIMIT: int = 200_000
+# Files changed within this window count towards the estimated event rate
+ACTIVITY_WINDOW: float = 3600.0
+
+
+def default_system_paths() -> List[str]:
+    """Return operating system locations whose events are always ignored."""
+    if os.name == "nt":
+        paths = [
+            os.environ.get("SystemRoot", r"C:\Windows"),
+            os.environ.get("ProgramFiles", r"C:\Program Files"),
+            os.environ.get("ProgramFiles(x86)", r"C:\Program Files (x86)"),
+            os.environ.get("ProgramData", r"C:\ProgramData"),
+            os.environ.get("TEMP", ""),
+        ]
+    else:
+        paths = ["/proc", "/sys", "/dev", "/run/user", "/tmp", "/var/log", "/var/cache", "/usr"]
+    return [path for path in paths if path]
+
+
+def removable_drives() -> List[str]:
+    """Return mount points of removable media, where pasted files often land."""
+    if os.name == "nt":
+        import ctypes
+        import string
+        drive_removable = 2
+        bitmask = ctypes.windll.kernel32.GetLogicalDrives()
+        drives = [f"{letter}:\\" for i, letter in enumerate(string.ascii_uppercase) if bitmask >> i & 1]
+        return [d for d in drives if ctypes.windll.kernel32.GetDriveTypeW(d) == drive_removable]
+    user = os.environ.get("USER", "")
+    candidates = ["/media", os.path.join("/run/media", user) if user else "", "/mnt"]
+    return [path for path in candidates if path and os.path.isdir(path)]
+
+
+def default_destinations() -> List[str]:
+    """Return the folders where files are usually pasted."""
+    home = os.path.expanduser("~")
+    folders = ["Desktop", "Documents", "Downloads", "OneDrive", "Pictures", "Videos", "Music"]
+    return [os.path.join(home, name) for name in folders] + removable_drives()
+
+
+def inotify_watch_limit() -> Optional[int]:
+    """Return the per-user inotify watch limit, or None when not on Linux."""
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        with open(INOTIFY_MAX_WATCHES_PATH) as handle:
+            return int(handle.read().strip())
+    except (OSError, ValueError):
+        return None
+
+
+class Watch(NamedTuple):
+    path: str
+    recursive: bool
+
+
+class EventFilter:
+    """Cheap check that drops events nobody needs to look at.
+
+    Events under ignored directory names, with ignored extensions, or under
+    system paths are rejected. Paths the policy protects are always accepted,
+    and so are paths under a paste destination that is itself a system
+    path or inside one, e.g. /tmp when it is configured as a destination.
+    """
+
+    def __init__(
+        self,
+        policy: PathPolicy,
+        ignored_dirs: Iterable[str] = DEFAULT_IGNORED_DIRS,
+        ignored_extensions: Iterable[str] = DEFAULT_IGNORED_EXTENSIONS,
+        system_paths: Optional[Iterable[str]] = None,
+        destinations: Iterable[str] = (),
+    ) -> None:
+        self.policy = policy
+        self.ignored_dirs = frozenset(os.path.normcase(name) for name in ignored_dirs)
+        self.ignored_extensions = tuple(os.path.normcase(ext) for ext in ignored_extensions)
+        paths = default_system_paths() if system_paths is None else list(system_paths)
+        self._system = PathPolicy(paths) if paths else None
+        self._destinations: Optional[PathPolicy] = None
+        self.set_destinations(destinations)
+        self.dropped: int = 0
+
+    def set_destinations(self, destinations: Iterable[str]) -> None:
+        """Switch to new paste destinations; replaced by reference like the policy."""
+        system = self._system
+        inside = [os.path.abspath(path) for path in destinations]
+        inside = [path for path in inside if system is not None and system.is_protected(path)]
+        self._destinations = PathPolicy(inside) if inside else None
+
+    def accepts(self, path: str) -> bool:
+        if self.policy.decide(path) == PROTECTED:
+            return True
+        try:
+            parts = split_path(path)
+        except (TypeError, ValueError):
+            return False
+        if parts[-1].endswith(self.ignored_extensions) or self.ignored_dirs.intersection(parts[:-1]):
+            return False
+        if self._system is not None and self._system.is_protected(path):
+            destinations = self._destinations
+            return destinations is not None and destinations.is_protected(path)
+        return True
+
+    def accepts_event(self, event) -> bool:
+        if self.accepts(event.src_path):
+            return True
+        dest_path = getattr(event, "dest_path", "")
+        return bool(dest_path) and self.accepts(dest_path)
+
+
+class FilteredEventHandler:
+    """Passes an event on to a handler only if the filter accepts it."""
+
+    def __init__(self, handler, event_filter: EventFilter) -> None:
+        self.handler = handler
+        self.event_filter = event_filter
+
+    def dispatch(self, event) -> None:
+        METRICS.incr("events_received_total", type=event.event_type)
+        if self.event_filter.accepts_event(event):
+            self.handler.dispatch(event)
+        else:
+            self.event_filter.dropped += 1
+            METRICS.incr("events_filtered_total")
+
+
+class WatchPlan:
+    """The set of watches to schedule, with a rough estimate of their cost."""
+
+    def __init__(self, watches: List[Watch], watch_count: int, event_rate: float,
+                 truncated: bool) -> None:
+        self.watches = watches
+        self.watch_count = watch_count
+        self.event_rate = event_rate
+        self.truncated = truncated
+        self.inotify_limit = inotify_watch_limit()
+
+    def fits_inotify_limit(self) -> bool:
+        return self.inotify_limit is None or self.watch_count <= self.inotify_limit
+
+    def schedule(self, observer, handler) -> Dict[Watch, Any]:
+        """Schedule every watch; return what the observer returned for each."""
+        return self.reschedule(observer, handler, {})
+
+    def reschedule(self, observer, handler, scheduled: Dict[Watch, Any]) -> Dict[Watch, Any]:
+        """Bring the watches scheduled earlier in line with this plan.
+
+        Only watches that are new are scheduled and only watches no longer
+        in the plan are unscheduled; the rest keep running untouched. New
+        watches go in first, so nothing is unwatched in between.
+        """
+        current = dict(scheduled)
+        for watch in self.watches:
+            if watch not in current:
+                current[watch] = observer.schedule(handler, watch.path, recursive=watch.recursive)
+        wanted = set(self.watches)
+        for watch in [watch for watch in current if watch not in wanted]:
+            observer.unschedule(current.pop(watch))
+        return current
+
+    def summary(self) -> str:
+        count = f"{self.watch_count}{'+' if self.truncated else ''}"
+        text = (f"{len(self.watches)} watches over ~{count} directories, "
+                f"~{self.event_rate:.2f} events/s")
+        if self.inotify_limit is not None:
+            text += f" (inotify limit {self.inotify_limit})"
+        return text
+
+
+class WatchPlanner:
+    """Builds the smallest set of watches covering protected roots and paste destinations."""
+
+    def __init__(
+        self,
+        protected_roots: Iterable[str],
+        destinations: Iterable[str] = (),
+        event_filter: Optional[EventFilter] = None,
+        scan_limit: int = DEFAULT_SCAN_LIMIT,
+    ) -> None:
+        self.protected_roots = [os.path.abspath(root) for root in protected_roots]
+        self.destinations = [os.path.abspath(path) for path in destinations]
+        self.event_filter = event_filter
+        self.scan_limit = scan_limit
+
+    def plan(self, estimate: bool = True) -> WatchPlan:
+        candidates = list(self.protected_roots)
+        for path in self.destinations:
+            if self.event_filter is None or self.event_filter.accepts(path):
+                candidates.append(path)
+
+        watches: List[Watch] = []
+        covered = PathPolicy([])
+        for path in sorted(set(candidates), key=lambda p: len(split_path(p))):
+            if not os.path.isdir(path) or covered.is_protected(path):
+                continue
+            watches.append(Watch(path, True))
+            covered = PathPolicy([watch.path for watch in watches])
+
+        plan = WatchPlan(watches, 0, 0.0, False)
+        if estimate:
+            return self.estimate(plan)
+        logger.info("Watch plan: %d watches", len(watches))
+        return plan
+
+    def estimate(self, plan: WatchPlan, stopped: Optional[threading.Event] = None) -> WatchPlan:
+        """Fill in a plan's directory count and event rate by walking its watches.
+
+        This reads up to scan_limit directories per watch, so the engine
+        runs it in the background once the watches are scheduled. If stopped
+        is set first, the plan is returned unchanged.
+        """
+        watch_count, changed, truncated = 0, 0, False
+        cutoff = time.time() - ACTIVITY_WINDOW
+        for watch in plan.watches:
+            dirs, recent, cut = self._scan(watch.path, cutoff, stopped)
+            if stopped is not None and stopped.is_set():
+                return plan
+            watch_count += dirs
+            changed += recent
+            truncated = truncated or cut
+        plan.watch_count, plan.event_rate, plan.truncated = watch_count, changed / ACTIVITY_WINDOW, truncated
+        logger.info("Watch plan: %s", plan.summary())
+        if not plan.fits_inotify_limit():
+            logger.warning("Watch plan needs more inotify watches than the limit allows")
+        return plan
+
+    def _scan(self, root: str, cutoff: float, stopped: Optional[threading.Event] = None):
+        """Count directories (one inotify watch each) and recently changed files."""
+        dirs, recent = 0, 0
+        stack = [root]
+        while stack:
+            if dirs >= self.scan_limit or (stopped is not None and stopped.is_set()):
+                return dirs, recent, True
+            path = stack.pop()
+            dirs += 1
+            try:
+                with os.scandir(path) as entries:
+                    for entry in entries:
+                        try:
+                            if entry.is_dir(follow_symlinks=False):
+                                # Filtered directories are still watched by the OS
+                                stack.append(entry.path)
+                            elif entry.stat(follow_symlinks=False).st_mtime >= cutoff:
+                                recent += 1
+                        except OSError:
+                            continue
+            except OSError:
+                continue
+        return dirs, recent, False
@@ -0,0 +1,86 @@
+from __future__ import annotations
+
+import os
+import json
+from typing import Any, Dict, List
+
+import pytest
+
+from protection.backends.fake import FakeBackend
+from protection.engine import Engine, EngineConfig, TRIGGERS_NONE
+from protection.quarantine import Quarantine
+
+
+class Protected:
+    """An engine on the fake backend, with a root and a paste destination under tmp_path."""
+
+    def __init__(self, tmp_path, **settings: Any) -> None:
+        self.root = str(tmp_path / "root")
+        self.outside = str(tmp_path / "outside")
+        self.quarantine_dir = str(tmp_path / "quarantine")
+        self.audit_path = str(tmp_path / "audit.jsonl")
+        os.makedirs(self.root)
+        os.makedirs(self.outside)
+        self.backend = FakeBackend()
+        self.config = EngineConfig(
+            roots=(self.root,),
+            paste_destinations=(self.outside,),
+            backend="fake",
+            require_privileges=False,
+            # The guard would clear the clipboard between the steps of a test
+            trigger_mode=TRIGGERS_NONE,
+            workers=0,
+            copy_settle_time=0.05,
+            quarantine_dir=self.quarantine_dir,
+            audit_log_path=self.audit_path,
+            similarity_threshold=0.5,
+        )._replace(**settings)
+        self.engine = Engine(self.config, self.backend)
+        self.started = False
+
+    def start(self) -> "Protected":
+        self.engine.start()
+        self.started = True
+        return self
+
+    def stop(self) -> None:
+        if self.started:
+            self.started = False
+            self.engine.stop()
+
+    def settle(self, timeout: float = 10.0) -> None:
+        """Wait until every copy being tracked has been decided."""
+        copies = self.engine.handler.copies
+        if copies is not None:
+            assert copies.drain(timeout)
+
+    def write(self, path: str, data: bytes) -> str:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as handle:
+            handle.write(data)
+        return path
+
+    def quarantined(self) -> List[str]:
+        """Return the original paths of the files in quarantine."""
+        return sorted(item.original for item in Quarantine(self.quarantine_dir).items())
+
+    def audit(self) -> List[Dict[str, Any]]:
+        """Return the audit log; only complete once the engine has stopped."""
+        if not os.path.exists(self.audit_path):
+            return []
+        with open(self.audit_path) as handle:
+            return [json.loads(line) for line in handle if line.strip()]
+
+
+@pytest.fixture
+def protected(tmp_path):
+    """Build a Protected engine with the given settings; it is stopped after the test."""
+    made: List[Protected] = []
+
+    def make(**settings: Any) -> Protected:
+        made.append(Protected(tmp_path, **settings))
+        return made[-1]
+
+    yield make
+    for engine in made:
+        engine.stop()
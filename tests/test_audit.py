@@ -0,0 +1,75 @@
+from __future__ import annotations
+
+import json
+import time
+
+from protection.audit import AuditLog, main, parse_time, query, rotated_logs
+
+
+def _log(tmp_path, **options) -> AuditLog:
+    log = AuditLog()
+    log.start(str(tmp_path / "audit.jsonl"), flush_interval=60, buffer_size=2, **options)
+    return log
+
+
+def _record(log: AuditLog, action: str, path: str, **fields) -> None:
+    """Record one entry and wait until it is on disk, so each write is its own batch."""
+    written = log.written
+    log.record(action, path, **fields)
+    deadline = time.monotonic() + 5
+    while log.written == written:
+        assert time.monotonic() < deadline
+        time.sleep(0.001)
+
+
+def test_the_log_rotates_by_size_and_keeps_the_newest_backups(tmp_path):
+    log = _log(tmp_path, max_bytes=150, backups=2)
+    for i in range(8):
+        _record(log, "quarantine", f"/outside/file{i}.txt")
+    log.stop()
+
+    assert len(rotated_logs(log.path)) == 2
+    paths = [entry["path"] for entry in query(log.path)]
+    assert paths == [f"/outside/file{i}.txt" for i in range(8 - len(paths), 8)]
+    assert len(paths) >= 3
+
+
+def test_records_beyond_the_buffer_are_dropped_not_waited_for(tmp_path):
+    log = AuditLog()
+    log.enabled = True  # no writer thread, so nothing drains the buffer
+    log.buffer_size = 3
+    for i in range(5):
+        log.record("delete", f"/outside/{i}")
+
+    assert log.dropped == 2
+
+
+def test_queries_filter_by_action_path_and_time(tmp_path):
+    log = _log(tmp_path)
+    _record(log, "quarantine", "/outside/secret/a.txt")
+    _record(log, "restore", "/outside/secret/b.txt")
+    _record(log, "quarantine", "/outside/notes.txt")
+    log.stop()
+
+    assert [e["path"] for e in query(log.path, actions=["quarantine"])] == [
+        "/outside/secret/a.txt", "/outside/notes.txt"]
+    assert [e["action"] for e in query(log.path, path_pattern="*/secret/*")] == ["quarantine", "restore"]
+    assert list(query(log.path, since=time.time() + 60)) == []
+
+
+def test_the_command_line_prints_json_up_to_a_limit(tmp_path, capsys):
+    log = _log(tmp_path)
+    for i in range(3):
+        _record(log, "quarantine", f"/outside/{i}.txt", reason="pasted outside root")
+    log.stop()
+
+    main([log.path, "--json", "--limit", "2", "--since", "1h"])
+
+    lines = capsys.readouterr().out.splitlines()
+    assert [json.loads(line)["path"] for line in lines] == ["/outside/0.txt", "/outside/1.txt"]
+
+
+def test_times_can_be_relative_absolute_or_timestamps():
+    assert parse_time("2h", now=10_000.0) == 10_000.0 - 7200
+    assert parse_time("1700000000") == 1_700_000_000.0
+    assert parse_time("2024-01-02T03:04:05+00:00") == 1704164645.0
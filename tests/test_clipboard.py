@@ -0,0 +1,50 @@
+from __future__ import annotations
+
+import os
+
+from protection.clipboard import ClipboardService, FakeClipboardBackend
+from protection.policy import PathPolicy
+
+ROOT = os.path.abspath(os.path.join(os.sep, "data", "root"))
+OUTSIDE = os.path.abspath(os.path.join(os.sep, "data", "outside"))
+
+
+def test_the_clipboard_is_read_once_per_change():
+    backend = FakeClipboardBackend()
+    service = ClipboardService(backend, PathPolicy([ROOT]))
+    backend.set_files([os.path.join(ROOT, "a.txt"), os.path.join(OUTSIDE, "b.txt")])
+
+    for _ in range(5):
+        snapshot = service.snapshot()
+
+    assert backend.reads == 1
+    assert snapshot.protected_files == (os.path.join(ROOT, "a.txt"),)
+    assert snapshot.has_protected
+
+    service.clear()
+    assert not service.snapshot().has_protected
+    assert backend.reads == 2
+
+
+def test_a_new_policy_judges_the_same_clipboard_again():
+    backend = FakeClipboardBackend()
+    service = ClipboardService(backend, PathPolicy([ROOT]))
+    backend.set_files([os.path.join(OUTSIDE, "b.txt")])
+    assert not service.snapshot().has_protected
+
+    service.set_policy(PathPolicy([ROOT, OUTSIDE]))
+
+    assert service.snapshot().has_protected
+    assert backend.reads == 2
+
+
+def test_a_failing_clipboard_reads_as_empty():
+    class Broken(FakeClipboardBackend):
+        def read(self):
+            raise OSError("clipboard is locked")
+
+    backend = Broken()
+    backend.set_files([os.path.join(ROOT, "a.txt")])
+    snapshot = ClipboardService(backend, PathPolicy([ROOT])).snapshot()
+
+    assert snapshot.files == () and not snapshot.has_protected
@@ -0,0 +1,82 @@
+from __future__ import annotations
+
+import os
+import json
+
+import pytest
+
+from protection.config import ConfigWatcher, load_config, parse_config
+from protection.engine import EngineConfig
+
+BASE = EngineConfig(roots=(os.path.abspath("root"),))
+
+
+def _save(path, settings) -> str:
+    path.write_text(json.dumps(settings) if not isinstance(settings, str) else settings)
+    return str(path)
+
+
+@pytest.mark.parametrize("settings", [
+    {"unknown": 1},
+    {"roots": []},
+    {"roots": "D:\\Projects"},
+    {"dedup_ttl": "5"},
+    {"dry_run": 1},
+    {"workers": True},
+])
+def test_invalid_settings_are_refused(settings):
+    with pytest.raises(ValueError):
+        parse_config(settings, BASE)
+
+
+def test_settings_left_out_keep_their_base_values(tmp_path):
+    config = load_config(_save(tmp_path / "config.json", {"dedup_ttl": 7, "exclude_patterns": ["*.bak"]}),
+                         BASE)
+
+    assert config.dedup_ttl == 7.0 and config.exclude_patterns == ("*.bak",)
+    assert config._replace(dedup_ttl=BASE.dedup_ttl, exclude_patterns=BASE.exclude_patterns) == BASE
+
+
+def test_a_broken_version_is_skipped_and_the_next_good_one_applied(tmp_path):
+    path = tmp_path / "config.json"
+    _save(path, {})
+    applied = []
+    watcher = ConfigWatcher(str(path), BASE, applied.append)
+    assert not watcher.check()
+
+    _save(path, "{not json")
+    assert not watcher.check()
+    assert applied == []
+
+    _save(path, {"dedup_ttl": 3, "workers": 12})
+    assert watcher.check()
+    assert applied[0].dedup_ttl == 3.0 and watcher.reloads == 1
+
+
+def test_a_running_engine_takes_new_roots_and_keeps_restart_settings(protected, tmp_path):
+    second = tmp_path / "second"
+    second.mkdir()
+    secret = second / "plans.txt"
+    secret.write_bytes(b"launch plans\n" * 100)
+    path = _save(tmp_path / "config.json", {})
+    p = protected(config_path=path, config_check_interval=60.0).start()
+
+    assert not p.engine.policy.is_protected(str(secret))
+    _save(tmp_path / "config.json", {"roots": [p.root, str(second)], "dedup_ttl": 9, "workers": 4})
+    assert p.engine._config_watcher.check()
+
+    assert p.engine.policy.is_protected(str(secret))
+    assert p.engine.handler.recent_events.ttl == 9.0
+    assert p.engine.config.workers == 0
+
+    _save(tmp_path / "config.json", "[")
+    assert not p.engine._config_watcher.check()
+    assert p.engine.config.roots == (p.root, str(second))
+
+
+def test_roots_that_would_take_in_the_quarantine_are_refused(protected, tmp_path):
+    p = protected().start()
+
+    with pytest.raises(ValueError):
+        p.engine.reload(p.engine.config._replace(roots=(p.root, str(tmp_path))))
+    assert p.engine.config.roots == (p.root,)
@@ -0,0 +1,72 @@
+from __future__ import annotations
+
+import os
+import random
+
+from protection.copy_tracker import CopyTracker
+from protection.provenance import ProvenanceIndex
+from protection.similarity import SimilarityIndex
+
+
+def _tracker(tmp_path, data: bytes):
+    root = tmp_path / "root"
+    root.mkdir()
+    (tmp_path / "outside").mkdir()
+    (root / "design.bin").write_bytes(data)
+    index = ProvenanceIndex(str(root), similarity=SimilarityIndex(threshold=0.5))
+    index.build()
+    blocked = []
+    tracker = CopyTracker(index, blocked.append, settle_time=0.0, check_interval=0.01)
+    return tracker, blocked
+
+
+def _copy(tmp_path, tracker, name: str, data: bytes) -> str:
+    path = str(tmp_path / "outside" / name)
+    with open(path, "wb") as handle:
+        handle.write(data)
+    tracker.observe(path)
+    return path
+
+
+def test_renamed_and_edited_large_copies_are_blocked(tmp_path):
+    data = random.Random(1).randbytes(300 * 1024)
+    tracker, blocked = _tracker(tmp_path, data)
+    try:
+        renamed = _copy(tmp_path, tracker, "renamed.bin", data)
+        edited = _copy(tmp_path, tracker, "design.bin", data[:1000] + b"x" + data[1001:])
+        other = _copy(tmp_path, tracker, "other.bin", random.Random(2).randbytes(300 * 1024))
+        assert tracker.drain(10)
+    finally:
+        tracker.stop()
+
+    assert sorted(blocked) == sorted([renamed, edited])
+    assert other not in blocked
+
+
+def test_a_copy_under_its_own_name_is_blocked(tmp_path):
+    data = random.Random(3).randbytes(200 * 1024)
+    tracker, blocked = _tracker(tmp_path, data)
+    try:
+        copy = _copy(tmp_path, tracker, "design.bin", data)
+        assert tracker.drain(10)
+    finally:
+        tracker.stop()
+
+    assert blocked == [copy]
+
+
+def test_a_file_marked_for_blocking_is_blocked_once_written(tmp_path):
+    tracker, blocked = _tracker(tmp_path, b"root file\n")
+    try:
+        path = str(tmp_path / "outside" / "pasted.txt")
+        open(path, "w").close()
+        tracker.observe(path, block=True)
+        with open(path, "w") as handle:
+            handle.write("anything at all\n")
+        tracker.observe(path)
+        assert tracker.drain(10)
+    finally:
+        tracker.stop()
+
+    assert blocked == [path]
+    assert os.path.exists(path)
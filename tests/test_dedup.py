@@ -0,0 +1,53 @@
+from __future__ import annotations
+
+from protection.dedup import EventDeduplicator
+
+
+def test_a_changed_file_is_processed_again():
+    dedup = EventDeduplicator(ttl=10.0)
+    assert dedup.should_process("/a", "write", (1, 1))
+    assert not dedup.should_process("/a", "write", (1, 1))
+    assert dedup.should_process("/a", "write", (2, 2))
+
+
+def test_repeats_within_the_ttl_are_dropped_until_it_expires():
+    now = [0.0]
+    dedup = EventDeduplicator(ttl=5.0, clock=lambda: now[0])
+    assert dedup.should_process("/a", "write")
+    now[0] = 4.0
+    assert not dedup.should_process("/a", "write")
+    assert dedup.should_process("/a", "delete")
+
+    now[0] = 5.5
+    assert dedup.should_process("/a", "write")
+
+
+def test_the_oldest_entry_is_evicted_at_the_cap():
+    dedup = EventDeduplicator(ttl=60.0, max_entries=2)
+    for path in ("/a", "/b", "/c"):
+        assert dedup.should_process(path)
+
+    assert len(dedup) == 2
+    assert dedup.should_process("/a")
+    assert not dedup.should_process("/c")
+
+
+def test_a_forgotten_path_is_processed_again():
+    dedup = EventDeduplicator(ttl=60.0)
+    dedup.should_process("/a", "write")
+    dedup.forget("/a", "write")
+
+    assert dedup.should_process("/a", "write")
+
+
+def test_changing_the_ttl_applies_to_entries_already_recorded():
+    now = [0.0]
+    dedup = EventDeduplicator(ttl=10.0, clock=lambda: now[0])
+    assert dedup.should_process("/a", "write", 1)
+    now[0] = 1.0
+    assert dedup.should_process("/b", "write", 1)
+
+    dedup.ttl = 2.0
+    now[0] = 2.5
+    assert dedup.should_process("/a", "write", 1)
+    assert not dedup.should_process("/b", "write", 1)
@@ -0,0 +1,110 @@
+from __future__ import annotations
+
+import threading
+
+from protection.enforcement import EnforcementQueue
+from protection.engine import _merge_writes
+from protection.metrics import METRICS
+
+
+class Busy:
+    """Occupies a queue's single worker until release() is called."""
+
+    def __init__(self, queue: EnforcementQueue, path: str = "busy") -> None:
+        self.started = threading.Event()
+        self.released = threading.Event()
+        queue.submit(path, self.run)
+        assert self.started.wait(5)
+
+    def run(self) -> None:
+        self.started.set()
+        self.released.wait(10)
+
+    def release(self) -> None:
+        self.released.set()
+
+
+def test_identical_tasks_for_a_path_run_once():
+    queue = EnforcementQueue(workers=1)
+    ran = []
+    busy = Busy(queue)
+    for _ in range(3):
+        queue.submit("/a", ran.append, "/a")
+    busy.release()
+    queue.stop()
+
+    assert ran == ["/a"]
+    assert queue.stats["coalesced"] == 2
+
+
+def test_write_checks_merge_and_keep_the_created_flag():
+    queue = EnforcementQueue(workers=1)
+    ran = []
+
+    def write(path, created):
+        ran.append(created)
+
+    busy = Busy(queue)
+    queue.submit("/a", write, "/a", True, merge=_merge_writes)
+    queue.submit("/a", write, "/a", False, merge=_merge_writes)
+    busy.release()
+    queue.stop()
+
+    assert ran == [True]
+
+
+def test_a_write_check_never_replaces_a_pending_move():
+    queue = EnforcementQueue(workers=1)
+    ran = []
+
+    def move(src, dest):
+        ran.append(("move", dest))
+
+    def write(path, created):
+        ran.append(("write", path))
+
+    busy = Busy(queue)
+    queue.submit("/dest", move, "/src", "/dest")
+    queue.submit("/dest", write, "/dest", False, merge=_merge_writes)
+    queue.submit("/dest", write, "/dest", False, merge=_merge_writes)
+    busy.release()
+    queue.stop()
+
+    assert ran == [("move", "/dest"), ("write", "/dest")]
+
+
+def test_overflow_queues_behind_work_in_progress_for_the_same_path():
+    queue = EnforcementQueue(workers=1, max_pending=1)
+    ran = []
+    busy = Busy(queue, "/a")
+    queue.submit("/b", ran.append, "/b")  # fills the queue
+    queue.submit("/a", ran.append, "/a")  # must wait for the busy task on /a
+    queue.submit("/c", ran.append, "/c")  # a new path overflows and runs here
+
+    assert ran == ["/c"]
+    busy.release()
+    queue.stop()
+
+    assert ran == ["/c", "/b", "/a"]
+    assert queue.stats["inline"] == 1
+
+
+def test_metrics_switched_on_during_a_task_do_not_stop_the_worker(monkeypatch):
+    monkeypatch.setattr(METRICS, "enabled", False)
+    queue = EnforcementQueue(workers=1)
+    ran = []
+    busy = Busy(queue)
+    METRICS.enabled = True
+    busy.release()
+    queue.submit("/a", ran.append, "/a")
+    queue.stop()
+
+    assert ran == ["/a"]
+
+
+def test_without_workers_tasks_run_on_the_caller():
+    queue = EnforcementQueue(workers=0)
+    ran = []
+    queue.submit("/a", lambda: ran.append(threading.current_thread()))
+
+    assert ran == [threading.current_thread()]
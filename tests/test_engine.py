@@ -0,0 +1,149 @@
+from __future__ import annotations
+
+import os
+import threading
+
+from watchdog.events import FileCreatedEvent, FileModifiedEvent, FileMovedEvent
+
+SECRET = b"quarterly numbers\n" * 100
+
+
+def test_paste_while_protected_files_are_on_the_clipboard_is_quarantined(protected):
+    p = protected().start()
+    source = p.write(os.path.join(p.root, "report.txt"), SECRET)
+    p.backend.clipboard_backend.set_files([source])
+    pasted = p.write(os.path.join(p.outside, "report.txt"), SECRET)
+
+    p.backend.emit(FileCreatedEvent(pasted))
+
+    assert not os.path.exists(pasted)
+    assert p.quarantined() == [os.path.abspath(pasted)]
+    assert p.backend.clipboard_backend.read()[0] is None
+
+
+def test_every_file_of_a_multi_file_paste_is_blocked(protected):
+    p = protected().start()
+    sources = [p.write(os.path.join(p.root, f"part{i}.txt"), SECRET + bytes([i])) for i in range(3)]
+    p.backend.clipboard_backend.set_files(sources)
+    pasted = [p.write(os.path.join(p.outside, os.path.basename(s)), SECRET + bytes([i]))
+              for i, s in enumerate(sources)]
+
+    for path in pasted:
+        p.backend.emit(FileCreatedEvent(path))
+
+    assert not any(os.path.exists(path) for path in pasted)
+    assert len(p.quarantined()) == 3
+
+
+
+def test_every_file_of_a_pasted_folder_is_blocked(protected):
+    p = protected().start()
+    folder = os.path.join(p.root, "project")
+    p.write(os.path.join(folder, "a.txt"), SECRET)
+    p.write(os.path.join(folder, "sub", "b.txt"), SECRET + b"b")
+    p.backend.clipboard_backend.set_files([folder])
+    pasted = [p.write(os.path.join(p.outside, "project", "a.txt"), SECRET),
+              p.write(os.path.join(p.outside, "project", "sub", "b.txt"), SECRET + b"b")]
+
+    for path in pasted:
+        p.backend.emit(FileCreatedEvent(path))
+
+    assert not any(os.path.exists(path) for path in pasted)
+
+
+def test_files_made_elsewhere_during_a_paste_are_kept(protected):
+    p = protected().start()
+    source = p.write(os.path.join(p.root, "report.txt"), SECRET)
+    p.backend.clipboard_backend.set_files([source])
+    pasted = p.write(os.path.join(p.outside, "report.txt"), SECRET)
+    p.backend.emit(FileCreatedEvent(pasted))
+    others = [p.write(os.path.join(p.outside, "notes", "report.txt"), b"my own report\n"),
+              p.write(os.path.join(p.outside, "report.txt.bak"), b"my own backup\n")]
+
+    for path in others:
+        p.backend.emit(FileCreatedEvent(path))
+    p.settle()
+
+    assert not os.path.exists(pasted)
+    assert all(os.path.exists(path) for path in others)
+
+def test_unrelated_file_outside_the_root_is_kept(protected):
+    p = protected().start()
+    p.write(os.path.join(p.root, "report.txt"), SECRET)
+    other = p.write(os.path.join(p.outside, "notes.txt"), b"my own notes\n")
+
+    p.backend.emit(FileCreatedEvent(other))
+    p.settle()
+
+    assert os.path.exists(other)
+    assert p.quarantined() == []
+
+
+def test_dry_run_only_audits_a_paste(protected):
+    p = protected(dry_run=True).start()
+    source = p.write(os.path.join(p.root, "report.txt"), SECRET)
+    p.backend.clipboard_backend.set_files([source])
+    pasted = p.write(os.path.join(p.outside, "report.txt"), SECRET)
+
+    p.backend.emit(FileCreatedEvent(pasted))
+    p.stop()
+
+    assert os.path.exists(pasted)
+    assert [entry["action"] for entry in p.audit()] == ["would_quarantine"]
+
+
+def test_move_out_of_the_root_is_restored(protected):
+    p = protected().start()
+    inside = p.write(os.path.join(p.root, "report.txt"), SECRET)
+    moved = os.path.join(p.outside, "report.txt")
+    os.rename(inside, moved)
+
+    p.backend.emit(FileMovedEvent(inside, moved))
+
+    assert os.path.exists(inside)
+    assert not os.path.exists(moved)
+
+
+def _hold_worker(p):
+    """Keep the engine's only enforcement worker busy until the returned event is set."""
+    release = threading.Event()
+    started = threading.Event()
+
+    def busy() -> None:
+        started.set()
+        release.wait(10)
+
+    p.engine.handler.enforcement.submit("busy", busy)
+    assert started.wait(5)
+    return release
+
+
+def test_move_is_restored_when_a_modified_event_follows_it(protected):
+    p = protected(workers=1).start()
+    inside = p.write(os.path.join(p.root, "report.txt"), SECRET)
+    moved = os.path.join(p.outside, "report.txt")
+    release = _hold_worker(p)
+    os.rename(inside, moved)
+
+    p.backend.emit(FileMovedEvent(inside, moved))
+    p.backend.emit(FileModifiedEvent(moved))
+    release.set()
+    p.engine.handler.enforcement.stop()
+
+    assert os.path.exists(inside)
+    assert not os.path.exists(moved)
+
+
+def test_paste_is_blocked_when_a_modified_event_follows_its_creation(protected):
+    p = protected(workers=1).start()
+    source = p.write(os.path.join(p.root, "report.txt"), SECRET)
+    p.backend.clipboard_backend.set_files([source])
+    release = _hold_worker(p)
+    pasted = p.write(os.path.join(p.outside, "renamed.txt"), b"not from the root\n")
+
+    p.backend.emit(FileCreatedEvent(pasted))
+    p.backend.emit(FileModifiedEvent(pasted))
+    release.set()
+    p.engine.handler.enforcement.stop()
+
+    assert not os.path.exists(pasted)
@@ -0,0 +1,75 @@
+from __future__ import annotations
+
+import json
+import urllib.request
+
+from protection.metrics import JsonMetricsWriter, MetricsRegistry, MetricsServer
+
+
+def _registry() -> MetricsRegistry:
+    registry = MetricsRegistry()
+    registry.enabled = True
+    registry.incr("events_total", type="created")
+    registry.incr("events_total", 2, type="created")
+    registry.observe("task_seconds", 0.003)
+    registry.observe("task_seconds", 2.0)
+    registry.register_gauge("queue_depth", lambda: 7)
+    registry.register_gauge("broken", lambda: 1 / 0)
+    return registry
+
+
+def test_nothing_is_recorded_while_disabled():
+    registry = MetricsRegistry()
+    registry.incr("events_total")
+    with registry.timer("task_seconds"):
+        pass
+
+    data = registry.snapshot()
+    assert data["counters"] == [] and data["histograms"] == []
+
+
+def test_prometheus_text_has_counters_cumulative_buckets_and_gauges():
+    text = _registry().render_prometheus()
+
+    assert 'protection_events_total{type="created"} 3' in text
+    assert 'protection_task_seconds_bucket{le="0.001"} 0' in text
+    assert 'protection_task_seconds_bucket{le="0.005"} 1' in text
+    assert 'protection_task_seconds_bucket{le="+Inf"} 2' in text
+    assert "protection_task_seconds_count 2" in text
+    assert "protection_queue_depth 7.0" in text
+    assert "broken" not in text
+
+
+def test_shard_snapshots_are_merged_with_a_shard_label():
+    supervisor = MetricsRegistry()
+    supervisor.register_collector("d", lambda: _registry().snapshot())
+    supervisor.register_collector("e", lambda: None)
+
+    data = supervisor.snapshot()
+
+    assert data["counters"][0]["labels"] == {"type": "created", "shard": "d"}
+    assert data["gauges"] == {'queue_depth{shard="d"}': 7.0}
+
+
+def test_metrics_are_served_over_http():
+    server = MetricsServer(0, registry=_registry())
+    server.start()
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{server.port}/metrics", timeout=5) as response:
+            body = response.read().decode()
+    finally:
+        server.stop()
+
+    assert 'protection_events_total{type="created"} 3' in body
+
+
+def test_metrics_are_written_to_a_json_file(tmp_path):
+    path = tmp_path / "metrics.json"
+    writer = JsonMetricsWriter(str(path), interval=60, registry=_registry())
+    writer.start()
+    writer.stop()
+
+    data = json.loads(path.read_text())
+    assert data["counters"][0]["value"] == 3
+    assert data["histograms"][0]["count"] == 2
+    assert not (tmp_path / "metrics.json.tmp").exists()
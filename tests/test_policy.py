@@ -0,0 +1,57 @@
+from __future__ import annotations
+
+import os
+
+from protection.policy import ALLOWED, EXCLUDED, OUTSIDE, PROTECTED, PathPolicy
+
+BASE = os.path.abspath(os.path.join(os.sep, "data"))
+
+
+def _path(*parts: str) -> str:
+    return os.path.join(BASE, *parts)
+
+
+def test_paths_are_matched_by_whole_component():
+    policy = PathPolicy([_path("users", "asus"), _path("projects")])
+
+    assert policy.decide(_path("users", "asus", "report.txt")) == PROTECTED
+    assert policy.decide(_path("users", "asus")) == PROTECTED
+    assert policy.decide(_path("users", "asus2", "report.txt")) == OUTSIDE
+    assert policy.decide(_path("users")) == OUTSIDE
+    assert policy.root_for(_path("projects", "a", "b.txt")) == _path("projects")
+    assert policy.root_for(_path("elsewhere.txt")) is None
+
+
+def test_allowed_folders_and_excludes_override_a_root():
+    policy = PathPolicy([_path("home")], allowed=[_path("home", "shared")], excludes=["*.tmp"])
+
+    assert policy.decide(_path("home", "shared", "a.txt")) == ALLOWED
+    assert policy.decide(_path("home", "private", "a.txt")) == PROTECTED
+    assert policy.decide(_path("home", "private", "a.tmp")) == EXCLUDED
+    assert policy.filter_protected([_path("home", "a.txt"), _path("home", "a.tmp"), _path("other")]) == [
+        _path("home", "a.txt")]
+
+
+def test_repeated_decisions_come_from_the_cache():
+    policy = PathPolicy([_path("home")], cache_size=2)
+    for _ in range(3):
+        policy.decide(_path("home", "a.txt"))
+
+    info = policy.cache_info()
+    assert (info.hits, info.misses) == (2, 1)
+
+    policy.decide(_path("home", "b.txt"))
+    policy.decide(_path("home", "c.txt"))
+    policy.decide(_path("home", "a.txt"))
+    assert policy.cache_info().misses == 4
+    assert policy.cache_info().currsize == 2
+
+    policy.clear_cache()
+    assert policy.cache_info().currsize == 0
+
+
+def test_a_path_that_cannot_be_decided_is_outside():
+    policy = PathPolicy([_path("home")])
+
+    assert policy.decide("bad\0path") == OUTSIDE
+    assert policy.classify([_path("home", "a"), None]) == [PROTECTED, OUTSIDE]
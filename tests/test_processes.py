@@ -0,0 +1,102 @@
+from __future__ import annotations
+
+import os
+
+from watchdog.events import FileCreatedEvent
+
+from protection.processes import FakeProcessProvider, ProcessCache
+
+SECRET = b"quarterly numbers\n" * 100
+
+
+def test_cached_process_is_dropped_when_it_exits():
+    provider = FakeProcessProvider()
+    provider.add(10, "notepad.exe")
+    cache = ProcessCache(provider, ttl=60)
+
+    assert cache.get(10).name == "notepad.exe"
+    assert cache.get(10).name == "notepad.exe"
+    assert provider.lookups == 1
+
+    provider.exit(10)
+    provider.add(10, "other.exe")  # the PID is reused
+
+    assert cache.get(10).name == "other.exe"
+
+
+def test_writer_is_known_after_it_exits():
+    provider = FakeProcessProvider()
+    cache = ProcessCache(provider)
+    assert cache.watch_writes(["/data"])
+    provider.add(1, "rsync")
+    provider.add(2, "cp", ppid=1)
+
+    provider.set_writer("/data/a.txt", 2)
+    provider.exit(2)
+    provider.exit(1)
+    provider.add(2, "evil")
+
+    assert [info.name for info in cache.writer_chain("/data/a.txt")] == ["cp", "rsync"]
+
+
+def test_write_by_a_process_already_gone_forgets_the_older_writer():
+    provider = FakeProcessProvider()
+    cache = ProcessCache(provider)
+    cache.watch_writes(["/data"])
+    provider.add(1, "rsync")
+    provider.set_writer("/data/a.txt", 1)
+
+    provider.set_writer("/data/a.txt", 99)
+
+    assert cache.writer_chain("/data/a.txt") == []
+
+
+def _paste(p, name: str, writer: int) -> str:
+    path = p.write(os.path.join(p.outside, name), SECRET)
+    p.backend.emit(FileCreatedEvent(path))
+    p.backend.process_provider.set_writer(path, writer)
+    return path
+
+
+def test_files_from_a_trusted_writer_are_kept_after_it_exits(protected):
+    p = protected(trusted_writers=("rsync",))
+    source = p.write(os.path.join(p.root, "report.txt"), SECRET)
+    p.start()
+    processes = p.backend.process_provider
+    p.backend.clipboard_backend.set_files([source])
+    processes.add(300, "rsync")
+    processes.add(301, "cp", ppid=300)
+    processes.add(400, "cp")
+
+    trusted = _paste(p, "report.txt", 301)
+    untrusted = _paste(p, "copy.txt", 400)
+    for pid in (301, 300, 400):
+        processes.exit(pid)
+    p.settle()
+    p.stop()
+
+    assert os.path.exists(trusted)
+    assert not os.path.exists(untrusted)
+    entries = {entry["path"]: entry for entry in p.audit()}
+    assert entries[os.path.abspath(trusted)]["action"] == "allow"
+    assert entries[os.path.abspath(trusted)]["writer"] == "cp[301] < rsync[300]"
+    assert entries[os.path.abspath(untrusted)]["writer"] == "cp[400]"
+
+
+def test_safe_foreground_is_judged_by_process_not_title(protected):
+    from protection.engine import TRIGGERS_HOOKS
+
+    p = protected(trigger_mode=TRIGGERS_HOOKS).start()
+    processes = p.backend.process_provider
+    processes.add(100, "explorer.exe")
+    processes.add(200, "notepad.exe")
+    source = p.write(os.path.join(p.root, "report.txt"), SECRET)
+    foreground = p.backend.foreground_backend
+    guard = p.engine.guard
+
+    p.backend.clipboard_backend.set_files([source])
+    foreground.title, foreground.pid = "explorer", 100
+    assert guard.foreground_is_safe()[0]
+
+    foreground.pid = 200
+    assert not guard.foreground_is_safe()[0]
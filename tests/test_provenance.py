@@ -0,0 +1,51 @@
+from __future__ import annotations
+
+import os
+
+from protection.provenance import ProvenanceIndex
+
+
+def _index(tmp_path):
+    root = tmp_path / "root"
+    for name in ("a/one.txt", "a/b/two.txt", "ab/three.txt", "four.txt"):
+        path = root / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(name * 10)
+    index = ProvenanceIndex(str(root))
+    index.build()
+    return root, index
+
+
+def _paths(index):
+    return sorted(os.path.relpath(entry[0], index.roots[0]).replace(os.sep, "/") for entry in index.entries())
+
+
+def test_removing_a_directory_drops_only_the_files_below_it(tmp_path):
+    root, index = _index(tmp_path)
+
+    index.remove(str(root / "a"))
+
+    assert _paths(index) == ["ab/three.txt", "four.txt"]
+    assert index._children.get(os.path.normcase(str(root / "a"))) is None
+
+
+def test_moving_a_directory_rekeys_the_files_below_it(tmp_path):
+    root, index = _index(tmp_path)
+    (root / "a").rename(root / "c")
+
+    index.move(str(root / "a"), str(root / "c"))
+
+    assert _paths(index) == ["ab/three.txt", "c/b/two.txt", "c/one.txt", "four.txt"]
+    assert index.contains(str(root / "c" / "b" / "two.txt"))
+    index.remove(str(root / "c"))
+    assert _paths(index) == ["ab/three.txt", "four.txt"]
+
+
+def test_removing_a_path_that_is_not_indexed_changes_nothing(tmp_path):
+    root, index = _index(tmp_path)
+    version = index.version
+
+    index.remove(str(root / "missing"))
+
+    assert len(index) == 4
+    assert index.version == version
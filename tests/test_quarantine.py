@@ -0,0 +1,124 @@
+from __future__ import annotations
+
+import errno
+import os
+
+import pytest
+
+from protection import transfer
+from protection.engine import Engine
+from protection.policy import PathPolicy
+from protection.quarantine import Quarantine, main, quarantine_dir_candidates, select_quarantine_dir
+from protection.transfer import copy_file, move_path
+
+
+def test_the_default_quarantine_moves_out_of_a_protected_profile(tmp_path, monkeypatch):
+    monkeypatch.setenv("LOCALAPPDATA", str(tmp_path / "profile" / "AppData"))
+    policy = PathPolicy([str(tmp_path / "profile")])
+    default, shared = quarantine_dir_candidates()
+
+    assert policy.is_protected(default)
+    assert select_quarantine_dir(policy.is_protected) == shared
+    assert select_quarantine_dir(PathPolicy([str(tmp_path / "other")]).is_protected) == default
+
+
+def test_a_configured_quarantine_inside_a_root_is_refused(tmp_path):
+    policy = PathPolicy([str(tmp_path)])
+
+    with pytest.raises(ValueError):
+        select_quarantine_dir(policy.is_protected, str(tmp_path / "quarantine"))
+
+
+def test_the_engine_refuses_to_quarantine_into_a_root(protected):
+    p = protected()
+    p.config = p.config._replace(quarantine_dir=os.path.join(p.root, "quarantine"))
+
+    with pytest.raises(ValueError):
+        Engine(p.config, p.backend).start()
+
+
+def test_a_reload_whose_roots_take_in_the_quarantine_is_refused(protected, tmp_path):
+    p = protected().start()
+
+    with pytest.raises(ValueError):
+        p.engine.reload(p.config._replace(roots=(str(tmp_path),)))
+    assert p.engine.config.roots == (p.root,)
+
+
+def _blocked(tmp_path, name: str, data: bytes = b"blocked\n") -> str:
+    path = tmp_path / "outside" / name
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(data)
+    return str(path)
+
+
+def test_quarantined_files_are_recorded_and_restored(tmp_path):
+    directory = str(tmp_path / "quarantine")
+    first = Quarantine(directory).put(_blocked(tmp_path, "a.txt"), reason="pasted")
+    Quarantine(directory).put(_blocked(tmp_path, "a.txt", b"another a\n"))
+
+    quarantine = Quarantine(directory)
+    assert len(quarantine) == 2
+    assert quarantine.holds(first.stored)
+    assert not os.path.exists(first.original)
+
+    # Both came from the same path; the second stays once the first is back
+    restored, failed = quarantine.restore_many()
+    assert [item.id for item, _target in restored] == [first.id]
+    assert len(failed) == 1
+    assert os.path.exists(first.original)
+    assert len(Quarantine(directory)) == 1
+
+
+def test_items_can_be_restored_elsewhere_and_purged(tmp_path):
+    quarantine = Quarantine(str(tmp_path / "quarantine"))
+    kept = quarantine.put(_blocked(tmp_path, "a.txt"))
+    dropped = quarantine.put(_blocked(tmp_path, "b.txt"))
+
+    target = quarantine.restore(kept.id, str(tmp_path / "restored"))
+
+    assert target == str(tmp_path / "restored" / "a.txt") and os.path.exists(target)
+    assert quarantine.purge() == 1
+    assert not os.path.exists(dropped.stored)
+    assert len(Quarantine(quarantine.directory)) == 0
+
+
+def test_the_command_line_lists_and_restores(tmp_path, capsys):
+    directory = str(tmp_path / "quarantine")
+    item = Quarantine(directory).put(_blocked(tmp_path, "a.txt"), reason="pasted")
+
+    main(["--dir", directory, "list"])
+    assert item.id in capsys.readouterr().out
+    main(["--dir", directory, "restore", item.id])
+
+    assert f"restored {item.id}" in capsys.readouterr().out
+    assert os.path.exists(item.original)
+
+
+def test_a_copy_between_volumes_is_verified_before_the_source_goes(tmp_path, monkeypatch):
+    def cross_device(src, dest):
+        raise OSError(errno.EXDEV, "Invalid cross-device link")
+
+    monkeypatch.setattr(transfer.os, "rename", cross_device)
+    tree = tmp_path / "tree"
+    (tree / "sub").mkdir(parents=True)
+    (tree / "a.bin").write_bytes(os.urandom(300 * 1024))
+    (tree / "sub" / "b.txt").write_text("b")
+
+    assert move_path(str(tree), str(tmp_path / "moved")) in ("kernel", "copyfile")
+
+    assert not tree.exists()
+    assert (tmp_path / "moved" / "sub" / "b.txt").read_text() == "b"
+    assert not list(tmp_path.glob("moved/**/*.part"))
+    with pytest.raises(FileExistsError):
+        move_path(str(tmp_path / "moved"), str(tmp_path / "moved"))
+
+
+def test_a_copy_that_does_not_match_is_removed(tmp_path, monkeypatch):
+    source = tmp_path / "a.bin"
+    source.write_bytes(b"x" * 1000)
+    monkeypatch.setattr(transfer, "verify_copy", lambda src, dest: False)
+
+    with pytest.raises(OSError):
+        copy_file(str(source), str(tmp_path / "b.bin"))
+    assert not (tmp_path / "b.bin").exists()
@@ -0,0 +1,87 @@
+from __future__ import annotations
+
+import os
+
+from protection import scanner
+from protection.provenance import ProvenanceIndex, fingerprint_file
+from protection.scanner import BulkScanner, Throttle
+
+
+def _root(tmp_path, files: int = 30):
+    root = tmp_path / "root"
+    for i in range(files):
+        path = root / f"dir{i % 3}" / f"sub{i % 2}" / f"file{i}.txt"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(f"file {i}\n" * (i + 1))
+    return root
+
+
+def test_every_file_below_the_roots_is_indexed(tmp_path):
+    root = _root(tmp_path)
+    index = ProvenanceIndex(str(root))
+
+    result = BulkScanner(index, walkers=3, use_processes=False, batch_size=4).run()
+
+    assert result.done and result.files == 30 and result.fingerprinted == 30
+    assert result.directories == 1 + 3 + 6
+    assert index.contains(str(root / "dir1" / "sub0" / "file4.txt"))
+
+
+def test_files_are_fingerprinted_in_spawned_processes(tmp_path):
+    root = _root(tmp_path)
+    index = ProvenanceIndex(str(root))
+
+    result = BulkScanner(index, fingerprint_workers=2, use_processes=True).run()
+
+    assert result.fingerprinted == 30 and len(index) == 30
+
+
+def test_a_result_older_than_a_live_update_is_not_applied(tmp_path, monkeypatch):
+    root = tmp_path / "root"
+    root.mkdir()
+    path = root / "report.txt"
+    path.write_text("first version\n")
+    index = ProvenanceIndex(str(root))
+    read = scanner._fingerprint_batch
+
+    def changed_while_reading(batch, sketcher=None):
+        results = read(batch, sketcher)
+        path.write_text("second version, written meanwhile\n")
+        os.utime(path, ns=(1_000_000_000, 1_000_000_000))
+        index.add(str(path))  # what the event for that write does
+        return results
+
+    monkeypatch.setattr(scanner, "_fingerprint_batch", changed_while_reading)
+    result = BulkScanner(index, use_processes=False).run()
+
+    assert result.stale == 1 and result.fingerprinted == 0
+    [entry] = index.entries()
+    assert entry[2] == fingerprint_file(str(path))[1]
+    assert entry[4] == 1_000_000_000
+
+
+def test_a_reconcile_reads_only_changed_files_and_drops_missing_ones(tmp_path):
+    root = _root(tmp_path, files=10)
+    index = ProvenanceIndex(str(root))
+    BulkScanner(index, use_processes=False).run()
+    changed = root / "dir0" / "sub0" / "file0.txt"
+    changed.write_text("a new first file\n")
+    os.remove(root / "dir1" / "sub1" / "file1.txt")
+
+    result = BulkScanner(index, use_processes=False, changed_only=True).run()
+
+    assert (result.fingerprinted, result.unchanged, result.dropped) == (1, 8, 1)
+    assert len(index) == 9
+    assert index.contains(str(changed))
+
+
+def test_the_throttle_paces_files(monkeypatch):
+    now, slept = [100.0], []
+    monkeypatch.setattr(scanner.time, "monotonic", lambda: now[0])
+    monkeypatch.setattr(scanner.time, "sleep", slept.append)
+    throttle = Throttle(files_per_second=10)
+
+    for _ in range(3):
+        throttle.acquire(5, 0)
+
+    assert slept == [0.5, 1.0]
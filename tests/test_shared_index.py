@@ -0,0 +1,43 @@
+from __future__ import annotations
+
+import threading
+
+from protection.provenance import ProvenanceIndex
+from protection.shared_index import SharedProvenance, TablePublisher
+
+
+def test_lookups_survive_tables_being_replaced(tmp_path):
+    root = tmp_path / "root"
+    root.mkdir()
+    for i in range(50):
+        (root / f"file{i}.txt").write_text("x" * (i + 1))
+    index = ProvenanceIndex(str(root))
+    index.build()
+    publisher = TablePublisher(index, lambda name: None, interval=0.0)
+    publisher.start()
+    shard = SharedProvenance(publisher.name, lambda message: None)
+    errors = []
+    stopped = threading.Event()
+
+    def look_up() -> None:
+        while not stopped.is_set():
+            try:
+                assert shard.contains(str(root / "file20.txt"))
+            except Exception as e:
+                errors.append(e)
+                return
+
+    threads = [threading.Thread(target=look_up) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    try:
+        for _ in range(100):
+            shard.attach(publisher.publish(force=True))
+    finally:
+        stopped.set()
+        for thread in threads:
+            thread.join()
+        shard.close()
+        publisher.stop()
+
+    assert errors == []
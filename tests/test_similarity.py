@@ -0,0 +1,65 @@
+from __future__ import annotations
+
+import pickle
+import random
+
+import pytest
+
+from protection.similarity import SimilarityIndex, Sketcher
+
+
+def _write(tmp_path, name: str, data: bytes) -> str:
+    path = tmp_path / name
+    path.write_bytes(data)
+    return str(path)
+
+
+def _edited(data: bytes, edits: int, seed: int) -> bytes:
+    """Overwrite a few scattered bytes, as a light edit of a document would."""
+    rng = random.Random(seed)
+    edited = bytearray(data)
+    for _ in range(edits):
+        edited[rng.randrange(len(edited))] ^= 0xFF
+    return bytes(edited)
+
+
+def test_lightly_edited_copies_match_and_unrelated_files_do_not(tmp_path):
+    original = random.Random(1).randbytes(400 * 1024)
+    index = SimilarityIndex(threshold=0.5)
+    index.add("/root/design.bin", index.sketcher.sketch(_write(tmp_path, "design.bin", original)))
+    index.add("/root/other.bin", index.sketcher.sketch(
+        _write(tmp_path, "other.bin", random.Random(2).randbytes(400 * 1024))))
+
+    match = index.match(_write(tmp_path, "copy.bin", _edited(original, 5, seed=3)))
+    assert match is not None and match[0] == "/root/design.bin" and match[1] >= 0.5
+    assert index.match(_write(tmp_path, "new.bin", random.Random(4).randbytes(400 * 1024))) is None
+
+
+def test_small_files_are_not_sketched(tmp_path):
+    sketcher = Sketcher(min_size=4096)
+
+    assert sketcher.sketch(_write(tmp_path, "small.txt", b"x" * 100)) is None
+
+
+def test_moved_and_discarded_sketches_are_found_under_their_new_path_only(tmp_path):
+    index = SimilarityIndex()
+    sketch = index.sketcher.sketch(_write(tmp_path, "a.bin", random.Random(5).randbytes(64 * 1024)))
+    index.add("/root/a.bin", sketch)
+
+    index.move("/root/a.bin", "/root/b.bin")
+    assert index.query(sketch) == ("/root/b.bin", 1.0)
+
+    index.discard("/root/b.bin")
+    assert index.query(sketch) is None and len(index) == 0
+
+
+def test_a_sketcher_survives_pickling_for_pool_workers(tmp_path):
+    sketcher = Sketcher()
+    path = _write(tmp_path, "a.bin", random.Random(6).randbytes(64 * 1024))
+
+    assert pickle.loads(pickle.dumps(sketcher)).sketch(path) == sketcher.sketch(path)
+
+
+def test_bands_must_divide_the_hashes():
+    with pytest.raises(ValueError):
+        SimilarityIndex(num_hashes=30, bands=8)
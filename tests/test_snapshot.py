@@ -0,0 +1,100 @@
+from __future__ import annotations
+
+from protection.provenance import ProvenanceIndex
+from protection.similarity import SimilarityIndex
+from protection.snapshot import SnapshotWriter, load_snapshot, save_snapshot, warm_start
+
+
+def _root(tmp_path):
+    root = tmp_path / "root"
+    root.mkdir()
+    for i in range(20):
+        (root / f"file{i}.bin").write_bytes(bytes([i]) * (70 * 1024 + i))
+    return root
+
+
+def test_a_snapshot_restores_the_index_and_pending_paths(tmp_path):
+    root = _root(tmp_path)
+    index = ProvenanceIndex(str(root), similarity=SimilarityIndex())
+    index.build()
+    path = str(tmp_path / "index.snapshot")
+
+    assert save_snapshot(index, path, ["/outside/pasting.bin"]) == 20
+    restored = ProvenanceIndex(str(root), similarity=SimilarityIndex())
+
+    assert load_snapshot(restored, path) == ["/outside/pasting.bin"]
+    assert sorted(restored.entries()) == sorted(index.entries())
+    assert not (tmp_path / "index.snapshot.tmp").exists()
+
+
+def test_a_snapshot_of_other_roots_is_ignored(tmp_path):
+    root = _root(tmp_path)
+    index = ProvenanceIndex(str(root))
+    index.build()
+    path = str(tmp_path / "index.snapshot")
+    save_snapshot(index, path)
+
+    other = ProvenanceIndex(str(tmp_path / "other"))
+
+    assert load_snapshot(other, path) is None
+    assert len(other) == 0
+
+
+def test_a_truncated_snapshot_leaves_the_index_empty(tmp_path):
+    root = _root(tmp_path)
+    index = ProvenanceIndex(str(root))
+    index.build()
+    path = tmp_path / "index.snapshot"
+    save_snapshot(index, str(path))
+    path.write_bytes(path.read_bytes()[:-200])
+
+    restored = ProvenanceIndex(str(root))
+
+    assert load_snapshot(restored, str(path)) is None
+    assert len(restored) == 0
+
+
+def _warm_start(root, path, pending=tuple):
+    index = ProvenanceIndex(str(root))
+    restored, services = warm_start(index, str(path), interval=60, pending=pending,
+                                    use_processes=False)
+    scan, writer = services
+    return index, restored, scan, writer
+
+
+def test_a_warm_start_reads_only_files_changed_since_the_snapshot(tmp_path):
+    root = _root(tmp_path)
+    path = tmp_path / "index.snapshot"
+    index, restored, scan, writer = _warm_start(root, path, lambda: ["/outside/pasting.bin"])
+    assert restored == [] and scan.wait(10).fingerprinted == 20
+    writer.stop()
+
+    (root / "file0.bin").write_bytes(b"changed while stopped")
+    (root / "file1.bin").unlink()
+    index, restored, scan, writer = _warm_start(root, path)
+    assert restored == ["/outside/pasting.bin"]
+    assert len(index) == 20  # usable before the reconcile pass ends
+    result = scan.wait(10)
+    writer.stop()
+
+    assert (result.fingerprinted, result.unchanged, result.dropped) == (1, 18, 1)
+    assert len(index) == 19 and index.contains(str(root / "file0.bin"))
+
+
+def test_the_writer_only_saves_when_the_index_changed(tmp_path):
+    root = _root(tmp_path)
+    index = ProvenanceIndex(str(root))
+    index.build()
+    path = tmp_path / "index.snapshot"
+    writer = SnapshotWriter(index, str(path))
+    writer.write()
+    saved = path.stat().st_mtime_ns
+
+    writer.write()
+    assert path.stat().st_mtime_ns == saved
+
+    index.remove(str(root / "file0.bin"))
+    writer.write()
+    restored = ProvenanceIndex(str(root))
+    load_snapshot(restored, str(path))
+    assert len(restored) == 19
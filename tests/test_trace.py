@@ -0,0 +1,95 @@
+from __future__ import annotations
+
+import os
+import gzip
+import json
+
+import pytest
+from watchdog.events import FileCreatedEvent
+
+from protection.engine import EngineConfig
+from protection.trace import (
+    REC_CLIPBOARD,
+    REC_EVENT,
+    TraceWriter,
+    main,
+    read_trace,
+    replay_config,
+    summarize,
+)
+
+SECRET = b"quarterly numbers\n" * 100
+
+
+def _record_paste(p) -> str:
+    """Paste a protected file outside the root while recording; return the pasted path."""
+    source = p.write(os.path.join(p.root, "report.txt"), SECRET)
+    p.start()
+    p.backend.clipboard_backend.set_files([source])
+    pasted = p.write(os.path.join(p.outside, "report.txt"), SECRET)
+    p.backend.emit(FileCreatedEvent(pasted))
+    p.settle()
+    p.stop()
+    return pasted
+
+
+def test_a_recorded_paste_holds_the_event_and_the_clipboard(protected, tmp_path):
+    trace = str(tmp_path / "session.trace.gz")
+    p = protected(trace_path=trace)
+    pasted = _record_paste(p)
+
+    header, records = read_trace(trace)
+    records = list(records)
+    assert header["config"]["roots"] == [p.root]
+    assert [REC_EVENT, "created", pasted, "", False] in [record[1:] for record in records]
+    assert any(record[1] == REC_CLIPBOARD and record[3] == [os.path.join(p.root, "report.txt")]
+               for record in records)
+    assert summarize(trace)["inputs"] == {"event:created": 1}
+
+
+def test_replay_reports_the_paste_without_touching_it(protected, tmp_path):
+    trace = str(tmp_path / "session.trace.gz")
+    p = protected(trace_path=trace)
+    pasted = _record_paste(p)
+    assert not os.path.exists(pasted)
+    p.write(pasted, SECRET)
+    audit = str(tmp_path / "replay.jsonl")
+
+    main(["replay", trace, "--speed", "0", "--audit-log", audit])
+
+    assert os.path.exists(pasted)
+    with open(audit) as handle:
+        entries = [json.loads(line) for line in handle]
+    assert ("would_quarantine", pasted) in [(entry["action"], entry["path"]) for entry in entries]
+    assert not any(entry["action"] in ("quarantine", "delete") for entry in entries)
+
+
+def test_a_trace_cut_short_ends_at_the_last_complete_record(tmp_path):
+    trace = str(tmp_path / "cut.trace.gz")
+    with gzip.open(trace, "wt", encoding="utf-8") as handle:
+        handle.write(json.dumps({"trace": 1, "config": {}}) + "\n")
+        handle.write('[0.1,"trigger","clipboard"]\n[0.2,"trig')
+
+    _header, records = read_trace(trace)
+    assert list(records) == [[0.1, "trigger", "clipboard"]]
+
+    (tmp_path / "plain.txt").write_text("not a trace")
+    with pytest.raises(ValueError):
+        read_trace(str(tmp_path / "plain.txt"))
+
+
+def test_records_past_a_full_buffer_are_dropped(tmp_path):
+    writer = TraceWriter(str(tmp_path / "full.trace.gz"), {"trace": 1}, buffer_size=2)
+    for _ in range(3):
+        writer.add(REC_EVENT, "created", "/a", "", False)
+
+    assert writer.dropped == 1
+
+
+def test_replay_settings_are_a_dry_run_scaled_by_speed():
+    recorded = EngineConfig(roots=(os.path.abspath("root"),), dedup_ttl=4.0, workers=8)._asdict()
+
+    config = replay_config(json.loads(json.dumps({"config": recorded})), speed=2.0)
+
+    assert config.dry_run and config.workers == 0 and config.trace_path == ""
+    assert config.dedup_ttl == 2.0
@@ -0,0 +1,69 @@
+from __future__ import annotations
+
+import os
+
+from watchdog.events import DirMovedEvent, FileMovedEvent
+
+from protection.tree_moves import MoveBatcher, restore_move
+
+SRC = os.path.abspath(os.path.join(os.sep, "data", "root", "project"))
+DEST = os.path.abspath(os.path.join(os.sep, "data", "outside", "project"))
+
+
+def test_child_moves_of_a_claimed_tree_are_covered_both_ways():
+    batcher = MoveBatcher(ttl=10.0)
+    batcher.claim(SRC, DEST)
+
+    assert batcher.covers(os.path.join(SRC, "a", "b.txt"), os.path.join(DEST, "a", "b.txt"))
+    assert batcher.covers(os.path.join(DEST, "b.txt"), os.path.join(SRC, "b.txt"))
+    assert not batcher.covers(os.path.join(SRC, "b.txt"), os.path.join(DEST, "c.txt"))
+    assert not batcher.covers(SRC + "2", DEST + "2")
+
+    batcher.release(DEST)
+    assert len(batcher) == 0
+
+
+def test_a_claim_expires_unless_its_events_keep_coming():
+    now = [0.0]
+    batcher = MoveBatcher(ttl=10.0, clock=lambda: now[0])
+    batcher.claim(SRC, DEST)
+    child = (os.path.join(SRC, "b.txt"), os.path.join(DEST, "b.txt"))
+
+    now[0] = 8.0
+    assert batcher.covers(*child)
+    now[0] = 16.0
+    assert batcher.covers(*child)
+    now[0] = 30.0
+    assert not batcher.covers(*child)
+    assert len(batcher) == 0
+
+
+def test_a_move_is_not_restored_over_a_reused_path(tmp_path):
+    src, dest = tmp_path / "src.txt", tmp_path / "dest.txt"
+    dest.write_text("moved")
+
+    assert restore_move(str(src), str(dest))
+    assert src.read_text() == "moved" and not dest.exists()
+
+    dest.write_text("moved again")
+    assert not restore_move(str(src), str(dest))
+    assert dest.exists()
+
+
+def test_a_folder_moved_out_of_the_root_comes_back_whole(protected):
+    p = protected().start()
+    inside = os.path.join(p.root, "project")
+    for name in ("a.txt", os.path.join("sub", "b.txt")):
+        p.write(os.path.join(inside, name), b"contents\n")
+    moved = os.path.join(p.outside, "project")
+    os.rename(inside, moved)
+
+    p.backend.emit(DirMovedEvent(inside, moved))
+    p.backend.emit(FileMovedEvent(os.path.join(inside, "a.txt"), os.path.join(moved, "a.txt")))
+    p.backend.emit(FileMovedEvent(os.path.join(inside, "sub", "b.txt"), os.path.join(moved, "sub", "b.txt")))
+
+    p.stop()
+
+    assert os.path.exists(os.path.join(inside, "sub", "b.txt"))
+    assert not os.path.exists(moved)
+    assert [entry["action"] for entry in p.audit()] == ["restore"]
@@ -0,0 +1,90 @@
+from __future__ import annotations
+
+import os
+import threading
+import time
+
+from protection.engine import TRIGGERS_HOOKS, TRIGGERS_POLLING
+from protection.triggers import TRIGGER_COPY, AdaptiveInterval, TriggerDispatcher
+
+SECRET = b"quarterly numbers\n" * 100
+
+
+def _eventually(condition, timeout: float = 5.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def test_polling_backs_off_while_idle_and_snaps_back():
+    interval = AdaptiveInterval(0.1, 1.0)
+
+    assert [interval.next(False) for _ in range(5)] == [0.2, 0.4, 0.8, 1.0, 1.0]
+    assert interval.next(True) == 0.1
+
+
+def test_triggers_run_in_order_on_one_thread_despite_errors():
+    dispatcher = TriggerDispatcher()
+    seen = []
+
+    def fail() -> None:
+        raise RuntimeError("boom")
+
+    dispatcher.on("a", fail)
+    dispatcher.on("a", lambda: seen.append(("a", threading.current_thread().name)))
+    dispatcher.on("b", lambda: seen.append(("b", threading.current_thread().name)))
+    dispatcher.start()
+    for name in ("a", "b", "a"):
+        dispatcher.dispatch(name)
+    dispatcher.stop()
+    dispatcher._thread.join(5)
+
+    assert seen == [("a", "triggers"), ("b", "triggers"), ("a", "triggers")]
+
+
+def _on_clipboard(p) -> None:
+    source = p.write(os.path.join(p.root, "report.txt"), SECRET)
+    p.backend.clipboard_backend.set_files([source])
+
+
+def _cleared(p) -> bool:
+    return p.backend.clipboard_backend.read()[0] is None
+
+
+def test_a_clipboard_notification_clears_protected_files(protected):
+    p = protected(trigger_mode=TRIGGERS_HOOKS).start()
+    p.backend.foreground_backend.title = "notepad"
+    _on_clipboard(p)
+
+    [listener] = p.backend.listeners
+    listener.notify()
+
+    assert _eventually(lambda: _cleared(p))
+
+
+def test_a_copy_hotkey_in_a_safe_window_keeps_the_clipboard(protected):
+    p = protected(trigger_mode=TRIGGERS_HOOKS).start()
+    p.backend.foreground_backend.title = "Root Directory - File Explorer"
+    _on_clipboard(p)
+
+    checked = threading.Event()
+    p.engine._dispatcher.on("checked", checked.set)
+
+    [hotkeys] = p.backend.hotkey_triggers
+    hotkeys.press(TRIGGER_COPY)
+    p.engine._dispatcher.dispatch("checked")  # runs after the copy trigger
+
+    assert checked.wait(5)
+    assert not _cleared(p)
+
+
+def test_polling_clears_protected_files(protected):
+    p = protected(trigger_mode=TRIGGERS_POLLING, clipboard_check_interval=0.01,
+                  clipboard_max_interval=0.05).start()
+    p.backend.foreground_backend.title = "notepad"
+    _on_clipboard(p)
+
+    assert _eventually(lambda: _cleared(p))
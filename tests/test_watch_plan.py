@@ -0,0 +1,53 @@
+from __future__ import annotations
+
+import os
+import threading
+
+from protection.policy import PathPolicy
+from protection.watch_plan import EventFilter, WatchPlanner
+
+SYSTEM = os.path.abspath(os.path.join(os.sep, "sys-tmp"))
+ROOT = os.path.abspath(os.path.join(os.sep, "data", "root"))
+
+
+def test_system_paths_are_dropped():
+    event_filter = EventFilter(PathPolicy([ROOT]), system_paths=[SYSTEM])
+
+    assert not event_filter.accepts(os.path.join(SYSTEM, "a.txt"))
+    assert event_filter.accepts(os.path.join(ROOT, "a.txt"))
+
+
+def test_a_destination_inside_a_system_path_is_accepted():
+    drop = os.path.join(SYSTEM, "drop")
+    event_filter = EventFilter(PathPolicy([ROOT]), system_paths=[SYSTEM], destinations=[drop])
+
+    assert event_filter.accepts(os.path.join(drop, "a.txt"))
+    assert not event_filter.accepts(os.path.join(SYSTEM, "a.txt"))
+
+    event_filter.set_destinations([SYSTEM])
+    assert event_filter.accepts(os.path.join(SYSTEM, "a.txt"))
+
+
+def test_the_estimate_is_only_walked_on_request(tmp_path):
+    for name in ("a", "a/b", "c"):
+        (tmp_path / name).mkdir()
+    planner = WatchPlanner([str(tmp_path)], event_filter=None)
+
+    plan = planner.plan(estimate=False)
+    assert [watch.path for watch in plan.watches] == [str(tmp_path)]
+    assert plan.watch_count == 0
+
+    stopped = threading.Event()
+    stopped.set()
+    assert planner.estimate(plan, stopped).watch_count == 0
+    assert planner.estimate(plan).watch_count == 4
+
+
+def test_pastes_under_any_name_or_folder_are_accepted():
+    event_filter = EventFilter(PathPolicy([ROOT]), system_paths=[SYSTEM])
+    outside = os.path.abspath(os.path.join(os.sep, "data", "outside"))
+
+    for path in ("report.tmp", "report.log", os.path.join("node_modules", "report.txt"),
+                 os.path.join(".git", "report.txt"), os.path.join("cache", "report.txt")):
+        assert event_filter.accepts(os.path.join(outside, path))
+    assert not event_filter.accepts(os.path.join(outside, "$recycle.bin", "report.txt"))